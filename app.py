@@ -1,87 +1,491 @@
-from flask import Flask, request, jsonify, render_template, send_file
+from flask import Flask, Response, g, request, jsonify, render_template, send_file, stream_with_context
 import os
+import re
 import json
-from threading import Lock
+import time
+import tempfile
+import uuid
+import queue
+from contextlib import contextmanager
+from threading import Event, Lock, Thread
 
+try:
+    import fcntl
+except ImportError:  # no flock; without fork there is only one worker, and TranscribeSession.lock suffices
+    fcntl = None
+
+import artifacts
 import generate
+import metrics
+from scheduler import BatchScheduler
+from store import ConversationStore
+from kvcache import SessionKVCache
+from prefork import memory_usage
+from prompting import BuiltPrompt, prompt_builder_for
+from workers import DEADLINE_GRACE, InferencePool, Overloaded, set_torch_threads, torch_threads_for
 
 app = Flask(__name__)
 
-# Simple in-memory state with file-backed persistence
+# Loaded pipelines are shared across requests; size the registry from the env
+generate.registry.max_entries = int(os.environ.get("PIPELINE_CACHE_SIZE", "2"))
+generate.registry.max_bytes = int(float(os.environ.get("PIPELINE_CACHE_MB", "0")) * 1024 * 1024)
+
+# Optional warm-up list, e.g. PIPELINE_WARMUP="distilgpt2@cpu,gpt2@cpu", loaded
+# in the background (see /readyz); VOSK_WARMUP=1 loads the VOSK model too
+WARMUP_SPECS = generate.parse_warmup_spec(os.environ.get("PIPELINE_WARMUP", ""))
+VOSK_WARMUP = os.environ.get("VOSK_WARMUP", "").lower() in ("1", "true", "yes")
+
+# Conversation history lives in an append-only, per-session SQLite store,
+# opened by get_store() on first use so importing the app creates no files
+# or threads. A legacy chat_state.json is imported into "default" then.
 STATE_FILE = "chat_state.json"
-state_lock = Lock()
-if os.path.exists(STATE_FILE):
-    try:
-        with open(STATE_FILE, "r", encoding="utf-8") as f:
-            state = json.load(f)
-    except Exception:
-        state = {"history": []}
-else:
-    state = {"history": []}
+CHAT_DB = os.environ.get("CHAT_DB", "chat_state.db")
+store = None
+_store_lock = Lock()
 
 
-def save_state():
-    with state_lock:
-        with open(STATE_FILE, "w", encoding="utf-8") as f:
-            json.dump(state, f, ensure_ascii=False, indent=2)
+def get_store():
+    """The conversation store, opened with its compactor started on first call."""
+    global store
+    with _store_lock:
+        if store is None:
+            s = ConversationStore(CHAT_DB, max_turns=int(os.environ.get("CHAT_MAX_TURNS", "1000")))
+            s.migrate_json(STATE_FILE, session="default")
+            s.start_compactor(interval=float(os.environ.get("CHAT_COMPACT_INTERVAL", "300")))
+            store = s
+        return store
 
 
-@app.route("/")
-def index():
-    return render_template("index.html")
+# Per-session KV caches let each turn prefill only its new tokens.
+# KV_CACHE_MB=0 disables reuse.
+KV_CACHE_MB = float(os.environ.get("KV_CACHE_MB", "256"))
+kv_cache = SessionKVCache(max_bytes=int(KV_CACHE_MB * 1024 * 1024)) if KV_CACHE_MB > 0 else None
 
 
-@app.route("/api/chat", methods=["POST"])
-def chat():
-    data = request.json or {}
-    user = data.get("message", "")
-    model = data.get("model", "distilgpt2")
-    device = data.get("device", "cpu")
-    dry = data.get("dry_run", True)
+# Deterministic generations are answered from a content-addressed cache.
+# RESPONSE_CACHE_SIZE=0 disables it; RESPONSE_CACHE_DIR adds an on-disk tier.
+RESPONSE_CACHE_SIZE = int(os.environ.get("RESPONSE_CACHE_SIZE", "256"))
+response_cache = generate.ResponseCache(
+    max_entries=RESPONSE_CACHE_SIZE,
+    directory=os.environ.get("RESPONSE_CACHE_DIR") or None,
+    max_disk_bytes=int(float(os.environ.get("RESPONSE_CACHE_MB", "64")) * 1024 * 1024),
+) if RESPONSE_CACHE_SIZE > 0 else None
 
-    if not user:
-        return jsonify({"error": "no message"}), 400
 
-    # Append to history
-    with state_lock:
-        state.setdefault("history", []).append({"role": "user", "text": user})
+# Inference runs on bounded pools instead of request threads. Each admits
+# WORKERS + QUEUE requests; beyond that requests get 503 with Retry-After.
+# REQUEST_TIMEOUT caps how long a request may take (a JSON "timeout" field
+# can shorten it); generation still running at the deadline is stopped.
+GENERATE_WORKERS = int(os.environ.get("GENERATE_WORKERS", "1"))
+TRANSCRIBE_WORKERS = int(os.environ.get("TRANSCRIBE_WORKERS", "1"))
+generation_pool = InferencePool("generate", GENERATE_WORKERS, int(os.environ.get("GENERATE_QUEUE", "8")))
+transcribe_pool = InferencePool("transcribe", TRANSCRIBE_WORKERS, int(os.environ.get("TRANSCRIBE_QUEUE", "4")))
+REQUEST_TIMEOUT = float(os.environ.get("REQUEST_TIMEOUT", "120"))
+# torch threads per generation worker, leaving a core per transcription worker;
+# TORCH_THREADS overrides (0 keeps torch's default)
+set_torch_threads(int(os.environ.get("TORCH_THREADS", torch_threads_for(GENERATE_WORKERS, reserved=TRANSCRIBE_WORKERS))))
+# ONNX Runtime sessions (backend "onnx") split the cores the same way unless ONNX_THREADS is set
+generate.ONNX_THREADS = generate.ONNX_THREADS or torch_threads_for(GENERATE_WORKERS, reserved=TRANSCRIBE_WORKERS)
+
+# Concurrent /api/chat requests with matching parameters are decoded together.
+# Batches run on the generation pool's workers. BATCH_MAX_SIZE=1 disables batching.
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", "4"))
+BATCH_WAIT_MS = float(os.environ.get("BATCH_WAIT_MS", "10"))
+batcher = BatchScheduler(max_batch_size=BATCH_MAX_SIZE, max_wait=BATCH_WAIT_MS / 1000.0, pool=generation_pool) if BATCH_MAX_SIZE > 1 else None
+
+
+def request_deadline(data):
+    """``time.monotonic()`` deadline for a request: its ``timeout`` field, capped at REQUEST_TIMEOUT."""
+    timeout = REQUEST_TIMEOUT
+    if data and data.get("timeout") is not None:
+        timeout = min(timeout, max(0.0, float(data["timeout"])))
+    return time.monotonic() + timeout
+
+
+@app.errorhandler(Overloaded)
+def overloaded(e):
+    res = jsonify({"error": str(e), "retry_after": e.retry_after})
+    res.status_code = 503
+    res.headers["Retry-After"] = str(e.retry_after)
+    return res
+
+
+@app.errorhandler(generate.DeadlineExceeded)
+def deadline_exceeded(e):
+    return jsonify({"error": str(e) or "deadline exceeded"}), 504
 
-    # Build pipeline (reuse simple configuration)
-    p, dev = generate.init_pipeline(model=model, device_opt=device, dry_run=dry)
 
-    # Build prompt by including last few turns
-    history = state.get("history", [])
-    last_turns = []
+# Per-stage timings are always recorded for /metrics; SERVER_TIMING=1 also
+# returns each request's breakdown in a Server-Timing response header.
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "").lower() in ("1", "true", "yes")
+
+
+@app.before_request
+def start_timings():
+    g.started = time.perf_counter()
+    g.timings = metrics.begin()
+
+
+@app.after_request
+def record_timings(response):
+    started = getattr(g, "started", None)
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    metrics.REQUEST_SECONDS.observe(elapsed, endpoint=request.endpoint or "unknown", status=response.status_code)
+    if SERVER_TIMING:
+        stages = g.timings.server_timing()
+        response.headers["Server-Timing"] = (stages + ", " if stages else "") + f"total;dur={elapsed * 1000:.1f}"
+    return response
+
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Stage histograms and counters in Prometheus text format."""
+    return Response(metrics.registry.render(), mimetype="text/plain; version=0.0.4")
+
+
+def session_id(data):
+    """Conversation key for a request: JSON ``session`` field, else ``"default"``."""
+    return str(data.get("session") or "default")
+
+
+@app.route("/")
+def index():
+    return render_template("index.html")
+
+
+def build_prompt(history):
+    """Build the model prompt from the last few turns of ``history``."""
     # include up to last 6 messages
-    for msg in history[-6:]:
-        prefix = "User: " if msg["role"] == "user" else "AI: "
-        last_turns.append(prefix + msg["text"])
+    return generate.build_chat_prompt(history[-6:])
 
-    prompt = "\n".join(last_turns) + "\nAI:"
 
-    out = generate.generate_text(
-        p,
-        prompt,
+def generation_kwargs(data):
+    """Extract generation parameters from a chat request body."""
+    return dict(
         max_new_tokens=int(data.get("max_new_tokens", 120)),
         do_sample=not data.get("no_sample", False),
         temperature=float(data.get("temperature", 0.8)),
         top_k=int(data.get("top_k", 0)),
         top_p=float(data.get("top_p", 0.92)),
         repetition_penalty=float(data.get("repetition_penalty", 1.15)),
-        num_return_sequences=int(data.get("num_return_sequences", 1)),
+        stop=stop_sequences(data),
+        seed=int(data["seed"]) if data.get("seed") is not None else None,
+    )
+
+
+def stop_sequences(data):
+    """Stop sequences for a chat request: ``stop`` (string or list), else the chat defaults; ``[]`` disables."""
+    stop = data.get("stop")
+    if stop is None:
+        return generate.CHAT_STOP_SEQUENCES
+    if isinstance(stop, str):
+        return (stop,)
+    return tuple(str(s) for s in stop)
+
+
+# Messages fetched per turn; the prompt builder keeps as many as fit the
+# model's context after reserving room for max_new_tokens.
+HISTORY_MESSAGES = int(os.environ.get("CHAT_HISTORY_MESSAGES", "64"))
+
+
+def invalid_options(data):
+    """A 400 response when the request names an unknown ``precision`` or ``backend``, else None."""
+    precision = data.get("precision")
+    if precision and str(precision).lower() not in generate.PRECISIONS:
+        return jsonify({"error": "unknown precision", "precision": precision, "choices": sorted(generate.PRECISIONS)}), 400
+    backend = data.get("backend")
+    if backend and backend not in generate.BACKENDS:
+        return jsonify({"error": "unknown backend", "backend": backend, "choices": list(generate.BACKENDS)}), 400
+    return None
+
+
+def begin_turn(data):
+    """Record the user's message and return ``(pipeline, prompt, session)`` for the reply.
+
+    ``prompt`` is a ``prompting.BuiltPrompt``; its ``ids`` are None for
+    pipelines without a tokenizer (dry-run).
+    """
+    user = data.get("message", "")
+    model = data.get("model", "distilgpt2")
+    device = data.get("device", "cpu")
+    dry = data.get("dry_run", True)
+    session = session_id(data)
+
+    # Append to history
+    with metrics.stage("persist"):
+        get_store().append(session, "user", user)
+
+    # Fetch the shared pipeline (loaded once per model/device/precision/backend/draft)
+    p, dev = generate.get_pipeline(
+        model=model, device_opt=device, dry_run=dry, dtype=data.get("precision"), backend=data.get("backend"), draft_model=data.get("draft_model")
     )
 
+    # Build prompt from as many recent turns as fit the token budget
+    builder = prompt_builder_for(p)
+    if builder is None:
+        history = get_store().last(session, 6)
+        return p, BuiltPrompt(None, build_prompt(history), len(history)), session
+    turns = get_store().last(session, HISTORY_MESSAGES)
+    with metrics.stage("tokenize"):
+        prompt = builder.build(turns, max_new_tokens=int(data.get("max_new_tokens", 120)), session=session)
+    return p, prompt, session
+
+
+def use_kv_cache(p, data):
+    """Whether to decode this reply with the session KV cache rather than the batcher.
+
+    Reuse saves prefill for one session, batching saves decode steps across
+    several, and a request cannot have both. So the cache is used only while
+    this is the sole generation request in flight; under concurrency requests
+    go to the batcher, and the session's next quiet turn reuses only the
+    prefix cached before that.
+    """
+    if kv_cache is None or int(data.get("num_return_sequences", 1)) != 1 or not SessionKVCache.supports(p):
+        return False
+    return batcher is None or generation_pool.in_flight <= 1
+
+
+def finish_turn(session, text):
+    """Append the assistant reply to the session's history."""
+    with metrics.stage("persist"):
+        get_store().append(session, "assistant", text.strip())
+
+
+def dispatch_generation(p, prompt, session, data, kwargs, deadline):
+    """Generate a reply on the path that suits the request: session KV cache, batcher or a pool worker."""
+    if use_kv_cache(p, data) and prompt.ids is not None:
+        kv_kwargs = dict(kwargs)
+        kv_kwargs.pop("num_return_sequences")
+        with metrics.stage("generate"):
+            return generation_pool.wait(generation_pool.submit(kv_cache.generate, p, session, prompt.text, input_ids=prompt.ids, deadline=deadline, **kv_kwargs), deadline)
+    if batcher is not None and getattr(p, "draft_model", None) is None and kwargs.get("seed") is None:
+        # the batch scheduler is its own executor; only the total shows up here.
+        # Assisted decoding runs one sequence at a time, so draft pipelines skip it,
+        # and a seeded reply must not depend on which prompts it was padded with.
+        with metrics.stage("generate"):
+            return generation_pool.wait(batcher.submit(p, prompt.text, input_ids=prompt.ids, deadline=deadline, **kwargs), deadline)
+    with metrics.stage("generate"):
+        return generation_pool.wait(generation_pool.submit(generate.generate_text, p, prompt.text, input_ids=prompt.ids, deadline=deadline, **kwargs), deadline)
+
+
+@app.route("/api/chat", methods=["POST"])
+def chat():
+    data = request.json or {}
+    if not data.get("message", ""):
+        return jsonify({"error": "no message"}), 400
+    error = invalid_options(data)
+    if error is not None:
+        return error
+
+    deadline = request_deadline(data)
+    with generation_pool.admission():
+        p, prompt, session = begin_turn(data)
+
+        kwargs = generation_kwargs(data)
+        kwargs["num_return_sequences"] = int(data.get("num_return_sequences", 1))
+
+        # deterministic requests (greedy, or a pinned seed) may already be cached
+        key = response_cache.key_for(p, prompt.text, kwargs) if response_cache is not None else None
+        out = response_cache.get(key) if key is not None else None
+        if out is None:
+            out = dispatch_generation(p, prompt, session, data, kwargs, deadline)
+            if key is not None:
+                response_cache.put(key, out)
+
+        try:
+            text = out[0].get("generated_text") if isinstance(out[0], dict) else str(out[0])
+        except Exception:
+            text = str(out)
+
+        # Save assistant reply
+        finish_turn(session, text)
+
+    return jsonify({"reply": text.strip()})
+
+
+@app.route("/api/history", methods=["GET"])
+def history():
+    """Return the last ``n`` turns (default 50) of a session's conversation."""
+    session = request.args.get("session", "default")
+    n = min(int(request.args.get("n", 50)), 1000)
+    return jsonify({"session": session, "history": get_store().last(session, n)})
+
+
+def sse_event(payload, event=None):
+    """Format one Server-Sent Event carrying a JSON payload."""
+    head = f"event: {event}\n" if event else ""
+    return head + "data: " + json.dumps(payload, ensure_ascii=False) + "\n\n"
+
+
+@app.route("/api/chat/stream", methods=["POST"])
+def chat_stream():
+    """Like /api/chat but streams the reply as Server-Sent Events.
+
+    Each generated chunk is sent as ``data: {"token": ...}``; the stream ends
+    with an ``event: done`` carrying the full reply (or ``event: error``).
+    """
+    data = request.json or {}
+    if not data.get("message", ""):
+        return jsonify({"error": "no message"}), 400
+    error = invalid_options(data)
+    if error is not None:
+        return error
+
+    deadline = request_deadline(data)
+    # the slot is held until the stream ends, so it is released in events()
+    generation_pool.admit()
+    admitted = time.monotonic()
     try:
-        text = out[0].get("generated_text") if isinstance(out[0], dict) else str(out[0])
+        p, prompt, session = begin_turn(data)
+        kwargs = generation_kwargs(data)
+
+        # generate on a pool worker; chunks are handed to this response through a queue
+        chunks = queue.Queue()
+        # set when the response ends, so a client that disconnects stops the generation
+        cancel = Event()
+
+        def produce():
+            try:
+                for chunk in generate.stream_text(p, prompt.text, input_ids=prompt.ids, deadline=deadline, cancel=cancel, **kwargs):
+                    chunks.put(chunk)
+                chunks.put(None)
+            except Exception as e:
+                chunks.put(e)
+
+        generation_pool.submit(produce, deadline=deadline).add_done_callback(
+            lambda f: chunks.put(f.exception()) if f.exception() is not None else None
+        )
     except Exception:
-        text = str(out)
+        generation_pool.release()
+        raise
 
-    # Save assistant reply
-    with state_lock:
-        state.setdefault("history", []).append({"role": "assistant", "text": text.strip()})
-    save_state()
+    released = []
+
+    def close():
+        cancel.set()
+        if not released:
+            released.append(True)
+            generation_pool.release(time.monotonic() - admitted)
+
+    def events():
+        pieces = []
+        t0 = time.perf_counter()
+        try:
+            while True:
+                try:
+                    chunk = chunks.get(timeout=max(0.0, deadline - time.monotonic()) + DEADLINE_GRACE)
+                except queue.Empty:
+                    chunk = generate.DeadlineExceeded("deadline exceeded")
+                if chunk is None:
+                    break
+                if isinstance(chunk, Exception):
+                    yield sse_event({"error": str(chunk) or type(chunk).__name__}, event="error")
+                    return
+                pieces.append(chunk)
+                yield sse_event({"token": chunk})
+            metrics.observe_stage("generate", time.perf_counter() - t0)
+            text = "".join(pieces)
+            finish_turn(session, text)
+            yield sse_event({"reply": text.strip()}, event="done")
+        finally:
+            # also runs on GeneratorExit, when the client has disconnected
+            close()
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    response = Response(stream_with_context(events()), mimetype="text/event-stream", headers=headers)
+    # a response closed before its first chunk never enters events()
+    response.call_on_close(close)
+    return response
+
+
+@app.route("/api/pipelines", methods=["GET"])
+def pipelines():
+    """Report pipeline registry counters (loads, hits, evictions), cache/batching stats and process memory."""
+    stats = generate.registry.stats()
+    # under prefork.py, the worker that served this request
+    stats["process"] = memory_usage()
+    stats["pools"] = {"generate": generation_pool.stats(), "transcribe": transcribe_pool.stats()}
+    if batcher is not None:
+        stats["batching"] = batcher.stats()
+    if kv_cache is not None:
+        stats["kv_cache"] = kv_cache.stats()
+    if response_cache is not None:
+        stats["response_cache"] = response_cache.stats()
+    return jsonify(stats)
+
+
+# VOSK models are large; load each one once and share it across requests.
+# Recognizers are cheap and hold per-stream state, so each request gets its own.
+VOSK_CHUNK_FRAMES = int(os.environ.get("VOSK_CHUNK_FRAMES", "16000"))
+_vosk_models = {}
+_vosk_lock = Lock()
+
+
+def get_vosk_model(model_path):
+    """Return the shared ``vosk.Model`` for ``model_path``, loading it on first use."""
+    model = _vosk_models.get(model_path)
+    if model is not None:
+        return model
+    with _vosk_lock:
+        model = _vosk_models.get(model_path)
+        if model is None:
+            from vosk import Model
+
+            with metrics.stage("model_load"):
+                model = Model(model_path)
+            _vosk_models[model_path] = model
+    return model
+
+
+def recognize_wav(model, wav_bytes, chunk_frames=None, deadline=None, rate=None):
+    """Run ``wav_bytes`` (a complete WAV file) through a fresh recognizer, in memory.
+
+    The audio is first downmixed, resampled to ``rate`` (the model's, 16 kHz
+    by default) and trimmed of leading and trailing silence; see audio.py.
+    Returns ``(text, info)``, ``info`` being what ``audio.prepare`` reports.
+    Raises ``generate.DeadlineExceeded`` between chunks once ``deadline`` has passed.
+    """
+    from vosk import KaldiRecognizer
+    import audio
+
+    chunk_frames = chunk_frames or VOSK_CHUNK_FRAMES
+    rate = rate or audio.DEFAULT_RATE
+    t0 = time.perf_counter()
+    with metrics.stage("preprocess"):
+        pcm, info = audio.prepare(wav_bytes, rate)
+    rec = KaldiRecognizer(model, rate)
+    results = []
+    chunk_bytes = chunk_frames * 2
+    with metrics.stage("recognize"):
+        for i in range(0, len(pcm), chunk_bytes):
+            if deadline is not None and time.monotonic() >= deadline:
+                raise generate.DeadlineExceeded("transcription exceeded its deadline")
+            if rec.AcceptWaveform(pcm[i:i + chunk_bytes]):
+                res = json.loads(rec.Result())
+                results.append(res.get("text", ""))
+        res = json.loads(rec.FinalResult())
+        results.append(res.get("text", ""))
+    # the real-time factor is against what was uploaded, so trimming shows up in it
+    metrics.observe_transcription(info["input_seconds"], time.perf_counter() - t0, info["trimmed_seconds"])
+    return " ".join([r for r in results if r]), info
+
+
+def vosk_model_path():
+    """``VOSK_MODEL_PATH``: a model directory, or the name of a model installed by artifacts.py."""
+    return artifacts.resolve(os.environ.get("VOSK_MODEL_PATH", "models/vosk-model-small-en-us-0.15"))
+
+
+def audio_rate(model_path):
+    """Sample rate uploads are converted to: ``VOSK_SAMPLE_RATE``, else the model's own."""
+    import audio
+
+    return int(os.environ.get("VOSK_SAMPLE_RATE") or audio.model_sample_rate(model_path))
 
-    return jsonify({"reply": text.strip()})
+
+def model_missing(model_path):
+    return jsonify({"error": "VOSK model not found", "model_path": model_path, "hint": "Install a model with scripts/download_vosk_model.py and set VOSK_MODEL_PATH"}), 400
 
 
 @app.route("/api/transcribe", methods=["POST"])
@@ -91,9 +495,9 @@ def transcribe():
     Requires a VOSK model present at env VOSK_MODEL_PATH or ./models/vosk-model-small-en-us-0.15
     """
     # check model path
-    model_path = os.environ.get("VOSK_MODEL_PATH", "models/vosk-model-small-en-us-0.15")
+    model_path = vosk_model_path()
     if not os.path.exists(model_path):
-        return jsonify({"error": "VOSK model not found", "model_path": model_path, "hint": "Download a small model and set VOSK_MODEL_PATH"}), 400
+        return model_missing(model_path)
 
     # get audio bytes
     f = None
@@ -105,50 +509,314 @@ def transcribe():
     if not f:
         return jsonify({"error": "no audio provided"}), 400
 
+    deadline = request_deadline(request.args)
+
+    def work():
+        return recognize_wav(get_vosk_model(model_path), f, deadline=deadline, rate=audio_rate(model_path))
+
     try:
-        from vosk import Model, KaldiRecognizer
-        import wave
-        import json as _json
-
-        # write bytes to temp wav
-        import tempfile
-        tf = tempfile.NamedTemporaryFile(suffix=".wav", delete=False)
-        tf.write(f)
-        tf.flush()
-        tf.close()
-
-        wf = wave.open(tf.name, "rb")
-        if wf.getnchannels() != 1 or wf.getsampwidth() != 2:
-            # we expect mono 16-bit WAV; try to notify
-            # In many cases clients should provide compatible audio
+        transcript, info = transcribe_pool.run(work, deadline=deadline)
+        return jsonify({"text": transcript, "audio": info})
+    except (Overloaded, generate.DeadlineExceeded):
+        raise
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+# Streaming transcription: the client opens a session, POSTs raw 16-bit mono
+# PCM chunks while recording, and gets partial/final text back per chunk.
+# Under prefork.py any worker may get any chunk, so sessions are spooled to
+# STREAM_SPOOL_DIR: <id>.json holds the sample rate and <id>.pcm the audio so
+# far, locked with flock while a chunk is fed. Each worker keeps its own
+# recognizer per session and first feeds it the audio other workers appended.
+STREAM_SESSION_TTL = float(os.environ.get("TRANSCRIBE_SESSION_TTL", "60"))
+STREAM_SPOOL_DIR = os.environ.get("TRANSCRIBE_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "transcribe-sessions"))
+_SESSION_ID = re.compile(r"[0-9a-f]{32}\Z")
+_stream_sessions = {}
+_stream_lock = Lock()
+
+
+class TranscribeSession:
+    """This worker's recognizer for one streaming session.
+
+    ``offset`` is how much of the session's spooled audio it has heard.
+    """
+
+    def __init__(self, model, sample_rate):
+        from vosk import KaldiRecognizer
+
+        self.rec = KaldiRecognizer(model, sample_rate)
+        self.sample_rate = sample_rate
+        self.results = []
+        self.offset = 0
+        self.lock = Lock()
+        self.touched = time.monotonic()
+
+    def _accept(self, pcm):
+        if not self.rec.AcceptWaveform(pcm):
+            return None
+        text = json.loads(self.rec.Result()).get("text", "")
+        if text:
+            self.results.append(text)
+        return {"text": text}
+
+    def _catch_up(self, spool):
+        # audio appended by other workers, in the same pieces recognize_wav uses
+        spool.seek(self.offset)
+        missed = spool.read()
+        chunk_bytes = VOSK_CHUNK_FRAMES * 2
+        for i in range(0, len(missed), chunk_bytes):
+            self._accept(missed[i:i + chunk_bytes])
+        self.offset += len(missed)
+        return len(missed)
+
+    def feed(self, spool, pcm):
+        """Append a PCM chunk to ``spool`` (the session's locked audio file) and feed it.
+
+        Returns ``{"text": ...}`` at an utterance end, else ``{"partial": ...}``.
+        """
+        self.touched = time.monotonic()
+        t0 = time.perf_counter()
+        heard = self._catch_up(spool) + len(pcm)
+        spool.write(pcm)
+        spool.flush()
+        self.offset += len(pcm)
+        result = self._accept(pcm)
+        elapsed = time.perf_counter() - t0
+        metrics.observe_stage("recognize", elapsed)
+        metrics.observe_transcription(heard / 2.0 / self.sample_rate, elapsed)
+        if result is not None:
+            return result
+        return {"partial": json.loads(self.rec.PartialResult()).get("partial", "")}
+
+    def finish(self, spool):
+        self._catch_up(spool)
+        text = json.loads(self.rec.FinalResult()).get("text", "")
+        if text:
+            self.results.append(text)
+        return " ".join(self.results)
+
+
+def _spool_path(sid, ext):
+    return os.path.join(STREAM_SPOOL_DIR, sid + ext)
+
+
+def _remove_spool(sid):
+    # the .json goes first: a session exists while it does
+    for ext in (".json", ".pcm"):
+        try:
+            os.remove(_spool_path(sid, ext))
+        except FileNotFoundError:
             pass
 
-        model = Model(model_path)
-        rec = KaldiRecognizer(model, wf.getframerate())
-        results = []
-        while True:
-            data = wf.readframes(4000)
-            if len(data) == 0:
-                break
-            if rec.AcceptWaveform(data):
-                res = _json.loads(rec.Result())
-                results.append(res.get("text", ""))
-        # final
-        res = _json.loads(rec.FinalResult())
-        results.append(res.get("text", ""))
-        transcript = " ".join([r for r in results if r])
 
-        # cleanup
+@contextmanager
+def _spooled(sid):
+    """Open the session's spooled audio, locked against other workers; yield None if it is gone."""
+    try:
+        f = open(_spool_path(sid, ".pcm"), "r+b")
+    except FileNotFoundError:
+        yield None
+        return
+    with f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        # another worker may have ended the session while this one waited
+        yield f if os.path.exists(_spool_path(sid, ".json")) else None
+
+
+def _stream_session(sid):
+    """This worker's recognizer for ``sid``, made if another worker opened the session; None if there is none."""
+    with _stream_lock:
+        sess = _stream_sessions.get(sid)
+    if sess is not None or not _SESSION_ID.match(sid):
+        return sess
+    try:
+        with open(_spool_path(sid, ".json"), encoding="utf-8") as f:
+            sample_rate = json.load(f)["sample_rate"]
+    except (OSError, ValueError, KeyError):
+        return None
+    sess = TranscribeSession(get_vosk_model(vosk_model_path()), sample_rate)
+    with _stream_lock:
+        return _stream_sessions.setdefault(sid, sess)
+
+
+def _feed_stream(sid, sess, chunk):
+    with sess.lock, _spooled(sid) as spool:
+        return None if spool is None else sess.feed(spool, chunk)
+
+
+def _end_stream(sid, sess):
+    with sess.lock, _spooled(sid) as spool:
+        if spool is None:
+            return None
+        text = sess.finish(spool)
+        _remove_spool(sid)
+        return text
+
+
+def _expire_stream_sessions():
+    # run on every session request, so abandoned sessions go even when no new ones start
+    cutoff = time.monotonic() - STREAM_SESSION_TTL
+    with _stream_lock:
+        for sid in [sid for sid, sess in _stream_sessions.items() if sess.touched < cutoff]:
+            del _stream_sessions[sid]
+    # the spool is shared, so this also clears sessions abandoned on other workers
+    cutoff = time.time() - STREAM_SESSION_TTL
+    try:
+        entries = list(os.scandir(STREAM_SPOOL_DIR))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        sid, ext = os.path.splitext(entry.name)
+        if ext != ".pcm" or not _SESSION_ID.match(sid):
+            continue
         try:
-            os.unlink(tf.name)
-        except Exception:
+            if entry.stat().st_mtime < cutoff:
+                _remove_spool(sid)
+        except FileNotFoundError:
             pass
 
-        return jsonify({"text": transcript})
+
+@app.route("/api/transcribe/stream", methods=["POST"])
+def transcribe_stream_start():
+    """Open a streaming transcription session.
+
+    JSON body may set ``sample_rate`` (default 16000). Returns ``{"session": id}``.
+    """
+    model_path = vosk_model_path()
+    if not os.path.exists(model_path):
+        return model_missing(model_path)
+
+    data = request.get_json(silent=True) or {}
+    _expire_stream_sessions()
+    sid = uuid.uuid4().hex
+    try:
+        sess = TranscribeSession(get_vosk_model(model_path), int(data.get("sample_rate", 16000)))
+        os.makedirs(STREAM_SPOOL_DIR, exist_ok=True)
+        open(_spool_path(sid, ".pcm"), "wb").close()
+        with open(_spool_path(sid, ".json"), "w", encoding="utf-8") as f:
+            json.dump({"sample_rate": sess.sample_rate}, f)
     except Exception as e:
+        _remove_spool(sid)
         return jsonify({"error": str(e)}), 500
 
+    with _stream_lock:
+        _stream_sessions[sid] = sess
+    return jsonify({"session": sid, "sample_rate": sess.sample_rate})
+
+
+@app.route("/api/transcribe/stream/<sid>", methods=["POST"])
+def transcribe_stream_chunk(sid):
+    """Feed one chunk of raw int16 little-endian mono PCM to the session."""
+    _expire_stream_sessions()
+    chunk = request.get_data()
+    try:
+        sess = _stream_session(sid)
+        if sess is not None and not chunk:
+            return jsonify({"partial": ""})
+        result = None if sess is None else transcribe_pool.run(_feed_stream, sid, sess, chunk, deadline=request_deadline(request.args))
+    except (Overloaded, generate.DeadlineExceeded):
+        raise
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    if result is None:
+        with _stream_lock:
+            _stream_sessions.pop(sid, None)
+        return jsonify({"error": "unknown session"}), 404
+    return jsonify(result)
+
+
+@app.route("/api/transcribe/stream/<sid>/end", methods=["POST"])
+def transcribe_stream_end(sid):
+    """Flush the recognizer, close the session and return the full transcript."""
+    _expire_stream_sessions()
+    try:
+        sess = _stream_session(sid)
+        # the final decode is recognizer work like any chunk, so it goes through admission too
+        text = None if sess is None else transcribe_pool.run(_end_stream, sid, sess, deadline=request_deadline(request.args))
+    except (Overloaded, generate.DeadlineExceeded):
+        raise
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    with _stream_lock:
+        _stream_sessions.pop(sid, None)
+    if text is None:
+        return jsonify({"error": "unknown session"}), 404
+    return jsonify({"text": text})
+
+
+# Liveness and readiness. /healthz answers as soon as the app is imported.
+# /readyz answers 503 until the background warm-up has loaded everything
+# configured, so a load balancer or deploy script can hold traffic until the
+# first request no longer pays for model loading.
+_warmup = {"state": {}, "seconds": None}
+_warmup_lock = Lock()
+_started_at = time.monotonic()
+
+
+def _set_warmup(component, state):
+    with _warmup_lock:
+        _warmup["state"][component] = state
+
+
+def warm_up():
+    """Load the PIPELINE_WARMUP pipelines and, with VOSK_WARMUP, the VOSK model; record each one's state."""
+    t0 = time.perf_counter()
+    if WARMUP_SPECS:
+        failed = generate.registry.warm_up(WARMUP_SPECS, logger=app.logger)
+        _set_warmup("pipelines", "failed: " + ", ".join(spec[0] for spec in failed) if failed else "ready")
+    if VOSK_WARMUP:
+        model_path = vosk_model_path()
+        try:
+            get_vosk_model(model_path)
+            # the recognizer and audio normalization import these on first use
+            import audio  # noqa: F401
+            from vosk import KaldiRecognizer  # noqa: F401
+
+            _set_warmup("vosk", "ready")
+        except Exception as e:
+            app.logger.warning("VOSK warm-up failed for %s: %s", model_path, e)
+            _set_warmup("vosk", f"failed: {e}")
+    with _warmup_lock:
+        _warmup["seconds"] = round(time.perf_counter() - t0, 3)
+
+
+def start_warmup():
+    """Run ``warm_up`` on a background thread; returns the thread, or None when there is nothing to load."""
+    pending = {}
+    if WARMUP_SPECS:
+        pending["pipelines"] = "pending"
+    if VOSK_WARMUP:
+        pending["vosk"] = "pending"
+    with _warmup_lock:
+        _warmup["state"], _warmup["seconds"] = pending, None if pending else 0.0
+    if not pending:
+        return None
+    thread = Thread(target=warm_up, name="warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    """Liveness: the process is up and serving requests."""
+    return jsonify({"status": "ok", "uptime_s": round(time.monotonic() - _started_at, 3)})
+
+
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    """Readiness: 200 once every configured model has loaded, 503 while warming up or after a failure."""
+    with _warmup_lock:
+        state, seconds = dict(_warmup["state"]), _warmup["seconds"]
+    ready = all(s == "ready" for s in state.values())
+    return jsonify({"ready": ready, "components": state, "warmup_seconds": seconds}), 200 if ready else 503
+
+
+start_warmup()
+
 
 if __name__ == "__main__":
     # For local dev only
+    get_store()
     app.run(host="0.0.0.0", port=5000, debug=True)
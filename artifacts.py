@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""Install model archives: resumable downloads, checksums and atomic extraction.
+
+Models arrive as zip files of a few hundred MB over whatever network a Pi
+has, so ``install`` is built to survive a dropped connection or a
+half-finished run:
+
+- The archive downloads to ``<root>/.downloads/<file>.part``. If the
+  connection drops, it is resumed with an HTTP ``Range`` request, both
+  within the run (up to ``FETCH_RETRIES`` times) and on the next run. A
+  server that ignores ``Range`` is downloaded again from the start.
+- The SHA-256 is computed while the bytes stream in, and checked against
+  ``sha256`` when one is given. Only a complete archive is renamed from
+  ``.part`` to its final name, and one that fails the check is deleted.
+- The archive is extracted into a temporary directory under ``root``. That
+  directory is then renamed into place, so ``<root>/<name>`` is either
+  absent or complete.
+- ``<root>/manifest.json`` records each installed model's URL, checksum and
+  size. A model found there, with its directory present, is not fetched
+  again, and ``resolve`` uses it to turn a model name into its directory.
+
+The archive is deleted once extracted. Settings come from the environment:
+``MODELS_DIR`` (default: ``models``) and ``FETCH_RETRIES`` (default: 5).
+
+    python artifacts.py install vosk-model-small-en-us-0.15 https://alphacephei.com/vosk/models/vosk-model-small-en-us-0.15.zip
+    python artifacts.py list
+"""
+import argparse
+import hashlib
+import http.client
+import json
+import logging
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+from urllib.error import HTTPError
+from urllib.parse import urlparse
+from urllib.request import Request, urlopen
+
+logger = logging.getLogger(__name__)
+
+MODELS_DIR = os.environ.get("MODELS_DIR", "models")
+MANIFEST = "manifest.json"
+FETCH_RETRIES = int(os.environ.get("FETCH_RETRIES", "5"))
+# seconds to wait before retry n is n times this
+RETRY_BACKOFF = 2.0
+CHUNK_SIZE = 1 << 16
+_CONTENT_RANGE = re.compile(r"bytes (\d+)-\d+/(\d+|\*)")
+_UNSATISFIED_RANGE = re.compile(r"bytes \*/(\d+)")
+
+
+class ArtifactError(Exception):
+    """A download failed for good, or an archive did not match its checksum or could not be extracted."""
+
+
+def _hash_file(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(block)
+    return h
+
+
+def _download(url, part, timeout):
+    """Append the rest of ``url`` to ``part``; return the SHA-256 hasher of the whole file."""
+    offset = os.path.getsize(part) if os.path.exists(part) else 0
+    # hash what an earlier attempt left, so the digest covers the whole archive
+    h = _hash_file(part) if offset else hashlib.sha256()
+    req = Request(url, headers={"Range": f"bytes={offset}-"} if offset else {})
+    with urlopen(req, timeout=timeout) as res:
+        m = _CONTENT_RANGE.match(res.headers.get("Content-Range", ""))
+        if offset and (res.status != 206 or not m or int(m.group(1)) != offset):
+            logger.info("%s does not support resuming; downloading it again", url)
+            offset, h = 0, hashlib.sha256()
+        length = res.headers.get("Content-Length")
+        received = 0
+        with open(part, "ab" if offset else "wb") as out:
+            for block in iter(lambda: res.read(CHUNK_SIZE), b""):
+                out.write(block)
+                h.update(block)
+                received += len(block)
+    # http.client ends a body cut short by a dropped connection quietly
+    if length is not None and received < int(length):
+        raise http.client.IncompleteRead(b"", int(length) - received)
+    return h
+
+
+def fetch(url, dest, sha256=None, retries=None, timeout=30):
+    """Download ``url`` to ``dest``, resuming where an earlier attempt stopped.
+
+    Returns the file's SHA-256 as hex. Raises ``ArtifactError`` when it does
+    not match ``sha256`` or the download keeps failing.
+    """
+    retries = FETCH_RETRIES if retries is None else retries
+    if os.path.exists(dest):
+        # only a complete download is ever renamed to dest
+        digest = _hash_file(dest).hexdigest()
+        if sha256 is None or digest == sha256.lower():
+            logger.info("Already downloaded: %s", dest)
+            return digest
+        os.remove(dest)
+    part = dest + ".part"
+    attempt = 0
+    while True:
+        try:
+            digest = _download(url, part, timeout).hexdigest()
+            break
+        except HTTPError as e:
+            if e.code == 416 and os.path.exists(part):
+                m = _UNSATISFIED_RANGE.match(e.headers.get("Content-Range", "") if e.headers else "")
+                if m and int(m.group(1)) == os.path.getsize(part):
+                    # an earlier run got every byte but stopped before the rename
+                    digest = _hash_file(part).hexdigest()
+                    break
+                os.remove(part)
+            elif e.code < 500 or attempt >= retries:
+                raise ArtifactError(f"downloading {url} failed: HTTP {e.code}") from e
+        except (OSError, http.client.HTTPException) as e:
+            if attempt >= retries:
+                raise ArtifactError(f"downloading {url} failed after {attempt + 1} attempts: {e}") from e
+            have = os.path.getsize(part) if os.path.exists(part) else 0
+            logger.warning("Download of %s interrupted at %d bytes (%s); resuming", url, have, e)
+        attempt += 1
+        time.sleep(RETRY_BACKOFF * attempt)
+    if sha256 is not None and digest != sha256.lower():
+        os.remove(part)
+        raise ArtifactError(f"checksum mismatch for {url}: expected {sha256.lower()}, got {digest}")
+    os.replace(part, dest)
+    return digest
+
+
+def extract(archive, target):
+    """Unzip ``archive`` into the directory ``target``, which appears complete or not at all.
+
+    An archive holding a single top-level directory (as model zips do) has
+    that directory's contents placed at ``target``.
+    """
+    root = os.path.dirname(os.path.abspath(target))
+    tmp = tempfile.mkdtemp(prefix=f".{os.path.basename(target)}.", dir=root)
+    try:
+        try:
+            with zipfile.ZipFile(archive) as z:
+                z.extractall(tmp)
+        except zipfile.BadZipFile as e:
+            raise ArtifactError(f"{archive} is not a valid zip file: {e}") from e
+        entries = os.listdir(tmp)
+        src = os.path.join(tmp, entries[0]) if len(entries) == 1 and os.path.isdir(os.path.join(tmp, entries[0])) else tmp
+        aside = None
+        if os.path.exists(target):
+            # directories cannot be replaced in one rename; move the old one out of the way first
+            aside = f"{tmp}.old"
+            os.replace(target, aside)
+        os.replace(src, target)
+        if aside:
+            shutil.rmtree(aside, ignore_errors=True)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def load_manifest(root=None):
+    """``{name: entry}`` for every model installed under ``root``; empty when there is no manifest."""
+    try:
+        with open(os.path.join(MODELS_DIR if root is None else root, MANIFEST), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_manifest(root, manifest):
+    fd, tmp = tempfile.mkstemp(prefix=".manifest.", dir=root)
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp, os.path.join(root, MANIFEST))
+
+
+def installed(name, root=None, sha256=None):
+    """The directory of model ``name`` if the manifest has it (with checksum ``sha256``, if given) and it is present."""
+    root = MODELS_DIR if root is None else root
+    entry = load_manifest(root).get(name)
+    if not entry or (sha256 is not None and entry.get("sha256") != sha256.lower()):
+        return None
+    path = os.path.join(root, entry["path"])
+    return path if os.path.isdir(path) else None
+
+
+def install(name, url, root=None, sha256=None, force=False):
+    """Fetch, verify and extract model ``name`` from ``url`` into ``<root>/<name>``; return its directory.
+
+    Does nothing when the model is already installed, unless ``force``.
+    """
+    root = MODELS_DIR if root is None else root
+    path = None if force else installed(name, root, sha256)
+    if path:
+        logger.info("%s is already installed at %s", name, path)
+        return path
+    downloads = os.path.join(root, ".downloads")
+    os.makedirs(downloads, exist_ok=True)
+    archive = os.path.join(downloads, os.path.basename(urlparse(url).path) or f"{name}.zip")
+    digest = fetch(url, archive, sha256)
+    target = os.path.join(root, name)
+    try:
+        extract(archive, target)
+    except ArtifactError:
+        # a corrupt archive must not be mistaken for a finished download next time
+        os.remove(archive)
+        raise
+    manifest = load_manifest(root)
+    manifest[name] = {"path": name, "url": url, "sha256": digest, "size": os.path.getsize(archive), "installed_at": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    _write_manifest(root, manifest)
+    os.remove(archive)
+    logger.info("Installed %s at %s (sha256 %s)", name, target, digest)
+    return target
+
+
+def resolve(spec, root=None):
+    """The model directory for ``spec``: itself if it is a directory, else the installed model of that name.
+
+    ``spec`` may also be a path whose last component names an installed
+    model. Anything unresolved is returned unchanged.
+    """
+    if os.path.isdir(spec):
+        return spec
+    name = os.path.basename(os.path.normpath(spec))
+    for candidate in (spec, name):
+        path = installed(candidate, root)
+        if path:
+            return path
+    return spec
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--root", default=MODELS_DIR, help="Models directory (default: $MODELS_DIR or models)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("install", help="Download and install a model archive")
+    p.add_argument("name", help="Directory name under --root, and the model's name in the manifest")
+    p.add_argument("url")
+    p.add_argument("--sha256", help="Expected SHA-256 of the archive")
+    p.add_argument("--force", action="store_true", help="Install again even if already installed")
+    sub.add_parser("list", help="List installed models")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+
+    if args.command == "list":
+        for name, entry in sorted(load_manifest(args.root).items()):
+            print(f"{name}\t{entry['sha256']}\t{entry['url']}")
+        return 0
+    try:
+        print(install(args.name, args.url, args.root, args.sha256, args.force))
+    except ArtifactError as e:
+        logger.error("%s", e)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
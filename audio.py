@@ -0,0 +1,156 @@
+"""Normalize uploaded speech before it reaches the recognizer.
+
+Clients send whatever their microphone produced: stereo, 8/24/32-bit, and
+often the sound card's native 44.1 or 48 kHz. ``prepare`` turns a WAV file
+into what a VOSK model was trained on, with NumPy doing each step over the
+whole clip at once:
+
+- downmix: the mean of the channels
+- resample to the model's rate (usually 16 kHz): a windowed-sinc low-pass
+  when downsampling, so nothing above the new Nyquist folds back as noise,
+  then linear interpolation onto the new sample grid
+- trim: energy-based voice activity detection over ``frame_ms`` frames. A
+  frame is voiced when its RMS is within ``threshold_db`` of the loudest
+  frame and above ``floor_db`` dBFS; everything before the first and after
+  the last voiced frame, less ``pad_ms`` either side, is dropped. A clip
+  with no frame above the floor is kept whole, since there is nothing to
+  tell speech from silence by.
+
+Settings come from the environment: ``TRANSCRIBE_TRIM`` (default: 1),
+``TRANSCRIBE_VAD_DB`` (default: 35), ``TRANSCRIBE_VAD_FLOOR_DB`` (default:
+-50) and ``TRANSCRIBE_VAD_PAD_MS`` (default: 200).
+"""
+import io
+import os
+import wave
+from functools import lru_cache
+
+import numpy as np
+
+DEFAULT_RATE = 16000
+TRIM = os.environ.get("TRANSCRIBE_TRIM", "1").lower() not in ("0", "false", "no", "")
+VAD_DB = float(os.environ.get("TRANSCRIBE_VAD_DB", "35"))
+VAD_FLOOR_DB = float(os.environ.get("TRANSCRIBE_VAD_FLOOR_DB", "-50"))
+VAD_PAD_MS = int(os.environ.get("TRANSCRIBE_VAD_PAD_MS", "200"))
+VAD_FRAME_MS = 30
+# low-pass filter length per unit of decimation ratio; longer is sharper and slower
+TAPS_PER_RATIO = 16
+
+
+@lru_cache(maxsize=None)
+def model_sample_rate(model_path):
+    """The rate a VOSK model expects, from its ``conf/mfcc.conf`` (16 kHz when it does not say)."""
+    try:
+        with open(os.path.join(model_path, "conf", "mfcc.conf"), encoding="utf-8") as f:
+            for line in f:
+                if line.strip().startswith("--sample-frequency="):
+                    return int(float(line.split("=", 1)[1]))
+    except (OSError, ValueError):
+        pass
+    return DEFAULT_RATE
+
+
+def read_wav(wav_bytes):
+    """Decode a PCM WAV file to ``(samples, rate, sample_width)``; samples are float32 in [-1, 1], shaped (frames, channels)."""
+    with wave.open(io.BytesIO(wav_bytes), "rb") as wf:
+        channels, width, rate = wf.getnchannels(), wf.getsampwidth(), wf.getframerate()
+        data = wf.readframes(wf.getnframes())
+    if width == 1:
+        # 8-bit WAV is unsigned
+        x = (np.frombuffer(data, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif width == 2:
+        x = np.frombuffer(data, dtype="<i2").astype(np.float32) / 32768.0
+    elif width == 3:
+        # put each 3-byte sample in the top of an int32, which keeps its sign
+        b = np.frombuffer(data[:len(data) - len(data) % 3], dtype=np.uint8).reshape(-1, 3)
+        wide = np.zeros((len(b), 4), dtype=np.uint8)
+        wide[:, 1:] = b
+        x = wide.view("<i4").ravel().astype(np.float32) / 2.0 ** 31
+    elif width == 4:
+        x = np.frombuffer(data, dtype="<i4").astype(np.float32) / 2.0 ** 31
+    else:
+        raise ValueError(f"unsupported WAV sample width: {width * 8} bits")
+    return x[:len(x) - len(x) % channels].reshape(-1, channels), rate, width
+
+
+def downmix(samples):
+    """Average a (frames, channels) array down to mono."""
+    if samples.ndim == 1:
+        return samples
+    if samples.shape[1] == 1:
+        return samples[:, 0]
+    return samples.mean(axis=1, dtype=np.float32)
+
+
+def lowpass(cutoff, ntaps):
+    """Hann-windowed sinc filter passing frequencies below ``cutoff`` (a fraction of the sample rate)."""
+    n = np.arange(ntaps) - (ntaps - 1) / 2.0
+    h = 2 * cutoff * np.sinc(2 * cutoff * n) * np.hanning(ntaps)
+    return (h / h.sum()).astype(np.float32)
+
+
+def resample(x, src_rate, dst_rate):
+    """Resample mono ``x`` from ``src_rate`` to ``dst_rate``."""
+    if src_rate == dst_rate or len(x) == 0:
+        return x
+    ratio = src_rate / dst_rate
+    if ratio > 1:
+        # band-limit just under the new Nyquist frequency before dropping samples
+        ntaps = int(TAPS_PER_RATIO * ratio) | 1
+        x = np.convolve(x, lowpass(0.45 / ratio, ntaps), mode="same")
+    n_out = int(len(x) / ratio)
+    return np.interp(np.arange(n_out) * ratio, np.arange(len(x)), x).astype(np.float32)
+
+
+def frame_db(x, rate, frame_ms=VAD_FRAME_MS):
+    """RMS level of each whole ``frame_ms`` frame of ``x``, in dBFS."""
+    size = max(1, rate * frame_ms // 1000)
+    frames = x[:len(x) // size * size].reshape(-1, size)
+    rms = np.sqrt(np.mean(np.square(frames, dtype=np.float64), axis=1))
+    return 20 * np.log10(np.maximum(rms, 1e-10)), size
+
+
+def voiced_span(x, rate, threshold_db=None, floor_db=None, pad_ms=None, frame_ms=VAD_FRAME_MS):
+    """``(start, end)`` sample indices of ``x`` from the first to the last voiced frame, padded."""
+    threshold_db = VAD_DB if threshold_db is None else threshold_db
+    floor_db = VAD_FLOOR_DB if floor_db is None else floor_db
+    pad = rate * (VAD_PAD_MS if pad_ms is None else pad_ms) // 1000
+    db, size = frame_db(x, rate, frame_ms)
+    if len(db) == 0 or db.max() < floor_db:
+        return 0, len(x)
+    voiced = np.flatnonzero(db >= max(db.max() - threshold_db, floor_db))
+    start = max(0, voiced[0] * size - pad)
+    end = len(x) if voiced[-1] == len(db) - 1 else min(len(x), (voiced[-1] + 1) * size + pad)
+    return int(start), int(end)
+
+
+def to_pcm16(x):
+    """Little-endian 16-bit PCM bytes for float samples in [-1, 1]."""
+    return np.round(np.clip(x, -1.0, 1.0) * 32767.0).astype("<i2").tobytes()
+
+
+def prepare(wav_bytes, rate=DEFAULT_RATE, trim=None):
+    """Turn a WAV file into mono 16-bit PCM at ``rate``, trimmed of leading and trailing silence.
+
+    Returns ``(pcm, info)``. ``info`` describes the input (``input_rate``,
+    ``channels``, ``sample_width``, ``input_samples`` per channel,
+    ``input_seconds``) and what was done to it: ``rate``,
+    ``output_samples``, ``trimmed_samples`` and ``trimmed_seconds`` (silence
+    dropped, counted at ``rate``).
+    """
+    trim = TRIM if trim is None else trim
+    samples, input_rate, width = read_wav(wav_bytes)
+    x = resample(downmix(samples), input_rate, rate)
+    start, end = voiced_span(x, rate) if trim else (0, len(x))
+    info = {
+        "input_rate": input_rate,
+        "channels": samples.shape[1],
+        "sample_width": width,
+        "input_samples": len(samples),
+        "input_seconds": round(len(samples) / float(input_rate or 1), 3),
+        "rate": rate,
+        "output_samples": end - start,
+        "trimmed_samples": len(x) - (end - start),
+        "trimmed_seconds": round((len(x) - (end - start)) / float(rate), 3),
+    }
+    return to_pcm16(x[start:end]), info
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""Measure /api/chat and /api/transcribe throughput and latency under concurrency.
+
+Drives the Flask app in-process through its test client from ``--clients``
+threads and reports requests/s and p50/p99 latency. Chat runs against the
+dry-run mock and, unless ``--skip-model``, a tiny random-weight GPT-2 built
+locally; there each client keeps one session, so history assembly and the
+KV cache are exercised too. Transcription posts synthetic WAVs and needs a
+VOSK model (``--vosk-model`` or ``VOSK_MODEL_PATH``); without one it is
+reported as skipped.
+
+    python benchmarks/bench_api.py --clients 8 --requests 200 --output bench_api.json
+"""
+import argparse
+import os
+import tempfile
+
+from common import build_tiny_model, latency_summary, run_concurrent, synthetic_text, synthetic_wav, write_results
+
+
+def summarize(latencies, errors, wall):
+    res = {
+        "requests": len(latencies) + len(errors),
+        "errors": len(errors),
+        "wall_seconds": round(wall, 4),
+        "requests_per_s": round(len(latencies) / wall, 2) if wall else None,
+        "latency": latency_summary(latencies),
+    }
+    if errors:
+        res["first_error"] = errors[0]
+    return res
+
+
+def bench_chat(app_module, clients, requests, body, per_request_session=False):
+    client = app_module.app.test_client()
+
+    def one(c, i):
+        session = f"bench-{c}-{i}" if per_request_session else f"bench-{c}"
+        res = client.post("/api/chat", json=dict(body, message=synthetic_text(12, seed=i), session=session))
+        return res.status_code == 200
+
+    # load the pipeline before timing
+    one(0, -1)
+    return summarize(*run_concurrent(one, clients, requests))
+
+
+def bench_transcribe(app_module, clients, requests, wav):
+    client = app_module.app.test_client()
+
+    def one(c, i):
+        res = client.post("/api/transcribe", data=wav, content_type="audio/wav")
+        return res.status_code == 200
+
+    one(0, -1)
+    return summarize(*run_concurrent(one, clients, requests))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--model-requests", type=int, default=20, help="Chat requests against the tiny model (default: 20)")
+    parser.add_argument("--max-new-tokens", type=int, default=16)
+    parser.add_argument("--wav-seconds", type=float, default=2.0)
+    parser.add_argument("--vosk-model", help="VOSK model directory (default: $VOSK_MODEL_PATH)")
+    parser.add_argument("--model-dir", help="Where to build (or reuse) the tiny GPT-2; default: a temporary directory")
+    parser.add_argument("--skip-model", action="store_true", help="Only benchmark chat against the dry-run mock")
+    parser.add_argument("--output", help="Write JSON results to this file")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # keep benchmark turns out of the real chat database
+        os.environ["CHAT_DB"] = os.path.join(tmp, "bench_chat.db")
+        if args.vosk_model:
+            os.environ["VOSK_MODEL_PATH"] = args.vosk_model
+        import app
+
+        results = {"benchmark": "api", "clients": args.clients, "batch_max_size": app.BATCH_MAX_SIZE}
+        body = {"max_new_tokens": args.max_new_tokens, "no_sample": True}
+        # the mock echoes its prompt, so a long-lived session's replies would
+        # grow with every turn; give each dry-run request a fresh session
+        results["chat_dry_run"] = bench_chat(app, args.clients, args.requests, dict(body, dry_run=True), per_request_session=True)
+
+        if not args.skip_model:
+            model_dir = build_tiny_model(args.model_dir or os.path.join(tmp, "tiny-gpt2"))
+            results["chat_tiny_gpt2"] = bench_chat(app, args.clients, args.model_requests, dict(body, dry_run=False, model=model_dir))
+
+        model_path = app.vosk_model_path()
+        if os.path.exists(model_path):
+            wav = synthetic_wav(args.wav_seconds)
+            res = bench_transcribe(app, args.clients, args.requests, wav)
+            res["audio_seconds"] = args.wav_seconds
+            results["transcribe"] = res
+        else:
+            results["transcribe"] = {"skipped": f"no VOSK model at {model_path}"}
+
+        if app.store is not None:
+            app.store.close()
+
+    write_results(results, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""Measure upload normalization and the transcription real-time factor before and after it.
+
+Builds a synthetic clip the way a browser tends to send one: ``--rate``
+(default 48 kHz), ``--channels`` channels, with ``--silence`` seconds of
+near-silence either side of ``--seconds`` of voiced sound. ``preprocess``
+times ``audio.prepare`` alone and reports how much it trimmed.
+
+With a VOSK model (``--vosk-model`` or ``VOSK_MODEL_PATH``) both paths are
+also run through a recognizer. ``before`` is what uploads used to get: the
+clip, downmixed, fed as-is at its native rate. ``after`` is ``prepare``
+plus recognition at the model's rate. Real-time factor is processing time
+over clip duration, so lower is better. Without a model that part is
+reported as skipped.
+
+    python benchmarks/bench_audio.py --output bench_audio.json
+    python benchmarks/bench_audio.py --vosk-model models/vosk-model-small-en-us-0.15 --rate 44100
+"""
+import argparse
+import io
+import os
+import time
+import wave
+
+import numpy as np
+
+from common import latency_summary, write_results
+
+import audio
+
+
+def synthetic_clip(seconds, silence, rate, channels, seed=0):
+    """A WAV of ``seconds`` of syllable-like bursts between stretches of faint noise, as bytes."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * rate)) / rate
+    # a 4 Hz envelope over a few harmonics is crudely speech-shaped
+    envelope = 0.5 * (1 - np.cos(2 * np.pi * 4 * t))
+    voiced = envelope * sum(0.2 / k * np.sin(2 * np.pi * 150 * k * t) for k in range(1, 6))
+    quiet = int(silence * rate)
+    x = np.concatenate([np.zeros(quiet), voiced, np.zeros(quiet)])
+    x = x + rng.normal(0, 3e-4, len(x))
+    pcm = np.round(np.clip(np.repeat(x[:, None], channels, axis=1), -1, 1) * 32767).astype("<i2").tobytes()
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wf:
+        wf.setnchannels(channels)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        wf.writeframes(pcm)
+    return buf.getvalue()
+
+
+def recognize(model, pcm, rate, chunk_bytes=32000):
+    from vosk import KaldiRecognizer
+
+    rec = KaldiRecognizer(model, rate)
+    for i in range(0, len(pcm), chunk_bytes):
+        rec.AcceptWaveform(pcm[i:i + chunk_bytes])
+    rec.FinalResult()
+
+
+def bench_preprocess(wav, rate, repeat):
+    latencies = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        _, info = audio.prepare(wav, rate)
+        latencies.append(time.perf_counter() - t0)
+    return latencies, info
+
+
+def bench_recognition(model_path, wav, rate, repeat):
+    from vosk import Model, SetLogLevel
+
+    SetLogLevel(-1)
+    model = Model(model_path)
+    samples, input_rate, _ = audio.read_wav(wav)
+    duration = len(samples) / input_rate
+    raw = audio.to_pcm16(audio.downmix(samples))
+
+    def before():
+        recognize(model, raw, input_rate)
+
+    def after():
+        pcm, _ = audio.prepare(wav, rate)
+        recognize(model, pcm, rate)
+
+    res = {}
+    for name, fn in (("before", before), ("after", after)):
+        fn()
+        times = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - t0)
+        res[name] = {"rtf": round(min(times) / duration, 4), "latency": latency_summary(times)}
+    res["speedup"] = round(res["before"]["rtf"] / res["after"]["rtf"], 2) if res["after"]["rtf"] else None
+    return res
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=3.0, help="Voiced audio per clip (default: 3)")
+    parser.add_argument("--silence", type=float, default=1.0, help="Silence before and after it (default: 1)")
+    parser.add_argument("--rate", type=int, default=48000, help="Clip sample rate (default: 48000)")
+    parser.add_argument("--channels", type=int, default=2)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--vosk-model", help="VOSK model directory (default: $VOSK_MODEL_PATH)")
+    parser.add_argument("--skip-model", action="store_true", help="Only time the preprocessing")
+    parser.add_argument("--output", help="Write JSON results to this file")
+    args = parser.parse_args(argv)
+
+    wav = synthetic_clip(args.seconds, args.silence, args.rate, args.channels)
+    model_path = args.vosk_model or os.environ.get("VOSK_MODEL_PATH", "models/vosk-model-small-en-us-0.15")
+    target_rate = audio.model_sample_rate(model_path)
+    duration = args.seconds + 2 * args.silence
+    latencies, info = bench_preprocess(wav, target_rate, args.repeat)
+    results = {
+        "benchmark": "audio",
+        "clip": {"length_s": duration, "rate": args.rate, "channels": args.channels},
+        "preprocess": {
+            "latency": latency_summary(latencies),
+            "rtf": round(min(latencies) / duration, 5),
+            "rate": info["rate"],
+            "trimmed_samples": info["trimmed_samples"],
+            "trimmed_s": info["trimmed_seconds"],
+            "output_samples": info["output_samples"],
+        },
+    }
+    if args.skip_model:
+        results["recognition"] = {"skipped": "--skip-model"}
+    elif not os.path.exists(model_path):
+        results["recognition"] = {"skipped": f"no VOSK model at {model_path}"}
+    else:
+        results["recognition"] = bench_recognition(model_path, wav, target_rate, args.repeat)
+    write_results(results, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""Measure generate.generate_text latency and tokens/s.
+
+Runs the dry-run mock (pure Python overhead of the wrapper) and a tiny
+random-weight GPT-2 built locally (real tokenize/decode/prefill work), on
+PyTorch and, when onnxruntime is installed, ONNX Runtime, so it needs no
+network. Greedy decoding with ``min_new_tokens`` pins every
+call to exactly ``--max-new-tokens`` tokens, keeping runs comparable.
+
+    python benchmarks/bench_generate.py --runs 20 --output bench_generate.json
+"""
+import argparse
+import os
+import tempfile
+
+from common import build_tiny_model, latency_summary, synthetic_text, timed, write_results
+
+import generate
+
+
+def bench_pipeline(p, prompt, runs, max_new_tokens, count_tokens, **extra):
+    # the first call pays one-off costs (lazy init, allocator warm-up)
+    generate.generate_text(p, prompt, max_new_tokens=max_new_tokens, do_sample=False, **extra)
+    latencies, tokens = [], 0
+    for _ in range(runs):
+        out, dt = timed(generate.generate_text, p, prompt, max_new_tokens=max_new_tokens, do_sample=False, **extra)
+        latencies.append(dt)
+        tokens += count_tokens(out[0]["generated_text"])
+    total = sum(latencies)
+    return {
+        "latency": latency_summary(latencies),
+        "tokens": tokens,
+        "tokens_per_s": round(tokens / total, 2) if total else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--max-new-tokens", type=int, default=32)
+    parser.add_argument("--prompt-words", type=int, default=64)
+    parser.add_argument("--model-dir", help="Where to build (or reuse) the tiny GPT-2; default: a temporary directory")
+    parser.add_argument("--skip-model", action="store_true", help="Only benchmark the dry-run mock")
+    parser.add_argument("--output", help="Write JSON results to this file")
+    args = parser.parse_args(argv)
+
+    prompt = synthetic_text(args.prompt_words)
+    results = {"benchmark": "generate", "runs": args.runs, "max_new_tokens": args.max_new_tokens, "prompt_words": args.prompt_words}
+
+    mock = generate.make_mock_pipeline()
+    results["mock"] = bench_pipeline(mock, prompt, args.runs, args.max_new_tokens, lambda text: len(text.split()))
+
+    if not args.skip_model:
+        with tempfile.TemporaryDirectory() as tmp:
+            model_dir = build_tiny_model(args.model_dir or os.path.join(tmp, "tiny-gpt2"))
+            (p, _), load_s = timed(generate.init_pipeline, model=model_dir, device_opt="cpu")
+            # min_new_tokens makes every call decode exactly max_new_tokens; re-tokenizing
+            # the decoded text would not round-trip with random weights
+            res = bench_pipeline(
+                p, prompt, args.runs, args.max_new_tokens,
+                lambda text: args.max_new_tokens,
+                min_new_tokens=args.max_new_tokens,
+            )
+            res["load_seconds"] = round(load_s, 4)
+            results["tiny_gpt2"] = res
+
+            try:
+                import onnxruntime  # noqa: F401
+            except ImportError:
+                results["tiny_gpt2_onnx"] = {"skipped": "onnxruntime not installed"}
+            else:
+                generate.ONNX_CACHE_DIR = os.path.join(tmp, "onnx")
+                (p, _), load_s = timed(generate.init_pipeline, model=model_dir, device_opt="cpu", backend="onnx")
+                res = bench_pipeline(p, prompt, args.runs, args.max_new_tokens, lambda text: args.max_new_tokens, min_new_tokens=args.max_new_tokens)
+                # includes the one-off export
+                res["load_seconds"] = round(load_s, 4)
+                results["tiny_gpt2_onnx"] = res
+
+    write_results(results, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
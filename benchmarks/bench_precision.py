@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""Compare fp32, bf16 and int8 weights: memory, tokens/s and output quality.
+
+Each precision is loaded in its own interpreter so resident memory is not
+shared between them. Quality is measured against fp32 on a fixed prompt
+set: ``exact_match_rate`` is the share of prompts whose greedy continuation
+is token-for-token identical, and ``top1_agreement`` is the share of
+positions where, fed fp32's continuation (teacher forcing), the model's
+most likely next token is the one fp32 chose.
+
+    python benchmarks/bench_precision.py --output bench_precision.json
+    python benchmarks/bench_precision.py --model distilgpt2 --quant-cache ~/.cache/quant
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from common import build_tiny_model, synthetic_text, timed, write_results
+
+PROMPTS = [synthetic_text(n, seed=i) for i, n in enumerate((8, 16, 32, 48, 64, 96))]
+
+
+def rss_mb():
+    """Current resident set size in MB (Linux), or None."""
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def peak_rss_mb():
+    try:
+        import resource
+
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    except ImportError:
+        return None
+
+
+def measure(model, precision, max_new_tokens, reference=None):
+    """Load ``model`` at ``precision`` and return its measurements (runs in a child process)."""
+    import torch
+
+    import generate
+    from precision import model_nbytes
+
+    (p, _), load_s = timed(generate.init_pipeline, model=model, device_opt="cpu", dtype=precision)
+    res = {"load_seconds": round(load_s, 4), "model_mb": round(model_nbytes(p.model) / 1e6, 3), "rss_mb": rss_mb()}
+
+    tok, lm = p.tokenizer, p.model
+    prompts = [tok(text, return_tensors="pt").input_ids for text in PROMPTS]
+    with torch.inference_mode():
+        lm.generate(prompts[0], max_new_tokens=2, do_sample=False, pad_token_id=tok.eos_token_id)  # warm-up
+        outputs, seconds = [], 0.0
+        for ids in prompts:
+            out, dt = timed(
+                lm.generate, ids, max_new_tokens=max_new_tokens, min_new_tokens=max_new_tokens, do_sample=False, pad_token_id=tok.eos_token_id
+            )
+            outputs.append(out[0, ids.shape[1]:].tolist())
+            seconds += dt
+        res["tokens_per_s"] = round(len(prompts) * max_new_tokens / seconds, 2)
+        res["outputs"] = outputs
+
+        if reference is not None:
+            agree = total = 0
+            for ids, ref in zip(prompts, reference):
+                full = torch.cat([ids, torch.tensor([ref])], dim=1)
+                logits = lm(full).logits[0, ids.shape[1] - 1:-1]
+                agree += int((logits.argmax(-1) == full[0, ids.shape[1]:]).sum())
+                total += len(ref)
+            res["top1_agreement"] = round(agree / total, 4) if total else None
+            res["exact_match_rate"] = round(sum(o == r for o, r in zip(outputs, reference)) / len(reference), 4)
+    res["peak_rss_mb"] = peak_rss_mb()
+    return res
+
+
+def run_child(args, precision, reference_path=None):
+    cmd = [sys.executable, os.path.abspath(__file__), "--only", precision, "--model", args.model, "--max-new-tokens", str(args.max_new_tokens)]
+    if reference_path:
+        cmd += ["--reference", reference_path]
+    env = dict(os.environ)
+    if args.quant_cache:
+        env["QUANT_CACHE_DIR"] = args.quant_cache
+    out = subprocess.run(cmd, check=True, capture_output=True, text=True, env=env).stdout
+    return json.loads(out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", help="Model to compare (default: a tiny random GPT-2 built locally)")
+    parser.add_argument("--model-dir", help="Where to build (or reuse) the tiny GPT-2; default: a temporary directory")
+    parser.add_argument("--precisions", default="fp32,bf16,int8", help="Comma-separated precisions to measure (default: fp32,bf16,int8)")
+    parser.add_argument("--skip-model", action="store_true", help="Skip the benchmark (it needs a real model)")
+    parser.add_argument("--max-new-tokens", type=int, default=32)
+    parser.add_argument("--quant-cache", help="Directory for the int8 conversion cache (default: none, convert every run)")
+    parser.add_argument("--output", help="Write JSON results to this file")
+    parser.add_argument("--only", help=argparse.SUPPRESS)
+    parser.add_argument("--reference", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.only:
+        reference = None
+        if args.reference:
+            with open(args.reference, encoding="utf-8") as f:
+                reference = json.load(f)
+        write_results(measure(args.model, args.only, args.max_new_tokens, reference))
+        return 0
+
+    if args.skip_model:
+        write_results({"benchmark": "precision", "skipped": "--skip-model"}, args.output)
+        return 0
+
+    precisions = [p.strip() for p in args.precisions.split(",") if p.strip()]
+    results = {"benchmark": "precision", "max_new_tokens": args.max_new_tokens, "prompts": len(PROMPTS)}
+    with tempfile.TemporaryDirectory() as tmp:
+        if not args.model:
+            args.model = build_tiny_model(args.model_dir or os.path.join(tmp, "tiny-gpt2"))
+        results["model"] = args.model
+
+        fp32 = run_child(args, "fp32")
+        reference_path = os.path.join(tmp, "reference.json")
+        with open(reference_path, "w", encoding="utf-8") as f:
+            json.dump(fp32["outputs"], f)
+        for precision in precisions:
+            res = fp32 if precision == "fp32" else run_child(args, precision, reference_path)
+            res.pop("outputs", None)
+            if precision == "fp32":
+                res.update(exact_match_rate=1.0, top1_agreement=1.0)
+            results[precision] = res
+
+    write_results(results, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""Measure pre-fork serving: requests/s and per-worker memory for 1..N workers.
+
+For each ``--workers`` count, starts ``prefork.py`` on a free port with the
+model preloaded, drives ``/api/chat`` over HTTP from ``--clients`` threads,
+and reads every worker's RSS and PSS from ``/proc`` while the model is in
+use. ``total_rss_mb`` is roughly what the same number of independent
+processes would take; ``total_pss_mb`` (master included) is what the
+workers really cost, with shared weight pages counted once.
+
+    python benchmarks/bench_prefork.py --workers 1,2,4 --output bench_prefork.json
+    python benchmarks/bench_prefork.py --model distilgpt2
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from common import ROOT, build_tiny_model, latency_summary, run_concurrent, synthetic_text, write_results
+
+from prefork import memory_usage
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def post(url, body, timeout=120):
+    req = urllib.request.Request(url, data=json.dumps(body).encode("utf-8"), headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(req, timeout=timeout) as res:
+        return res.status == 200
+
+
+def worker_pids(master):
+    try:
+        with open(f"/proc/{master}/task/{master}/children", encoding="ascii") as f:
+            return [int(pid) for pid in f.read().split()]
+    except OSError:
+        return []
+
+
+def bench_workers(model, workers, clients, requests, max_new_tokens, tmp):
+    port = free_port()
+    env = dict(os.environ, PIPELINE_WARMUP=f"{model}@cpu", CHAT_DB=os.path.join(tmp, f"chat-{workers}.db"), PYTHONPATH=ROOT)
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "prefork.py"), "--workers", str(workers), "--host", "127.0.0.1", "--port", str(port)],
+        env=env, cwd=tmp, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}/api/chat"
+    body = {"model": model, "dry_run": False, "max_new_tokens": max_new_tokens, "do_sample": False}
+    try:
+        started = time.perf_counter()
+        while True:
+            try:
+                post(url, dict(body, message="hello", session="warm-up"))
+                break
+            except OSError:
+                if proc.poll() is not None or time.perf_counter() - started > 300:
+                    raise RuntimeError("prefork.py did not start")
+                time.sleep(0.2)
+        startup = time.perf_counter() - started
+
+        def one(c, i):
+            return post(url, dict(body, message=synthetic_text(12, seed=i), session=f"bench-{c}"))
+
+        latencies, errors, wall = run_concurrent(one, clients, requests)
+        memory = [m for m in (memory_usage(pid) for pid in worker_pids(proc.pid)) if m]
+        master = memory_usage(proc.pid)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+    res = {
+        "startup_seconds": round(startup, 3),
+        "requests": len(latencies) + len(errors),
+        "errors": len(errors),
+        "requests_per_s": round(len(latencies) / wall, 2) if wall else None,
+        "latency": latency_summary(latencies),
+        "workers": memory,
+        "master_rss_mb": master["rss_mb"] if master else None,
+    }
+    if memory:
+        res["total_rss_mb"] = round(sum(m["rss_mb"] for m in memory), 1)
+        res["total_pss_mb"] = round(sum(m["pss_mb"] for m in memory) + (master["pss_mb"] if master else 0), 1)
+    return res
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", default="1,2", help="Comma-separated worker counts to measure (default: 1,2)")
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=40)
+    parser.add_argument("--max-new-tokens", type=int, default=16)
+    parser.add_argument("--model", help="Model to serve (default: a tiny random GPT-2 built locally)")
+    parser.add_argument("--model-dir", help="Where to build (or reuse) the tiny GPT-2; default: a temporary directory")
+    parser.add_argument("--skip-model", action="store_true", help="Skip the benchmark (it needs a real model)")
+    parser.add_argument("--output", help="Write JSON results to this file")
+    args = parser.parse_args(argv)
+
+    if args.skip_model:
+        write_results({"benchmark": "prefork", "skipped": "--skip-model"}, args.output)
+        return 0
+
+    results = {"benchmark": "prefork", "clients": args.clients, "max_new_tokens": args.max_new_tokens}
+    with tempfile.TemporaryDirectory() as tmp:
+        model = args.model or build_tiny_model(args.model_dir or os.path.join(tmp, "tiny-gpt2"), n_layer=6, n_embd=256)
+        results["model"] = model
+        for n in (int(w) for w in args.workers.split(",") if w.strip()):
+            results[f"workers_{n}"] = bench_workers(model, n, args.clients, args.requests, args.max_new_tokens, tmp)
+    write_results(results, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
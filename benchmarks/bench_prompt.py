@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""Measure tokenization time saved by prompting.PromptBuilder on long chats.
+
+Simulates a conversation of ``--turns`` messages. For every turn the baseline
+joins the recent messages into one string and tokenizes all of it, as the app
+did before; the builder only tokenizes the new message and reuses cached ids
+for the rest. Both fill the same token budget.
+
+    python benchmarks/bench_prompt.py --turns 400 --output bench_prompt.json
+"""
+import argparse
+
+from common import load_tokenizer, synthetic_text, timed, write_results
+
+from prompting import PromptBuilder, format_message
+
+
+def baseline_build(tokenizer, turns, budget):
+    """Tokenize the joined history, newest first, until the budget is filled."""
+    ids = []
+    for i in range(len(turns), 0, -1):
+        text = "".join(format_message(m) for m in turns[i - 1:]) + "AI:"
+        candidate = tokenizer(text, add_special_tokens=False)["input_ids"]
+        if len(candidate) > budget:
+            break
+        ids = candidate
+    return ids
+
+
+def baseline_build_once(tokenizer, turns, budget):
+    """Cheaper baseline: tokenize a fixed message window once and truncate."""
+    text = "".join(format_message(m) for m in turns[-32:]) + "AI:"
+    return tokenizer(text, add_special_tokens=False)["input_ids"][-budget:]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tokenizer", default="distilgpt2")
+    parser.add_argument("--turns", type=int, default=300)
+    parser.add_argument("--words-per-message", type=int, default=30)
+    parser.add_argument("--max-length", type=int, default=1024)
+    parser.add_argument("--max-new-tokens", type=int, default=120)
+    parser.add_argument("--output", help="Write JSON results to this file")
+    args = parser.parse_args(argv)
+
+    tokenizer, tok_name = load_tokenizer(args.tokenizer)
+    history = [
+        {"id": i, "role": "user" if i % 2 == 0 else "assistant", "text": synthetic_text(args.words_per_message, seed=i)}
+        for i in range(args.turns)
+    ]
+    budget = args.max_length - args.max_new_tokens
+
+    builder = PromptBuilder(tokenizer, max_length=args.max_length)
+    t_builder = t_once = t_full = 0.0
+    for n in range(1, len(history) + 1):
+        turns = history[max(0, n - 64):n]
+        _, dt = timed(builder.build, turns, args.max_new_tokens, "bench")
+        t_builder += dt
+        _, dt = timed(baseline_build_once, tokenizer, turns, budget)
+        t_once += dt
+        # the exact newest-first baseline is quadratic; sample it
+        if n % 10 == 0:
+            _, dt = timed(baseline_build, tokenizer, turns, budget)
+            t_full += dt * 10
+
+    results = {
+        "benchmark": "prompt_builder",
+        "tokenizer": tok_name,
+        "turns": args.turns,
+        "words_per_message": args.words_per_message,
+        "seconds": {
+            "builder": round(t_builder, 6),
+            "baseline_window_tokenize": round(t_once, 6),
+            "baseline_exact_budget": round(t_full, 6),
+        },
+        "speedup_vs_window_tokenize": round(t_once / t_builder, 2) if t_builder else None,
+        "speedup_vs_exact_budget": round(t_full / t_builder, 2) if t_builder else None,
+        "builder_cache": builder.stats(),
+    }
+    write_results(results, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
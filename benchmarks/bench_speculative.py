@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""Measure assisted (speculative) decoding: tokens/s with and without a draft model.
+
+Runs greedy generation over a fixed prompt set with the target alone and
+with ``--draft-model`` drafting for it, and reports both rates, the
+speedup, the draft's accept rate, tokens kept per target pass and whether
+the outputs matched exactly (they should: greedy assisted decoding is
+lossless).
+
+By default both models are tiny random GPT-2s sharing a tokenizer. The
+target is so cheap that drafting costs about as much as it saves, so that
+run checks exactness and overhead; pass a real pair to see the gain:
+
+    python benchmarks/bench_speculative.py --output bench_speculative.json
+    python benchmarks/bench_speculative.py --model gpt2 --draft-model distilgpt2
+"""
+import argparse
+import os
+import tempfile
+
+from common import build_tiny_model, synthetic_text, timed, write_results
+
+import generate
+import metrics
+
+PROMPTS = [synthetic_text(n, seed=i) for i, n in enumerate((8, 16, 32, 48))]
+
+
+def run(p, max_new_tokens):
+    generate.generate_text(p, PROMPTS[0], max_new_tokens=2, do_sample=False)  # warm-up
+    outputs, seconds = [], 0.0
+    with metrics.collect() as timings:
+        for prompt in PROMPTS:
+            out, dt = timed(generate.generate_text, p, prompt, max_new_tokens=max_new_tokens, min_new_tokens=max_new_tokens, do_sample=False)
+            outputs.append(out[0]["generated_text"])
+            seconds += dt
+    return outputs, seconds, timings.counts
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", help="Target model (default: a tiny random GPT-2 built locally)")
+    parser.add_argument("--draft-model", help="Draft model with the target's tokenizer (default: a smaller tiny GPT-2)")
+    parser.add_argument("--model-dir", help="Where to build (or reuse) the tiny models; default: a temporary directory")
+    parser.add_argument("--skip-model", action="store_true", help="Skip the benchmark (it needs a real model)")
+    parser.add_argument("--max-new-tokens", type=int, default=32)
+    parser.add_argument("--output", help="Write JSON results to this file")
+    args = parser.parse_args(argv)
+
+    if args.skip_model:
+        write_results({"benchmark": "speculative", "skipped": "--skip-model"}, args.output)
+        return 0
+
+    results = {"benchmark": "speculative", "max_new_tokens": args.max_new_tokens, "prompts": len(PROMPTS)}
+    with tempfile.TemporaryDirectory() as tmp:
+        root = args.model_dir or tmp
+        model = args.model or build_tiny_model(os.path.join(root, "tiny-gpt2-target"), n_layer=6, n_embd=256)
+        draft = args.draft_model or build_tiny_model(os.path.join(root, "tiny-gpt2-draft"), n_layer=1, n_embd=64, seed=1)
+        results.update(model=model, draft_model=draft)
+
+        target, _ = generate.init_pipeline(model=model, device_opt="cpu")
+        assisted, _ = generate.init_pipeline(model=model, device_opt="cpu", draft_model=draft)
+        expected, target_s, _ = run(target, args.max_new_tokens)
+        outputs, assisted_s, counts = run(assisted, args.max_new_tokens)
+
+    tokens = len(PROMPTS) * args.max_new_tokens
+    results["target_tokens_per_s"] = round(tokens / target_s, 2)
+    results["assisted_tokens_per_s"] = round(tokens / assisted_s, 2)
+    results["speedup"] = round(target_s / assisted_s, 3)
+    results["accept_rate"] = round(counts.get("accepted", 0) / counts["draft_tokens"], 4) if counts.get("draft_tokens") else None
+    results["tokens_per_target_pass"] = round(counts.get("spec_tokens", 0) / counts["target_passes"], 3) if counts.get("target_passes") else None
+    results["exact_match_rate"] = round(sum(a == b for a, b in zip(outputs, expected)) / len(PROMPTS), 4)
+    write_results(results, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
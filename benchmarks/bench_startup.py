@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""Measure cold-start time of app.py and generate.py.
+
+Each case runs in a fresh interpreter, so module imports, pipeline creation
+and (for the tiny model) weight loading are all included. Reports the
+median and worst wall time over ``--runs``.
+
+``import_profile`` is a ``python -X importtime`` report for ``import app``
+and a dry run of generate.py: total import time, the ``--top`` packages
+that take longest to import, and which model libraries (torch, transformers, NumPy,
+VOSK, ONNX Runtime) were loaded, which should be none.
+
+``server`` starts the app with the tiny model in ``PIPELINE_WARMUP`` and
+times how long after launch ``/healthz`` first answers and ``/readyz``
+first reports ready.
+
+    python benchmarks/bench_startup.py --runs 5 --output bench_startup.json
+"""
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+from common import ROOT, build_tiny_model, write_results
+
+HEAVY_MODULES = ("torch", "transformers", "numpy", "vosk", "onnxruntime")
+
+
+def time_command(cmd, runs, env):
+    samples = []
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        proc = subprocess.run(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        samples.append(time.perf_counter() - t0)
+        if proc.returncode != 0:
+            return {"error": proc.stderr.decode("utf-8", "replace").strip().splitlines()[-1:]}
+    return {"runs": runs, "median_seconds": round(statistics.median(samples), 4), "max_seconds": round(max(samples), 4)}
+
+
+def import_profile(cmd, env, top):
+    """Parse ``-X importtime`` output of ``cmd``: total import time, the costliest packages and any heavy modules.
+
+    Each module's own time is added to its top-level package, so ``werkzeug``
+    covers every ``werkzeug.*`` module whoever imported it.
+    """
+    proc = subprocess.run([cmd[0], "-X", "importtime", *cmd[1:]], cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    packages = {}
+    total_us = modules = 0
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or line.count("|") != 2:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            continue  # the header line
+        package = name.strip().split(".")[0]
+        packages[package] = packages.get(package, 0) + int(self_us)
+        total_us += int(self_us)
+        modules += 1
+    slowest = sorted(packages.items(), key=lambda kv: -kv[1])[:top]
+    return {
+        "total_ms": round(total_us / 1000, 1),
+        "modules": modules,
+        "top_packages": [{"package": name, "self_ms": round(us / 1000, 1)} for name, us in slowest],
+        "heavy": [m for m in HEAVY_MODULES if m in packages],
+    }
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def time_server(env, timeout=300):
+    """Seconds from launching the app until /healthz answers and until /readyz reports ready."""
+    port = free_port()
+    code = "import sys, app; app.app.run(host='127.0.0.1', port=int(sys.argv[1]), threaded=True)"
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-c", code, str(port)], cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    res = {}
+    try:
+        while "ready_seconds" not in res:
+            if proc.poll() is not None or time.perf_counter() - t0 > timeout:
+                res["error"] = "app exited" if proc.poll() is not None else "timed out"
+                break
+            for path, key in (("/healthz", "healthy_seconds"), ("/readyz", "ready_seconds")):
+                if key in res:
+                    continue
+                try:
+                    with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=5):
+                        res[key] = round(time.perf_counter() - t0, 4)
+                except (OSError, urllib.error.HTTPError):
+                    pass
+            time.sleep(0.01)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+    return res
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--model-dir", help="Where to build (or reuse) the tiny GPT-2; default: a temporary directory")
+    parser.add_argument("--skip-model", action="store_true", help="Skip the runs that load the tiny model")
+    parser.add_argument("--top", type=int, default=10, help="Slowest packages to list in the import profile (default: 10)")
+    parser.add_argument("--output", help="Write JSON results to this file")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, CHAT_DB=os.path.join(tmp, "startup.db"))
+        py = sys.executable
+        cases = {
+            "interpreter": [py, "-c", "pass"],
+            "app_import": [py, "-c", "import app"],
+            "generate_dry_run": [py, "generate.py", "--dry-run", "--no-cache", "--prompt", "hello"],
+        }
+        if not args.skip_model:
+            model_dir = build_tiny_model(args.model_dir or os.path.join(tmp, "tiny-gpt2"))
+            cases["generate_tiny_gpt2"] = [py, "generate.py", "--model", model_dir, "--no-cache", "--no-sample", "--max-new-tokens", "1", "--prompt", "hello"]
+
+        results = {"benchmark": "startup"}
+        for name, cmd in cases.items():
+            results[name] = time_command(cmd, args.runs, env)
+        results["import_profile"] = {name: import_profile(cases[name], env, args.top) for name in ("app_import", "generate_dry_run")}
+        if not args.skip_model:
+            results["server"] = time_server(dict(env, PIPELINE_WARMUP=f"{model_dir}@cpu"))
+
+    write_results(results, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,174 @@
+"""Helpers shared by the benchmark scripts.
+
+Benchmarks must run offline, so when a named tokenizer cannot be loaded a
+small byte-level BPE tokenizer is trained on synthetic text instead. Its
+token counts are GPT-2-like, which is all the timing comparisons need. The
+same tokenizer backs ``build_tiny_model``, a random-weight GPT-2 saved to disk
+so the real transformers loading and decoding paths can be timed without a
+download.
+"""
+import io
+import json
+import math
+import os
+import random
+import struct
+import sys
+import threading
+import time
+import wave
+
+# allow running as `python benchmarks/<script>.py` from the repo root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+WORDS = (
+    "the a an and of to in is it you that he was for on are with as I his they be at one have this "
+    "from or had by hot word but what some we can out other were all there when up use your how said "
+    "each she which do their time if will way about many then them write would like so these her long "
+    "make thing see him two has look more day could go come did number sound no most people my over "
+    "know water than call first who may down side been now find raspberry pi model voice chat hello"
+).split()
+
+
+def synthetic_text(n_words, seed=0):
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) for _ in range(n_words))
+
+
+def load_tokenizer(name="distilgpt2"):
+    """Load ``name`` with transformers, or train a local stand-in when offline."""
+    try:
+        from transformers import AutoTokenizer
+
+        return AutoTokenizer.from_pretrained(name), name
+    except Exception:
+        pass
+    return train_tokenizer(), "local-bpe"
+
+
+def train_tokenizer():
+    """A small byte-level BPE tokenizer trained on synthetic text."""
+    from tokenizers import ByteLevelBPETokenizer
+    from transformers import PreTrainedTokenizerFast
+
+    bpe = ByteLevelBPETokenizer()
+    corpus = [synthetic_text(200, seed=i) for i in range(200)] + ["User: AI:\n"] * 50
+    bpe.train_from_iterator(corpus, vocab_size=2000, min_frequency=1, special_tokens=["<|endoftext|>"])
+    return PreTrainedTokenizerFast(tokenizer_object=bpe._tokenizer, eos_token="<|endoftext|>", pad_token="<|endoftext|>")
+
+
+def build_tiny_model(directory, n_layer=2, n_embd=64, seed=0):
+    """Save a random-weight GPT-2 and its tokenizer to ``directory`` and return the path.
+
+    The result loads with ``generate.init_pipeline(model=directory)`` like any
+    hub model. Building is skipped when ``directory`` already holds one.
+    """
+    if os.path.exists(os.path.join(directory, "config.json")):
+        return directory
+    import torch
+    from transformers import GPT2Config, GPT2LMHeadModel
+
+    tok = train_tokenizer()
+    torch.manual_seed(seed)
+    config = GPT2Config(vocab_size=len(tok), n_positions=512, n_embd=n_embd, n_layer=n_layer, n_head=4, bos_token_id=tok.eos_token_id, eos_token_id=tok.eos_token_id)
+    model = GPT2LMHeadModel(config).eval()
+    model.save_pretrained(directory)
+    tok.save_pretrained(directory)
+    return directory
+
+
+def synthetic_wav(seconds=1.0, rate=16000, seed=0):
+    """A mono 16-bit WAV of tones plus noise, as bytes."""
+    rng = random.Random(seed)
+    n = int(seconds * rate)
+    frames = bytearray()
+    for i in range(n):
+        t = i / rate
+        value = 0.3 * math.sin(2 * math.pi * 220 * t) + 0.2 * math.sin(2 * math.pi * 440 * t) + 0.05 * (rng.random() - 0.5)
+        frames += struct.pack("<h", int(value * 32767))
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(rate)
+        wf.writeframes(bytes(frames))
+    return buf.getvalue()
+
+
+def timed(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - t0
+
+
+def percentile(samples, q):
+    """The ``q``-th percentile (0-100) of ``samples``, linearly interpolated."""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    pos = (len(ordered) - 1) * q / 100.0
+    lo = int(pos)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - lo)
+
+
+def latency_summary(samples):
+    """Mean, p50, p99 and max of ``samples`` (seconds), in milliseconds."""
+    if not samples:
+        return {"count": 0}
+    return {
+        "count": len(samples),
+        "mean_ms": round(1000 * sum(samples) / len(samples), 3),
+        "p50_ms": round(1000 * percentile(samples, 50), 3),
+        "p99_ms": round(1000 * percentile(samples, 99), 3),
+        "max_ms": round(1000 * max(samples), 3),
+    }
+
+
+def run_concurrent(fn, clients, requests):
+    """Call ``fn(client_index, request_index)`` ``requests`` times from ``clients`` threads.
+
+    Returns ``(latencies, errors, wall_seconds)``; ``fn`` returning False or
+    raising counts as an error.
+    """
+    latencies, errors = [], []
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def client(c):
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            t0 = time.perf_counter()
+            try:
+                ok = fn(c, i) is not False
+                err = None if ok else "request failed"
+            except Exception as e:
+                err = str(e)
+            dt = time.perf_counter() - t0
+            with lock:
+                if err:
+                    errors.append(err)
+                else:
+                    latencies.append(dt)
+
+    threads = [threading.Thread(target=client, args=(c,)) for c in range(clients)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return latencies, errors, time.perf_counter() - t0
+
+
+def write_results(results, path=None):
+    """Print ``results`` as JSON and optionally save them to ``path``."""
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""Compare two benchmark JSON files and report regressions.
+
+Works on the output of any single benchmark script or of ``run_all.py``.
+Numeric results are matched by their path in the JSON; times (``*_ms``,
+``*_seconds``), real-time factors (``rtf``), memory (``*_mb``) and error
+counts are better when lower, rates (``*_per_s``, ``*_rate``), agreement
+scores and speedups when higher, and everything else (counts, settings) is
+ignored. A metric that got worse by more than ``--threshold`` percent is a
+regression, and the exit status is 1 if there is any.
+
+    python benchmarks/compare.py baseline.json current.json --threshold 10
+"""
+import argparse
+import json
+import sys
+
+
+def flatten(results, prefix=""):
+    """Map dotted paths to the numeric leaves of ``results``."""
+    flat = {}
+    for key, value in results.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, path + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+
+def direction(path):
+    """+1 if higher is better, -1 if lower is better, 0 for values not compared."""
+    name = path.rsplit(".", 1)[-1]
+    if name.endswith(("_per_s", "_agreement", "_rate")) or name.startswith("speedup"):
+        return 1
+    if name.endswith(("_ms", "seconds", "_mb", "rtf")) or name == "errors":
+        return -1
+    return 0
+
+
+def compare(baseline, current, threshold=10.0):
+    """Return one row per comparable metric, worst change first.
+
+    Each row is ``{"metric", "baseline", "current", "change_pct", "regression"}``;
+    ``change_pct`` is positive when the metric got better.
+    """
+    old, new = flatten(baseline), flatten(current)
+    rows = []
+    for path in sorted(set(old) & set(new)):
+        sign = direction(path)
+        if not sign:
+            continue
+        a, b = old[path], new[path]
+        if a == 0:
+            change = 0.0 if b == 0 else -100.0 * sign * (1 if b > 0 else -1)
+        else:
+            change = 100.0 * sign * (b - a) / abs(a)
+        rows.append({"metric": path, "baseline": a, "current": b, "change_pct": round(change, 2), "regression": change < -threshold})
+    rows.sort(key=lambda r: r["change_pct"])
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Percent a metric may get worse before it counts as a regression (default: 10)")
+    parser.add_argument("--json", action="store_true", help="Print the comparison as JSON")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, "r", encoding="utf-8") as f:
+        current = json.load(f)
+    rows = compare(baseline, current, args.threshold)
+    regressions = [r for r in rows if r["regression"]]
+
+    if args.json:
+        print(json.dumps({"threshold_pct": args.threshold, "regressions": len(regressions), "metrics": rows}, indent=2))
+    else:
+        width = max((len(r["metric"]) for r in rows), default=10)
+        for r in rows:
+            flag = "REGRESSION" if r["regression"] else ""
+            print(f"{r['metric']:<{width}}  {r['baseline']:>12}  {r['current']:>12}  {r['change_pct']:>+8.2f}%  {flag}")
+        print(f"{len(regressions)} regression(s) beyond {args.threshold}% in {len(rows)} metrics", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
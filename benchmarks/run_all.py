@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Run every benchmark and write their results as one JSON document.
+
+Each benchmark runs in its own interpreter so imports and loaded models do
+not leak between them. Arguments after ``--`` are passed to every script
+that accepts them, e.g. ``--skip-model`` for a quick run.
+
+    python benchmarks/run_all.py --output results.json -- --skip-model
+    python benchmarks/compare.py baseline.json results.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import write_results
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BENCHMARKS = ("bench_generate", "bench_api", "bench_startup", "bench_prompt", "bench_precision", "bench_speculative", "bench_prefork", "bench_audio")
+# flags each script understands, so shared extras can be filtered per script
+SHARED_FLAGS = {
+    "bench_generate": {"--skip-model", "--model-dir"},
+    "bench_api": {"--skip-model", "--model-dir"},
+    "bench_startup": {"--skip-model", "--model-dir"},
+    "bench_prompt": set(),
+    "bench_precision": {"--skip-model", "--model-dir"},
+    "bench_speculative": {"--skip-model", "--model-dir"},
+    "bench_prefork": {"--skip-model", "--model-dir"},
+    "bench_audio": {"--skip-model"},
+}
+
+
+def script_args(name, extra):
+    args, i = [], 0
+    while i < len(extra):
+        flag = extra[i]
+        takes_value = i + 1 < len(extra) and not extra[i + 1].startswith("--")
+        if flag in SHARED_FLAGS[name]:
+            args.append(flag)
+            if takes_value:
+                args.append(extra[i + 1])
+        i += 2 if takes_value else 1
+    return args
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", action="append", choices=BENCHMARKS, help="Run just this benchmark; repeatable")
+    parser.add_argument("--output", help="Write the combined JSON results to this file")
+    argv = list(sys.argv[1:] if argv is None else argv)
+    extra = []
+    if "--" in argv:
+        extra = argv[argv.index("--") + 1:]
+        argv = argv[:argv.index("--")]
+    args = parser.parse_args(argv)
+
+    results = {
+        "meta": {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count(), "time": time.strftime("%Y-%m-%dT%H:%M:%S")},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in args.only or BENCHMARKS:
+            out = os.path.join(tmp, name + ".json")
+            cmd = [sys.executable, os.path.join(HERE, name + ".py"), "--output", out] + script_args(name, extra)
+            proc = subprocess.run(cmd, stdout=subprocess.DEVNULL)
+            if proc.returncode != 0 or not os.path.exists(out):
+                results[name] = {"error": f"exit status {proc.returncode}"}
+                continue
+            with open(out, "r", encoding="utf-8") as f:
+                results[name] = json.load(f)
+
+    write_results(results, args.output)
+    return 0 if all("error" not in v for v in results.values()) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,331 @@
+"""Bulk offline generation over JSONL input for ``generate.py``.
+
+Each input line is a JSON object with a ``prompt`` (or a bare JSON string)
+and optional per-record overrides of the generation parameters. The model is
+loaded once (per worker), consecutive records with identical parameters are
+generated as one batch, and results are written to the output in input order
+as soon as every earlier record is done. With ``--resume`` records already
+present in the output are skipped.
+
+With ``--workers N`` the records are spread over N processes, each pinned to
+its own slice of the CPU cores with torch's thread count to match. If a
+worker dies, the records of the batches it held get an ``error`` result and
+the rest carry on with the other workers; once every worker has exited the
+run fails.
+"""
+import json
+import logging
+import os
+import sys
+
+import generate
+
+logger = logging.getLogger(__name__)
+
+# per-record fields that may override the command-line generation settings
+OVERRIDES = ("max_new_tokens", "temperature", "top_k", "top_p", "repetition_penalty", "num_return_sequences", "stop", "seed")
+
+
+def read_records(fh):
+    """Yield ``(index, record)`` for each non-empty input line."""
+    index = 0
+    for line in fh:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            record = {"prompt": line}
+        if isinstance(record, str):
+            record = {"prompt": record}
+        yield index, record
+        index += 1
+
+
+def completed_indices(path):
+    """Indices already written to ``path``; a truncated last line is cut off."""
+    done = set()
+    if not path or path == "-" or not os.path.exists(path):
+        return done
+    good = 0
+    with open(path, "rb") as fh:
+        for raw in fh:
+            try:
+                done.add(json.loads(raw)["index"])
+            except (ValueError, KeyError, TypeError):
+                break
+            good += len(raw)
+    with open(path, "rb+") as fh:
+        fh.truncate(good)
+    return done
+
+
+def params_for(record, defaults):
+    params = dict(defaults)
+    for name in OVERRIDES:
+        if name in record:
+            params[name] = record[name]
+    if "no_sample" in record:
+        params["do_sample"] = not record["no_sample"]
+    if "do_sample" in record:
+        params["do_sample"] = bool(record["do_sample"])
+    if isinstance(params.get("stop"), str):
+        params["stop"] = [params["stop"]]
+    return params
+
+
+def _key(params):
+    return json.dumps(params, sort_keys=True)
+
+
+def batches(records, defaults, batch_size):
+    """Group consecutive records that share generation parameters into batches."""
+    batch, key = [], None
+    for index, record in records:
+        params = params_for(record, defaults)
+        k = _key(params)
+        if batch and (k != key or len(batch) >= batch_size):
+            yield batch
+            batch = []
+        batch.append((index, record, params))
+        key = k
+    if batch:
+        yield batch
+
+
+def _texts(out):
+    texts = []
+    for item in out:
+        texts.append((item.get("generated_text") if isinstance(item, dict) else str(item)).strip())
+    return texts
+
+
+def run_batch(p, batch, cache=None):
+    """Generate one batch; return a result dict per record."""
+    params = batch[0][2]
+    prompts = [record.get("prompt", "") for _, record, _ in batch]
+    try:
+        if len(prompts) == 1:
+            outs = [generate.generate_text(p, prompts[0], cache=cache, **params)]
+        else:
+            outs = generate.generate_text(p, prompts, batch_size=len(prompts), cache=cache, **params)
+        return [_result(index, record, outputs=_texts(out)) for (index, record, _), out in zip(batch, outs)]
+    except Exception as e:
+        logger.warning("Batch starting at record %d failed: %s", batch[0][0], e)
+        return [_result(index, record, error=str(e)) for index, record, _ in batch]
+
+
+def _result(index, record, outputs=None, error=None):
+    res = {"index": index}
+    if "id" in record:
+        res["id"] = record["id"]
+    if error is not None:
+        res["error"] = error
+    else:
+        res["outputs"] = outputs
+    return res
+
+
+def core_slices(n):
+    """Split the CPUs this process may use into ``n`` contiguous slices."""
+    try:
+        cpus = sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        return [None] * n
+    n = max(1, min(n, len(cpus)))
+    size, rem = divmod(len(cpus), n)
+    slices, start = [], 0
+    for i in range(n):
+        end = start + size + (1 if i < rem else 0)
+        slices.append(cpus[start:end])
+        start = end
+    return slices
+
+
+def _pin(cores):
+    if not cores:
+        return
+    try:
+        os.sched_setaffinity(0, cores)
+    except (AttributeError, OSError):
+        return
+    try:
+        import torch
+
+        torch.set_num_threads(len(cores))
+    except Exception:
+        pass
+
+
+def _worker(worker_id, cores, load, cache_opts, tasks, results):
+    _pin(cores)
+    p, _ = generate.get_pipeline(**load)
+    cache = generate.ResponseCache(**cache_opts) if cache_opts is not None else None
+    while True:
+        batch = tasks.get()
+        if batch is None:
+            break
+        results.put((worker_id, run_batch(p, batch, cache)))
+
+
+class OrderedWriter:
+    """Write results in input order, buffering the ones that finish early."""
+
+    def __init__(self, fh, skip):
+        self.fh = fh
+        self.skip = skip
+        self.pending = {}
+        self.next = 0
+        self.written = 0
+
+    def add(self, result):
+        self.pending[result["index"]] = result
+        while True:
+            while self.next in self.skip:
+                self.next += 1
+            res = self.pending.pop(self.next, None)
+            if res is None:
+                break
+            self.fh.write(json.dumps(res, ensure_ascii=False) + "\n")
+            self.written += 1
+            self.next += 1
+        self.fh.flush()
+
+
+def run_bulk(args, logger=logger):
+    """Entry point for ``generate.py --input-jsonl``; returns a process exit code."""
+    defaults = dict(
+        max_new_tokens=args.max_new_tokens,
+        do_sample=not args.no_sample,
+        temperature=args.temperature,
+        top_k=args.top_k,
+        top_p=args.top_p,
+        repetition_penalty=args.repetition_penalty,
+        num_return_sequences=args.num_return_sequences,
+        stop=list(args.stop or ()),
+        seed=args.seed,
+    )
+    load = dict(model=args.model, device_opt=args.device, dry_run=args.dry_run, dtype=getattr(args, "precision", None), backend=getattr(args, "backend", None), draft_model=getattr(args, "draft_model", None))
+    cache_opts = None if args.no_cache else dict(directory=args.cache_dir, max_disk_bytes=int(args.cache_mb * 1024 * 1024))
+    batch_size = args.batch_size
+    if load["draft_model"] and batch_size > 1:
+        # assisted decoding drafts for one sequence at a time; batched prompts would bypass it
+        logger.info("Assisted decoding with %s: generating one prompt at a time", load["draft_model"])
+        batch_size = 1
+
+    done = completed_indices(args.output_jsonl) if args.resume else set()
+    if done:
+        logger.info("Resuming: %d records already in %s", len(done), args.output_jsonl)
+
+    in_fh = sys.stdin if args.input_jsonl == "-" else open(args.input_jsonl, "r", encoding="utf-8")
+    if not args.output_jsonl or args.output_jsonl == "-":
+        out_fh = sys.stdout
+    else:
+        out_fh = open(args.output_jsonl, "a" if args.resume else "w", encoding="utf-8")
+
+    try:
+        records = ((i, r) for i, r in read_records(in_fh) if i not in done)
+        writer = OrderedWriter(out_fh, done)
+        if args.workers <= 1:
+            try:
+                p, _ = generate.get_pipeline(logger=logger, **load)
+            except Exception:
+                logger.error("Failed to initialize generation pipeline. Ensure transformers and torch are installed or use --dry-run.")
+                return 2
+            cache = generate.ResponseCache(**cache_opts) if cache_opts is not None else None
+            for batch in batches(records, defaults, batch_size):
+                for res in run_batch(p, batch, cache):
+                    writer.add(res)
+        else:
+            try:
+                _run_workers(args.workers, load, cache_opts, batches(records, defaults, batch_size), writer)
+            except RuntimeError as e:
+                logger.error("%s", e)
+                return 2
+        logger.info("Wrote %d results", writer.written)
+    finally:
+        if in_fh is not sys.stdin:
+            in_fh.close()
+        if out_fh is not sys.stdout:
+            out_fh.close()
+    return 0
+
+
+def _run_workers(n, load, cache_opts, batch_iter, writer):
+    import multiprocessing
+
+    # spawn, not fork: torch's thread pools do not survive a fork safely
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    # each worker has its own task queue, so a batch lost with its worker is known
+    tasks = [ctx.Queue() for _ in range(n)]
+    procs = [ctx.Process(target=_worker, args=(i, cores, load, cache_opts, tasks[i], results), daemon=True) for i, cores in enumerate(core_slices(n))]
+    for proc in procs:
+        proc.start()
+
+    # keep a bounded number of batches in flight so input is streamed, not slurped;
+    # assigned[i] maps the first record index of each batch sent to worker i to the batch
+    assigned = [{} for _ in procs]
+    try:
+        for batch in batch_iter:
+            while True:
+                worker = _next_worker(procs, assigned, per_worker=2)
+                if worker is not None:
+                    break
+                _drain_one(results, writer, assigned, procs)
+            tasks[worker].put(batch)
+            assigned[worker][batch[0][0]] = batch
+        while any(assigned):
+            _drain_one(results, writer, assigned, procs)
+    finally:
+        for task_queue in tasks:
+            task_queue.put(None)
+        for proc, task_queue in zip(procs, tasks):
+            proc.join(timeout=5)
+            if proc.exitcode != 0:
+                # nobody will read what is left in a dead worker's queue
+                task_queue.cancel_join_thread()
+
+
+def _next_worker(procs, assigned, per_worker):
+    """The live worker with the fewest batches in flight, or None if every live one has ``per_worker``."""
+    live = [i for i, proc in enumerate(procs) if proc.exitcode is None]
+    if not live:
+        raise RuntimeError("all bulk workers exited")
+    worker = min(live, key=lambda i: len(assigned[i]))
+    return worker if len(assigned[worker]) < per_worker else None
+
+
+def _drain_one(results, writer, assigned, procs):
+    import queue
+
+    while True:
+        try:
+            worker, batch_results = results.get(timeout=1)
+        except queue.Empty:
+            if _fail_lost_batches(writer, assigned, procs):
+                return
+            if not any(proc.is_alive() for proc in procs):
+                raise RuntimeError("all bulk workers exited")
+            continue
+        # a batch already failed as lost is not written twice
+        if assigned[worker].pop(batch_results[0]["index"], None) is not None:
+            break
+    for res in batch_results:
+        writer.add(res)
+
+
+def _fail_lost_batches(writer, assigned, procs):
+    """Write error results for batches held by workers that have exited; return True if there were any."""
+    lost = False
+    for i, proc in enumerate(procs):
+        if proc.exitcode is None or not assigned[i]:
+            continue
+        logger.warning("Bulk worker %d exited with code %s holding %d batch(es)", i, proc.exitcode, len(assigned[i]))
+        for batch in assigned[i].values():
+            for index, record, _ in batch:
+                writer.add(_result(index, record, error=f"bulk worker exited with code {proc.exitcode}"))
+        assigned[i].clear()
+        lost = True
+    return lost
@@ -1,10 +1,25 @@
 import argparse
+import contextvars
+import copy
+import hashlib
+import json
+import os
 import sys
 import logging
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+from precision import PRECISIONS, load_int8_pipeline, model_nbytes, resolve
+from tts import TTS_ENGINES, Speaker, make_engine
 
 
 def make_mock_pipeline():
     def p(prompt, **kwargs):
+        if isinstance(prompt, (list, tuple)):
+            # batched call: one result list per prompt, like the real pipeline
+            return [p(item, **kwargs) for item in prompt]
         n = int(kwargs.get("num_return_sequences", 1) or 1)
         # include a short note about key generation params in dry-run
         info = []
@@ -17,23 +32,69 @@ def make_mock_pipeline():
         if kwargs.get("top_p") is not None:
             info.append(f"top_p={kwargs.get('top_p')}")
         info_str = " " + " ".join(info) if info else ""
-        return [{"generated_text": f"{prompt} [DRY RUN]{info_str} (seq {i+1})"} for i in range(n)]
+        stop = kwargs.get("stop")
+        if not stop:
+            return [{"generated_text": f"{prompt} [DRY RUN]{info_str} (seq {i+1})"} for i in range(n)]
+        # like a chat model, run on into an imagined next turn and cut it at a stop sequence
+        out = []
+        for i in range(n):
+            generated = f" [DRY RUN]{info_str} (seq {i+1})\nUser: (imagined turn)"
+            out.append({"generated_text": prompt + trim_at_stop(generated, stop)})
+        return out
+
+    def stream(prompt, **kwargs):
+        # emit the first sequence word by word, as a real streamer would
+        kwargs["num_return_sequences"] = 1
+        text = p(prompt, **kwargs)[0]["generated_text"]
+        for i, word in enumerate(text.split(" ")):
+            yield word if i == 0 else " " + word
 
+    p.stream = stream
+    p.backend = "mock"
     return p
 
 
-def init_pipeline(model="distilgpt2", device_opt="cpu", dry_run=False, logger=None):
+# Where int8-quantized models are kept between runs (--quant-cache); None disables
+QUANT_CACHE_DIR = os.environ.get("QUANT_CACHE_DIR") or None
+
+# Inference backends: the transformers pipeline, ONNX Runtime (onnx_backend.py)
+# and the dry-run mock. All return the same pipeline-style callable.
+BACKENDS = ("transformers", "onnx", "mock")
+# Where --backend onnx keeps exported models (--onnx-cache)
+ONNX_CACHE_DIR = os.environ.get("ONNX_CACHE_DIR") or os.path.join("models", "onnx")
+# ONNX Runtime intra-op threads (--onnx-threads); 0 lets it use every core
+ONNX_THREADS = int(os.environ.get("ONNX_THREADS", "0") or 0)
+
+
+def backend_of(pipeline_callable):
+    """Name of the backend a pipeline runs on; plain transformers pipelines do not say."""
+    return getattr(pipeline_callable, "backend", "transformers")
+
+
+def init_pipeline(model="distilgpt2", device_opt="cpu", dry_run=False, logger=None, dtype=None, backend=None, draft_model=None):
     """Initialize and return a generation pipeline (callable). Returns (pipeline_callable, device).
 
-    If dry_run is True, returns the mock pipeline.
+    If dry_run is True (or ``backend`` is ``"mock"``), returns the mock
+    pipeline. ``backend="onnx"`` runs the model with ONNX Runtime, exporting
+    it to ``ONNX_CACHE_DIR`` on first use. ``dtype`` optionally names a
+    torch dtype (e.g. ``"float32"``, ``"bfloat16"``) to load the weights in, a
+    precision from ``precision.PRECISIONS`` (``"fp32"``, ``"bf16"``), or
+    ``"int8"`` for dynamic int8 quantization (CPU only; converted models are
+    cached in ``QUANT_CACHE_DIR`` when set). ``draft_model`` names a smaller
+    model with the same tokenizer to draft tokens for assisted decoding
+    (transformers backend only; see speculative.py).
     """
     if logger is None:
         import logging
 
         logger = logging.getLogger(__name__)
 
-    if dry_run:
+    if dry_run or backend == "mock":
         return make_mock_pipeline(), "dry"
+    if backend not in (None, "transformers", "onnx"):
+        raise ValueError(f"unknown backend {backend!r}; choose from {', '.join(BACKENDS)}")
+    if draft_model and backend == "onnx":
+        raise ValueError("assisted decoding with a draft model needs the transformers backend")
 
     try:
         from transformers import pipeline, set_seed
@@ -57,25 +118,740 @@ def init_pipeline(model="distilgpt2", device_opt="cpu", dry_run=False, logger=No
         except Exception:
             device = -1
 
-    logger.info("Loading model %s on device %s", model, device_opt)
-    p = pipeline("text-generation", model=model, device=device)
+    dtype = resolve(dtype)
+    logger.info("Loading model %s on device %s%s%s", model, device_opt, f" ({dtype})" if dtype else "", " with ONNX Runtime" if backend == "onnx" else "")
+    if backend == "onnx":
+        from onnx_backend import load_onnx_pipeline
+
+        p = load_onnx_pipeline(model, device, precision=dtype, cache_dir=ONNX_CACHE_DIR, threads=ONNX_THREADS, log=logger)
+    elif dtype == "int8":
+        p = load_int8_pipeline(model, device, cache_dir=QUANT_CACHE_DIR, log=logger)
+    else:
+        kwargs = {}
+        if dtype:
+            import torch
+
+            kwargs["torch_dtype"] = getattr(torch, dtype)
+        p = pipeline("text-generation", model=model, device=device, **kwargs)
+    prepare_tokenizer(p)
+    if draft_model:
+        from speculative import AssistedPipeline, load_draft
+
+        p = AssistedPipeline(p, load_draft(draft_model, p.model, dtype, log=logger), draft_model)
     return p, device
 
 
-def generate_text(pipeline_callable, prompt, max_new_tokens=120, do_sample=True, temperature=0.8, top_k=0, top_p=0.92, repetition_penalty=1.15, num_return_sequences=1):
-    return pipeline_callable(
-        prompt,
+def prepare_tokenizer(p):
+    """Make the pipeline's tokenizer safe for padded (batched) generation.
+
+    Ensures a pad token exists, falling back to EOS, and pads on the left as
+    decoder-only models require. Over-long prompts are truncated on the left
+    too, so it is the oldest text that is dropped, not the newest.
+    """
+    try:
+        tokenizer = getattr(p, "tokenizer", None)
+        if tokenizer is not None:
+            if getattr(tokenizer, "pad_token", None) is None:
+                # fall back to eos token if available
+                if getattr(tokenizer, "eos_token", None) is not None:
+                    try:
+                        tokenizer.pad_token = tokenizer.eos_token
+                        if getattr(tokenizer, "eos_token_id", None) is not None:
+                            tokenizer.pad_token_id = tokenizer.eos_token_id
+                    except Exception:
+                        pass
+            tokenizer.padding_side = "left"
+            tokenizer.truncation_side = "left"
+    except Exception:
+        pass
+
+
+def _pipeline_nbytes(p):
+    """Best-effort size in bytes of the weights held by a pipeline, including any draft model."""
+    model = getattr(p, "model", None)
+    if model is None:
+        return 0
+    return _model_nbytes(model) + _model_nbytes(getattr(p, "draft_model", None))
+
+
+def _model_nbytes(model):
+    if model is None:
+        return 0
+    try:
+        # unlike get_memory_footprint, this counts int8 packed weights
+        return model_nbytes(model)
+    except Exception:
+        pass
+    try:
+        return int(model.get_memory_footprint())
+    except Exception:
+        pass
+    try:
+        return sum(t.numel() * t.element_size() for t in model.parameters())
+    except Exception:
+        return 0
+
+
+class PipelineRegistry:
+    """Process-wide cache of loaded pipelines keyed by (model, device, dtype, backend, draft model).
+
+    Entries are kept in LRU order and evicted when either ``max_entries`` or
+    ``max_bytes`` (0 disables the byte budget) would be exceeded. Loading is
+    single-flight: concurrent callers asking for the same key wait for the
+    first caller's load instead of starting their own.
+    """
+
+    def __init__(self, max_entries=2, max_bytes=0, loader=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._loader = loader or init_pipeline
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._loading = {}
+        self.loads = 0
+        self.hits = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(model, device_opt, dtype=None, dry_run=False, backend=None, draft_model=None):
+        dry_run = dry_run or backend == "mock"
+        device = "dry" if dry_run else str(device_opt).lower()
+        # the mock ignores draft models, so they do not split its entry
+        return (model, device, resolve(dtype) or "default", "mock" if dry_run else backend or "transformers", None if dry_run else draft_model or None)
+
+    def get(self, model="distilgpt2", device_opt="cpu", dry_run=False, dtype=None, logger=None, backend=None, draft_model=None):
+        """Return ``(pipeline_callable, device)``, loading it on first use."""
+        key = self.make_key(model, device_opt, dtype, dry_run, backend, draft_model)
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry["pipeline"], entry["device"]
+                event = self._loading.get(key)
+                if event is None:
+                    event = threading.Event()
+                    self._loading[key] = event
+                    break
+            # another thread is loading this key; wait and look again
+            event.wait()
+
+        try:
+            with metrics.stage("model_load"):
+                p, device = self._loader(model=model, device_opt=device_opt, dry_run=dry_run, logger=logger, dtype=dtype, backend=backend, draft_model=draft_model)
+            nbytes = _pipeline_nbytes(p)
+            with self._lock:
+                self.loads += 1
+                self._entries[key] = {"pipeline": p, "device": device, "nbytes": nbytes}
+                self._evict_locked(keep=key)
+            return p, device
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+            event.set()
+
+    def _evict_locked(self, keep=None):
+        def over_budget():
+            if self.max_entries and len(self._entries) > self.max_entries:
+                return True
+            if self.max_bytes and sum(e["nbytes"] for e in self._entries.values()) > self.max_bytes:
+                return True
+            return False
+
+        while over_budget():
+            victim = next((k for k in self._entries if k != keep), None)
+            if victim is None:
+                break
+            del self._entries[victim]
+            self.evictions += 1
+
+    def warm_up(self, specs, logger=None):
+        """Load each ``(model, device_opt[, dtype[, backend]])`` spec ahead of the first request; return the specs that failed."""
+        failed = []
+        for spec in specs:
+            model, device_opt = spec[0], spec[1]
+            dtype = spec[2] if len(spec) > 2 else None
+            backend = spec[3] if len(spec) > 3 else None
+            try:
+                self.get(model=model, device_opt=device_opt, dtype=dtype, logger=logger, backend=backend)
+            except Exception:
+                (logger or logging.getLogger(__name__)).warning("Warm-up failed for %s on %s", model, device_opt)
+                failed.append(spec)
+        return failed
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "loads": self.loads,
+                "hits": self.hits,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": sum(e["nbytes"] for e in self._entries.values()),
+                "keys": [list(k) for k in self._entries],
+            }
+
+
+registry = PipelineRegistry()
+
+
+def get_pipeline(model="distilgpt2", device_opt="cpu", dry_run=False, dtype=None, logger=None, backend=None, draft_model=None):
+    """Return a cached pipeline from the process-wide registry."""
+    return registry.get(model=model, device_opt=device_opt, dry_run=dry_run, dtype=dtype, logger=logger, backend=backend, draft_model=draft_model)
+
+
+def parse_warmup_spec(spec):
+    """Parse ``"model[@device[@dtype[@backend]]],..."`` into registry warm-up tuples."""
+    specs = []
+    for item in (spec or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        parts = item.split("@")
+        model = parts[0]
+        device_opt = parts[1] if len(parts) > 1 and parts[1] else "cpu"
+        dtype = parts[2] if len(parts) > 2 and parts[2] else None
+        backend = parts[3] if len(parts) > 3 and parts[3] else None
+        specs.append((model, device_opt, dtype, backend) if backend else (model, device_opt, dtype))
+    return specs
+
+
+# Chat prompts are "User:"/"AI:" transcripts; stop before the model writes the next turn itself
+CHAT_STOP_SEQUENCES = ("\nUser:", "\nAI:")
+
+
+def trim_at_stop(text, stop):
+    """Cut ``text`` at the earliest occurrence of any stop sequence."""
+    cut = len(text)
+    for s in stop or ():
+        idx = text.find(s)
+        if idx != -1 and idx < cut:
+            cut = idx
+    return text[:cut]
+
+
+def make_stopping_criteria(tokenizer, stop, prompt_length=None):
+    """Build a ``StoppingCriteriaList`` that ends each sequence once it emits a stop sequence.
+
+    The check runs inside the decode loop, decoding only the last few tokens
+    of each row, and reports per-row so batched and multi-sequence generation
+    stop rows independently. ``prompt_length`` is the number of prompt tokens;
+    if omitted it is inferred on the first step.
+    """
+    from transformers import StoppingCriteria, StoppingCriteriaList
+    import torch
+
+    stop = [s for s in stop if s]
+    # a stop sequence of n characters spans at most n tokens
+    window = max(len(s) for s in stop) + 1
+
+    class StopOnSequences(StoppingCriteria):
+        def __init__(self):
+            self.prompt_length = prompt_length
+
+        def __call__(self, input_ids, scores, **kwargs):
+            if self.prompt_length is None:
+                self.prompt_length = input_ids.shape[1] - 1
+            done = []
+            for row in input_ids:
+                generated = row[self.prompt_length:]
+                tail = tokenizer.decode(generated[-window:], skip_special_tokens=True)
+                done.append(any(s in tail for s in stop))
+            return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+    return StoppingCriteriaList([StopOnSequences()])
+
+
+class DeadlineExceeded(TimeoutError):
+    """A request ran out of time before or during generation."""
+
+
+def make_deadline_criteria(deadline):
+    """A stopping criterion that ends every row once ``time.monotonic()`` reaches ``deadline``.
+
+    Its ``fired`` attribute tells the caller afterwards whether the output was cut short.
+    """
+    from transformers import StoppingCriteria
+    import torch
+
+    class StopAtDeadline(StoppingCriteria):
+        def __init__(self):
+            self.fired = False
+
+        def __call__(self, input_ids, scores, **kwargs):
+            if time.monotonic() >= deadline:
+                self.fired = True
+            return torch.full((input_ids.shape[0],), self.fired, dtype=torch.bool, device=input_ids.device)
+
+    return StopAtDeadline()
+
+
+class SeededSampler:
+    """Logits processor that draws each next token from its own ``torch.Generator``.
+
+    ``transformers.set_seed`` reseeds the process-wide RNG, which every
+    concurrent generation draws from, so a pinned seed alone does not make
+    output reproducible. This processor makes the draw itself with private
+    generators and masks every other token, so generate's own sampling step
+    can only pick the drawn one. Row ``r`` uses seed ``seed + r % sequences``:
+    a prompt's sequences differ from each other, and do not depend on the
+    other prompts in a batch.
+    """
+
+    def __init__(self, seed, sequences=1):
+        self.seed = int(seed)
+        self.sequences = max(1, int(sequences))
+        self._generators = None
+
+    def __call__(self, input_ids, scores):
+        import torch
+
+        if self._generators is None:
+            self._generators = []
+            for row in range(scores.shape[0]):
+                g = torch.Generator(device=scores.device)
+                g.manual_seed(self.seed + row % self.sequences)
+                self._generators.append(g)
+        probs = torch.softmax(scores.float(), dim=-1)
+        picked = torch.cat([torch.multinomial(probs[row], 1, generator=g) for row, g in enumerate(self._generators)])
+        out = torch.full_like(scores, float("-inf"))
+        return out.scatter_(1, picked[:, None], 0.0)
+
+
+def seeded_sampling(gen_kwargs, seed, temperature, top_k, top_p, sequences=1):
+    """Append the sampling warpers and a ``SeededSampler`` to ``gen_kwargs["logits_processor"]``.
+
+    generate runs custom processors before its own warpers, so the sampler
+    applies ``temperature``, ``top_k`` and ``top_p`` itself first; the
+    warpers that follow leave its one-token distribution unchanged.
+    """
+    from transformers import TemperatureLogitsWarper, TopKLogitsWarper, TopPLogitsWarper
+
+    if temperature is not None and temperature != 1.0:
+        add_logits_processor(gen_kwargs, TemperatureLogitsWarper(temperature))
+    if top_k:
+        add_logits_processor(gen_kwargs, TopKLogitsWarper(top_k=top_k))
+    if top_p is not None and top_p < 1.0:
+        add_logits_processor(gen_kwargs, TopPLogitsWarper(top_p=top_p))
+    add_logits_processor(gen_kwargs, SeededSampler(seed, sequences))
+
+
+def make_cancel_criteria(event):
+    """A stopping criterion that ends every row once ``event`` (a ``threading.Event``) is set."""
+    from transformers import StoppingCriteria
+    import torch
+
+    class StopOnCancel(StoppingCriteria):
+        def __call__(self, input_ids, scores, **kwargs):
+            return torch.full((input_ids.shape[0],), event.is_set(), dtype=torch.bool, device=input_ids.device)
+
+    return StopOnCancel()
+
+
+def add_stopping_criteria(gen_kwargs, criteria):
+    """Append ``criteria`` to ``gen_kwargs["stopping_criteria"]``, creating the list if needed."""
+    from transformers import StoppingCriteriaList
+
+    gen_kwargs["stopping_criteria"] = StoppingCriteriaList(list(gen_kwargs.get("stopping_criteria") or []) + [criteria])
+
+
+def _trim_outputs(out, stop):
+    """Apply ``trim_at_stop`` to pipeline output (a result list, or one per prompt)."""
+    trimmed = []
+    for item in out:
+        if isinstance(item, list):
+            trimmed.append(_trim_outputs(item, stop))
+        elif isinstance(item, dict) and "generated_text" in item:
+            trimmed.append(dict(item, generated_text=trim_at_stop(item["generated_text"], stop)))
+        else:
+            trimmed.append(item)
+    return trimmed
+
+
+def model_id(pipeline_callable):
+    """Identify the model behind a pipeline, for cache keys."""
+    model = getattr(pipeline_callable, "model", None)
+    if model is None:
+        return "dry-run"
+    name = getattr(model, "name_or_path", None) or getattr(getattr(model, "config", None), "_name_or_path", None) or type(model).__name__
+    # int8 models report their float dtype, so check for the quantization mark first
+    dtype = getattr(model, "quantized_precision", None) or getattr(model, "dtype", None)
+    ident = f"{name}:{dtype}" if dtype is not None else str(name)
+    # backends differ in floating-point detail, so their outputs are cached apart
+    backend = backend_of(pipeline_callable)
+    ident = ident if backend == "transformers" else f"{ident}:{backend}"
+    # sampled output depends on the draft model too
+    draft = getattr(pipeline_callable, "draft_name", None)
+    return f"{ident}+{draft}" if draft else ident
+
+
+class ResponseCache:
+    """Content-addressed cache of generation results.
+
+    Keys are SHA-256 hashes of the model id, prompt and every generation
+    parameter in canonical JSON form. Results live in an in-memory LRU and,
+    when ``directory`` is set, in one JSON file per key on disk, evicting the
+    least recently used files once they exceed ``max_disk_bytes``. Only
+    deterministic requests are cached: greedy decoding, or sampling with a
+    pinned seed.
+    """
+
+    def __init__(self, max_entries=256, directory=None, max_disk_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._disk_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.skipped = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._disk_bytes = sum(size for _, _, size in self._disk_files())
+
+    @staticmethod
+    def cacheable(params):
+        return not params.get("do_sample", True) or params.get("seed") is not None
+
+    def key_for(self, pipeline_callable, prompt, params):
+        """Return the cache key for a request, or None if it must not be cached."""
+        if not self.cacheable(params):
+            with self._lock:
+                self.skipped += 1
+            return None
+        try:
+            payload = json.dumps({"model": model_id(pipeline_callable), "prompt": prompt, "params": params}, sort_keys=True, separators=(",", ":"))
+        except (TypeError, ValueError):
+            # non-serializable arguments (streamers, criteria objects) are not cacheable
+            with self._lock:
+                self.skipped += 1
+            return None
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def _disk_files(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".json"):
+                    path = os.path.join(root, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    yield path, st.st_mtime, st.st_size
+
+    def get(self, key):
+        """Return a cached result or None."""
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(value)
+        if self.directory:
+            path = self._path(key)
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    value = json.load(f)
+                os.utime(path)
+            except (OSError, ValueError):
+                value = None
+            if value is not None:
+                self._remember(key, value)
+                with self._lock:
+                    self.hits += 1
+                    self.disk_hits += 1
+                return copy.deepcopy(value)
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, value):
+        self._remember(key, copy.deepcopy(value))
+        if self.directory:
+            self._write(key, value)
+
+    def _remember(self, key, value):
+        with self._lock:
+            self._memory[key] = value
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def _write(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = json.dumps(value, ensure_ascii=False).encode("utf-8")
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            return
+        with self._lock:
+            self._disk_bytes += len(data)
+            over = self.max_disk_bytes and self._disk_bytes > self.max_disk_bytes
+        if over:
+            self._evict_disk()
+
+    def _evict_disk(self):
+        files = sorted(self._disk_files(), key=lambda f: f[1])
+        total = sum(size for _, _, size in files)
+        for path, _, size in files:
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.unlink(path)
+                total -= size
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_bytes = total
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "skipped": self.skipped,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+                "entries": len(self._memory),
+                "disk_bytes": self._disk_bytes,
+            }
+
+
+def generate_text(pipeline_callable, prompt, max_new_tokens=120, do_sample=True, temperature=0.8, top_k=0, top_p=0.92, repetition_penalty=1.15, num_return_sequences=1, stop=None, seed=None, cache=None, deadline=None, input_ids=None, **extra):
+    """Run the pipeline with the repo's default generation settings.
+
+    ``stop`` is an optional sequence of strings; each returned sequence ends
+    before the first one it produces, and decoding of that sequence halts
+    inside the generation loop as soon as one appears. ``seed`` makes sampling
+    reproducible: the call draws from its own generator (see ``SeededSampler``). With a ``ResponseCache`` as ``cache``,
+    deterministic requests are answered from it when possible. ``deadline``
+    is a ``time.monotonic()`` value; decoding stops when it is reached and
+    ``DeadlineExceeded`` is raised instead of returning truncated text.
+    ``input_ids`` may carry the already tokenized prompt (one id list, or one
+    per prompt when ``prompt`` is a list); pipelines with a model then
+    generate from it without re-tokenizing, and ``prompt`` is only the cache key.
+    """
+    key = None
+    if cache is not None:
+        params = dict(
+            max_new_tokens=max_new_tokens,
+            do_sample=do_sample,
+            temperature=temperature,
+            top_k=top_k,
+            top_p=top_p,
+            repetition_penalty=repetition_penalty,
+            num_return_sequences=num_return_sequences,
+            stop=list(stop or ()),
+            seed=seed,
+            **extra,
+        )
+        key = cache.key_for(pipeline_callable, prompt, params)
+        if key is not None:
+            hit = cache.get(key)
+            if hit is not None:
+                return hit
+    out = _run_pipeline(pipeline_callable, prompt, max_new_tokens, do_sample, temperature, top_k, top_p, repetition_penalty, num_return_sequences, stop, seed, deadline, input_ids, extra)
+    if key is not None:
+        cache.put(key, out)
+    return out
+
+
+def _run_pipeline(pipeline_callable, prompt, max_new_tokens, do_sample, temperature, top_k, top_p, repetition_penalty, num_return_sequences, stop, seed, deadline, input_ids, extra):
+    if deadline is not None and time.monotonic() >= deadline:
+        raise DeadlineExceeded("deadline passed before generation started")
+    stop = tuple(s for s in (stop or ()) if s)
+    if stop:
+        tokenizer = getattr(pipeline_callable, "tokenizer", None)
+        if tokenizer is None:
+            # pipelines without a tokenizer (the dry-run mock) take the strings directly
+            extra["stop"] = stop
+            stop = ()
+        else:
+            for criterion in make_stopping_criteria(tokenizer, stop):
+                add_stopping_criteria(extra, criterion)
+    timer = None
+    at_deadline = None
+    if getattr(pipeline_callable, "model", None) is not None:
+        if seed is not None and do_sample:
+            seeded_sampling(extra, seed, temperature, top_k, top_p, num_return_sequences)
+        timer = metrics.DecodeTimer()
+        add_logits_processor(extra, timer)
+        if deadline is not None:
+            at_deadline = make_deadline_criteria(deadline)
+            add_stopping_criteria(extra, at_deadline)
+    kwargs = dict(
         max_new_tokens=max_new_tokens,
         do_sample=do_sample,
         temperature=temperature,
         top_k=top_k,
         top_p=top_p,
         repetition_penalty=repetition_penalty,
-        return_full_text=False,
         num_return_sequences=num_return_sequences,
-        truncation=True,
         pad_token_id=50256,
+        **extra,
     )
+    if input_ids and getattr(pipeline_callable, "model", None) is not None:
+        # the pipeline would tokenize the text again; the ids go to the model as they are
+        from_ids = getattr(pipeline_callable, "from_ids", None)
+        out = from_ids(input_ids, **kwargs) if from_ids is not None else generate_from_ids(pipeline_callable, input_ids, **kwargs)
+    else:
+        out = pipeline_callable(prompt, return_full_text=False, truncation=True, **kwargs)
+    if timer is not None:
+        timer.finish()
+    if at_deadline is not None and at_deadline.fired:
+        raise DeadlineExceeded("generation stopped at the request deadline")
+    return _trim_outputs(out, stop) if stop else out
+
+
+def generate_from_ids(pipeline_callable, input_ids, max_new_tokens=120, num_return_sequences=1, pad_token_id=None, batch_size=None, **gen_kwargs):
+    """Call the pipeline's model on prompts that are already token ids.
+
+    Returns what the pipeline returns with ``return_full_text=False``.
+    ``input_ids`` is one prompt's ids, or a list of them; several are left-padded
+    into one batch and get one result list each. Nothing is truncated.
+    """
+    import torch
+
+    tokenizer = pipeline_callable.tokenizer
+    model = pipeline_callable.model
+    batched = not isinstance(input_ids[0], int)
+    rows = [list(ids) for ids in input_ids] if batched else [list(input_ids)]
+    pad = tokenizer.pad_token_id if tokenizer.pad_token_id is not None else pad_token_id
+    width = max(len(row) for row in rows)
+    ids = torch.tensor([[pad] * (width - len(row)) + row for row in rows], device=model.device)
+    mask = torch.tensor([[0] * (width - len(row)) + [1] * len(row) for row in rows], device=model.device)
+    with torch.no_grad():
+        sequences = model.generate(
+            input_ids=ids, attention_mask=mask, max_new_tokens=max_new_tokens, num_return_sequences=num_return_sequences, pad_token_id=pad_token_id, **gen_kwargs
+        )
+    # decoded the way the pipeline does: new tokens only, special tokens dropped
+    texts = tokenizer.batch_decode(sequences[:, width:], skip_special_tokens=True, clean_up_tokenization_spaces=True)
+    results = [[{"generated_text": text} for text in texts[i:i + num_return_sequences]] for i in range(0, len(texts), num_return_sequences)]
+    return results if batched else results[0]
+
+
+def add_logits_processor(gen_kwargs, processor):
+    """Append ``processor`` to ``gen_kwargs["logits_processor"]``, creating the list if needed."""
+    from transformers import LogitsProcessorList
+
+    gen_kwargs["logits_processor"] = LogitsProcessorList(list(gen_kwargs.get("logits_processor") or []) + [processor])
+
+
+def stream_text(pipeline_callable, prompt, max_new_tokens=120, do_sample=True, temperature=0.8, top_k=0, top_p=0.92, repetition_penalty=1.15, stop=None, seed=None, deadline=None, cancel=None, input_ids=None):
+    """Yield generated text incrementally instead of returning it all at the end.
+
+    Uses the pipeline's own ``stream`` method when it has one (the dry-run mock
+    does), otherwise runs generation on a worker thread with a
+    ``TextIteratorStreamer`` attached. Only a single sequence is streamed.
+    With ``stop``, text that could be the start of a stop sequence is held
+    back until it is known not to be one, and streaming ends at the first match.
+    Past ``deadline`` the stream ends by raising ``DeadlineExceeded``. Once
+    ``cancel`` (a ``threading.Event``) is set, decoding stops at the next
+    token and the stream ends quietly; use it when the consumer goes away.
+    ``input_ids`` is the tokenized prompt, as for ``generate_text``.
+    """
+    stop = tuple(s for s in (stop or ()) if s)
+    chunks = _stream_chunks(pipeline_callable, prompt, max_new_tokens, do_sample, temperature, top_k, top_p, repetition_penalty, stop, seed, deadline, cancel, input_ids)
+    if not stop or getattr(pipeline_callable, "stream", None) is not None:
+        # a pipeline with its own stream method applies ``stop`` itself
+        yield from chunks
+        return
+
+    hold = max(len(s) for s in stop) - 1
+    buf = ""
+    for chunk in chunks:
+        buf += chunk
+        trimmed = trim_at_stop(buf, stop)
+        if len(trimmed) < len(buf):
+            if trimmed:
+                yield trimmed
+            return
+        if len(buf) > hold:
+            yield buf[:len(buf) - hold]
+            buf = buf[len(buf) - hold:]
+    if buf:
+        yield buf
+
+
+def _stream_chunks(pipeline_callable, prompt, max_new_tokens, do_sample, temperature, top_k, top_p, repetition_penalty, stop, seed, deadline=None, cancel=None, input_ids=None):
+    kwargs = dict(
+        max_new_tokens=max_new_tokens,
+        do_sample=do_sample,
+        temperature=temperature,
+        top_k=top_k,
+        top_p=top_p,
+        repetition_penalty=repetition_penalty,
+    )
+    if stop:
+        kwargs["stop"] = stop
+    if deadline is not None and time.monotonic() >= deadline:
+        raise DeadlineExceeded("deadline passed before generation started")
+    stream = getattr(pipeline_callable, "stream", None)
+    if stream is not None:
+        for chunk in stream(prompt, **kwargs):
+            if cancel is not None and cancel.is_set():
+                return
+            yield chunk
+        return
+
+    from transformers import TextIteratorStreamer
+
+    streamer = TextIteratorStreamer(pipeline_callable.tokenizer, skip_prompt=True, skip_special_tokens=True)
+    if cancel is not None:
+        add_stopping_criteria(kwargs, make_cancel_criteria(cancel))
+    errors = []
+
+    def run():
+        try:
+            generate_text(pipeline_callable, prompt, num_return_sequences=1, seed=seed, deadline=deadline, input_ids=input_ids, streamer=streamer, **kwargs)
+        except Exception as e:
+            errors.append(e)
+            streamer.end()
+
+    # run in a copy of this context so stage timings reach the caller's collector
+    worker = threading.Thread(target=contextvars.copy_context().run, args=(run,), daemon=True)
+    worker.start()
+    for chunk in streamer:
+        if chunk:
+            yield chunk
+    worker.join()
+    if errors:
+        raise errors[0]
+
+
+def build_chat_prompt(turns):
+    """Format conversation turns as a ``User:``/``AI:`` transcript ending in ``AI:``."""
+    lines = []
+    for msg in turns:
+        prefix = "User: " if msg["role"] == "user" else "AI: "
+        lines.append(prefix + msg["text"])
+    return "\n".join(lines) + "\nAI:"
+
+
+def save_turn(history, session, role, text, logger):
+    """Append one REPL turn to the conversation store, if there is one; return its id."""
+    if history is None:
+        return None
+    try:
+        with metrics.stage("persist"):
+            return history.append(session, role, text)
+    except Exception:
+        logger.debug("Failed to save history")
+        return None
 
 
 def main(argv=None):
@@ -85,6 +861,12 @@ def main(argv=None):
     parser.add_argument("--file", "-f", help="Read prompt from a file")
     parser.add_argument("--model", "-m", default="distilgpt2", help="Model identifier to pass to transformers pipeline")
     parser.add_argument("--device", "-d", default="cpu", help="Device to run on: 'cpu', 'cuda', or integer GPU id (default: cpu)")
+    parser.add_argument("--precision", choices=sorted(PRECISIONS), help="Weight precision: fp32, bf16 or int8 (dynamic quantization, CPU only; default: the model's own)")
+    parser.add_argument("--quant-cache", help="Directory to keep int8-quantized models in between runs (default: $QUANT_CACHE_DIR)")
+    parser.add_argument("--backend", choices=BACKENDS, default="transformers", help="Inference backend: transformers, onnx (ONNX Runtime, CPU) or mock (same as --dry-run; default: transformers)")
+    parser.add_argument("--onnx-cache", help="Directory for --backend onnx exports (default: $ONNX_CACHE_DIR or models/onnx)")
+    parser.add_argument("--onnx-threads", type=int, help="ONNX Runtime intra-op threads (default: $ONNX_THREADS, 0 = all cores)")
+    parser.add_argument("--draft-model", help="Smaller model with the same tokenizer to draft tokens for assisted (speculative) decoding; greedy output is unchanged")
     parser.add_argument("--num-return-sequences", "-n", type=int, default=1, help="Number of returned sequences (default: 1)")
     parser.add_argument("--max-new-tokens", type=int, default=120, help="Maximum number of new tokens to generate (default: 120)")
     parser.add_argument("--temperature", type=float, default=0.8, help="Sampling temperature (default: 0.8)")
@@ -92,19 +874,64 @@ def main(argv=None):
     parser.add_argument("--top-p", type=float, default=0.92, help="Top-p (nucleus) sampling (default: 0.92)")
     parser.add_argument("--repetition-penalty", type=float, default=1.15, help="Repetition penalty (default: 1.15)")
     parser.add_argument("--no-sample", action="store_true", help="Disable sampling (use greedy decoding)")
+    parser.add_argument("--stop", action="append", help="Stop generating when this text appears; repeatable, escapes like \\n allowed (REPL default: '\\nUser:' and '\\nAI:')")
+    parser.add_argument("--no-stop", action="store_true", help="Disable stop sequences, including the REPL defaults")
+    parser.add_argument("--seed", type=int, help="Pin the sampling seed; makes sampled output reproducible and cacheable")
+    parser.add_argument("--cache-dir", help="Directory for the on-disk response cache of deterministic generations")
+    parser.add_argument("--cache-mb", type=float, default=64, help="Size budget of the on-disk response cache in MB (default: 64)")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the response cache")
     parser.add_argument("--dry-run", action="store_true", help="Run without importing heavy libraries")
     parser.add_argument("--repl", action="store_true", help="Enter conversational REPL mode")
-    parser.add_argument("--tts", action="store_true", help="Speak responses using pyttsx3 if available")
-    parser.add_argument("--history-file", default="conversation.json", help="File to persist conversation history in REPL mode")
+    parser.add_argument("--tts", action="store_true", help="Speak responses a sentence at a time, in the background (with --stream, as soon as each sentence is generated)")
+    parser.add_argument("--tts-engine", choices=TTS_ENGINES, default="pyttsx3", help="Speech engine for --tts: pyttsx3 or null (speaks nothing, for headless runs; default: pyttsx3)")
+    parser.add_argument("--history-file", default="conversation.json", help="Legacy JSON history to import into the history database in REPL mode")
+    parser.add_argument("--history-db", default="conversation.db", help="SQLite database for REPL conversation history (default: conversation.db)")
+    parser.add_argument("--session", default="repl", help="Conversation session name in the history database (default: repl)")
+    parser.add_argument("--context", action="store_true", help="In REPL mode, include as many recent turns in the prompt as fit the model's context")
+    parser.add_argument("--kv-cache", action="store_true", help="In REPL mode, imply --context and reuse the KV cache of earlier turns")
+    parser.add_argument("--stream", action="store_true", help="Print tokens as they are generated (single sequence only)")
+    parser.add_argument("--input-jsonl", help="Bulk mode: read prompts from this JSONL file ('-' for stdin), one {\"prompt\": ...} per line")
+    parser.add_argument("--output-jsonl", default="-", help="Bulk mode: write results here in input order (default: stdout)")
+    parser.add_argument("--batch-size", type=int, default=8, help="Bulk mode: prompts generated together per batch (default: 8)")
+    parser.add_argument("--workers", type=int, default=1, help="Bulk mode: worker processes, each pinned to its own CPU cores (default: 1)")
+    parser.add_argument("--resume", action="store_true", help="Bulk mode: skip records already in --output-jsonl and append the rest")
+    parser.add_argument("--profile", action="store_true", help="Print a per-stage timing breakdown (model load, prefill, decode, ...) to stderr")
     args = parser.parse_args(argv)
+    if args.stop:
+        args.stop = [s.replace("\\n", "\n").replace("\\t", "\t") for s in args.stop]
+
+    if not args.profile:
+        return run(args)
+    with metrics.collect() as timings:
+        try:
+            return run(args)
+        finally:
+            sys.stderr.write("\n--- profile ---\n" + timings.report() + "\n")
+
+
+def run(args):
+    """Carry out the command line parsed by ``main``; returns the exit code."""
+    global QUANT_CACHE_DIR, ONNX_CACHE_DIR, ONNX_THREADS
 
     prompt = args.prompt
+    # also exported so bulk-mode worker processes see them
+    if getattr(args, "quant_cache", None):
+        os.environ["QUANT_CACHE_DIR"] = QUANT_CACHE_DIR = args.quant_cache
+    if getattr(args, "onnx_cache", None):
+        os.environ["ONNX_CACHE_DIR"] = ONNX_CACHE_DIR = args.onnx_cache
+    if getattr(args, "onnx_threads", None) is not None:
+        ONNX_THREADS = args.onnx_threads
+        os.environ["ONNX_THREADS"] = str(args.onnx_threads)
 
     # basic logging
     logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
     logger = logging.getLogger(__name__)
 
     logger.info("Starting generation (dry-run=%s)", args.dry_run)
+    if args.input_jsonl:
+        from bulk import run_bulk
+
+        return run_bulk(args, logger)
     if not prompt and args.file:
         try:
             with open(args.file, "r", encoding="utf-8") as fh:
@@ -133,113 +960,206 @@ def main(argv=None):
 
     # Initialize pipeline (use single init function to avoid duplication)
     try:
-        p, device = init_pipeline(model=args.model, device_opt=args.device, dry_run=args.dry_run, logger=logger)
+        p, device = get_pipeline(model=args.model, device_opt=args.device, dry_run=args.dry_run, dtype=args.precision, logger=logger, backend=args.backend, draft_model=args.draft_model)
     except Exception:
         logger.error("Failed to initialize generation pipeline. Ensure transformers and torch are installed or use --dry-run.")
         return 2
 
     # Ensure tokenizer has a pad token to silence warnings when padding is needed
-    try:
-        tokenizer = getattr(p, "tokenizer", None)
-        if tokenizer is not None:
-            if getattr(tokenizer, "pad_token", None) is None:
-                # fall back to eos token if available
-                if getattr(tokenizer, "eos_token", None) is not None:
-                    try:
-                        tokenizer.pad_token = tokenizer.eos_token
-                        if getattr(tokenizer, "eos_token_id", None) is not None:
-                            tokenizer.pad_token_id = tokenizer.eos_token_id
-                    except Exception:
-                        pass
-    except Exception:
-        pass
+    prepare_tokenizer(p)
 
     do_sample = not args.no_sample
 
-    # try to import TTS engine if requested
-    tts_engine = None
+    # speech runs on its own thread, so replies are spoken while the REPL moves on
+    speaker = None
     if args.tts:
         try:
-            import pyttsx3
-
-            tts_engine = pyttsx3.init()
+            speaker = Speaker(make_engine(args.tts_engine))
         except Exception:
-            logger.warning("pyttsx3 not available; TTS disabled")
-            tts_engine = None
+            logger.warning("%s not available; TTS disabled", args.tts_engine)
+
+    # stop sequences: --stop values, else the chat defaults in REPL mode
+    if args.no_stop:
+        stop = ()
+    elif args.stop:
+        stop = tuple(args.stop)
+    else:
+        stop = CHAT_STOP_SEQUENCES if args.repl else ()
+
+    cache = None
+    if not args.no_cache:
+        cache = ResponseCache(directory=args.cache_dir, max_disk_bytes=int(args.cache_mb * 1024 * 1024))
+
+    def generate_once(prompt_text, prompt_ids=None):
+        with metrics.stage("generate"):
+            return generate_text(
+                p,
+                prompt_text,
+                input_ids=prompt_ids,
+                max_new_tokens=args.max_new_tokens,
+                do_sample=do_sample,
+                temperature=args.temperature,
+                top_k=args.top_k,
+                top_p=args.top_p,
+                repetition_penalty=args.repetition_penalty,
+                num_return_sequences=args.num_return_sequences,
+                stop=stop,
+                seed=args.seed,
+                cache=cache,
+            )
 
-    def generate_once(prompt_text):
-        return p(
+    stream = args.stream
+    if stream and args.num_return_sequences > 1:
+        logger.warning("--stream supports a single sequence; ignoring it for -n %d", args.num_return_sequences)
+        stream = False
+
+    def stream_once(prompt_text, prompt_ids=None):
+        """Print tokens as they arrive and return the full text."""
+        pieces = []
+        t0 = time.perf_counter()
+        for chunk in stream_text(
+            p,
             prompt_text,
+            input_ids=prompt_ids,
             max_new_tokens=args.max_new_tokens,
             do_sample=do_sample,
             temperature=args.temperature,
             top_k=args.top_k,
             top_p=args.top_p,
             repetition_penalty=args.repetition_penalty,
-            return_full_text=False,
-            num_return_sequences=args.num_return_sequences,
-            truncation=True,
-            pad_token_id=50256,
-        )
+            stop=stop,
+            seed=args.seed,
+        ):
+            pieces.append(chunk)
+            sys.stdout.write(chunk)
+            sys.stdout.flush()
+            if speaker is not None:
+                speaker.feed(chunk)
+        metrics.observe_stage("generate", time.perf_counter() - t0)
+        if speaker is not None:
+            speaker.finish()
+        sys.stdout.write("\n")
+        return "".join(pieces)
 
     # REPL mode: interactive loop with optional history persistence and TTS
     if args.repl:
-        import json
-        history = []
+        from store import ConversationStore
+
+        history = None
         try:
-            if args.history_file:
-                with open(args.history_file, "r", encoding="utf-8") as hf:
-                    history = json.load(hf)
+            if args.history_db:
+                history = ConversationStore(args.history_db)
+                history.migrate_json(args.history_file, session=args.session)
         except Exception:
-            history = []
+            logger.warning("Conversation history unavailable; not persisting")
+            history = None
+
+        # with --context (implied by --kv-cache) the prompt carries as many
+        # recent turns as fit the token budget; --kv-cache also reuses their KV cache
+        use_context = args.context or args.kv_cache
+        kv = None
+        builder = None
+        turns = []
+        if use_context:
+            from kvcache import SessionKVCache
+            from prompting import prompt_builder_for
+
+            builder = prompt_builder_for(p)
+            if args.kv_cache:
+                if SessionKVCache.supports(p):
+                    kv = SessionKVCache()
+                else:
+                    logger.info("KV cache reuse needs a transformers pipeline; including history only")
+            if history is not None:
+                turns = history.last(args.session, 64)
+
+        def remember(role, text):
+            nonlocal turns
+            turn_id = save_turn(history, args.session, role, text, logger)
+            if turn_id is None:
+                turn_id = (turns[-1]["id"] + 1) if turns and turns[-1].get("id") is not None else len(turns)
+            turns = (turns + [{"id": turn_id, "role": role, "text": text}])[-64:]
 
-        print("Entering REPL mode. Type 'exit' or Ctrl-C to quit.")
+        print("Entering REPL mode. Type 'exit' or Ctrl-C to quit." + (" Press Enter to stop speech." if speaker else ""))
         try:
             while True:
                 try:
                     user = input("You: ").strip()
                 except EOFError:
                     break
+                if speaker is not None:
+                    # barge-in: a new turn (or a bare Enter) cuts off the last reply
+                    speaker.interrupt()
                 if not user:
                     continue
                 if user.lower() in ("exit", "quit"):
                     break
+                if speaker is not None:
+                    speaker.begin()
 
                 # append to history
-                history.append({"role": "user", "text": user})
+                remember("user", user)
+                prompt_ids = None
+                if builder is not None:
+                    with metrics.stage("tokenize"):
+                        built = builder.build(turns, max_new_tokens=args.max_new_tokens, session=args.session)
+                    prompt_text, prompt_ids = built.text, built.ids
+                elif use_context:
+                    prompt_text = build_chat_prompt(turns[-6:])
+                else:
+                    prompt_text = user
 
                 # generate
-                resp = generate_once(user)
-                try:
-                    text = resp[0].get("generated_text") if isinstance(resp[0], dict) else str(resp[0])
-                except Exception:
-                    text = str(resp)
-
-                print("AI:", text.strip())
-                history.append({"role": "assistant", "text": text.strip()})
-
-                # speak
-                if tts_engine:
+                if stream:
+                    sys.stdout.write("AI: ")
+                    text = stream_once(prompt_text, prompt_ids)
+                else:
+                    if kv is not None and args.num_return_sequences == 1:
+                        with metrics.stage("generate"):
+                            resp = kv.generate(
+                                p,
+                                args.session,
+                                prompt_text,
+                                max_new_tokens=args.max_new_tokens,
+                                do_sample=do_sample,
+                                temperature=args.temperature,
+                                top_k=args.top_k,
+                                top_p=args.top_p,
+                                repetition_penalty=args.repetition_penalty,
+                                input_ids=prompt_ids,
+                                stop=stop,
+                                seed=args.seed,
+                            )
+                    else:
+                        resp = generate_once(prompt_text, prompt_ids)
                     try:
-                        tts_engine.say(text.strip())
-                        tts_engine.runAndWait()
+                        text = resp[0].get("generated_text") if isinstance(resp[0], dict) else str(resp[0])
                     except Exception:
-                        logger.warning("TTS engine failed to speak")
+                        text = str(resp)
 
-                # persist history
-                try:
-                    if args.history_file:
-                        with open(args.history_file, "w", encoding="utf-8") as hf:
-                            json.dump(history[-100:], hf, ensure_ascii=False, indent=2)
-                except Exception:
-                    logger.debug("Failed to save history")
+                    print("AI:", text.strip())
+                    if speaker is not None:
+                        speaker.say(text.strip())
+                remember("assistant", text.strip())
 
         except KeyboardInterrupt:
             print("\nExiting REPL")
 
+        if speaker is not None:
+            speaker.close()
+        if kv is not None:
+            logger.info("KV cache: %s", kv.stats())
         return 0
 
     # single-shot generation
+    if stream:
+        print("\n---\n")
+        stream_once(prompt)
+        if speaker is not None:
+            speaker.wait()
+            speaker.close()
+        return 0
+
     out = generate_once(prompt)
 
     print("\n---\n")
@@ -251,10 +1171,15 @@ def main(argv=None):
         else:
             text = out[0].get("generated_text") if isinstance(out[0], dict) else str(out[0])
             print(text.strip())
+            if speaker is not None:
+                speaker.say(text.strip())
     except Exception as e:
         logger.exception("Error while printing output: %s", e)
         print(out)
 
+    if speaker is not None:
+        speaker.wait()
+        speaker.close()
     return 0
 
 
@@ -0,0 +1,184 @@
+"""Cross-turn KV-cache reuse for conversational sessions.
+
+Each chat turn's prompt usually starts with the previous turn's prompt and
+reply. ``SessionKVCache`` keeps the ``past_key_values`` computed for a
+session's last sequence and, on the next turn, crops it to the longest token
+prefix shared with the new prompt so only the new tokens are prefilled.
+Entries are evicted least recently used first under a memory cap; a miss
+simply falls back to a full prefill.
+"""
+import logging
+import threading
+from collections import OrderedDict
+
+import generate
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def cache_nbytes(cache):
+    """Size in bytes of the key/value tensors held by ``cache``."""
+    if cache is None:
+        return 0
+    layers = getattr(cache, "layers", None)
+    if layers is not None:
+        return sum(t.nelement() * t.element_size() for layer in layers for t in (layer.keys, layer.values) if t is not None)
+    if hasattr(cache, "key_cache"):
+        return sum(t.nelement() * t.element_size() for t in list(cache.key_cache) + list(cache.value_cache))
+    # legacy tuple-of-tuples format
+    return sum(t.nelement() * t.element_size() for layer in cache for t in layer)
+
+
+def crop_cache(cache, length):
+    """Truncate ``cache`` to its first ``length`` positions."""
+    if hasattr(cache, "crop"):
+        # a negative argument removes that many trailing positions
+        excess = cache.get_seq_length() - length
+        if excess > 0:
+            cache.crop(-excess)
+        return cache
+    return tuple(tuple(t[..., :length, :] for t in layer) for layer in cache)
+
+
+def common_prefix(a, b):
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+class SessionKVCache:
+    """Per-session ``past_key_values`` store with LRU eviction under ``max_bytes``."""
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.prompt_tokens = 0
+        self.tokens_saved = 0
+
+    @staticmethod
+    def supports(pipeline_callable):
+        """True if the pipeline exposes a transformers model and tokenizer we can drive directly."""
+        # other backends and assisted (draft-model) decoding run their own generate loop
+        if generate.backend_of(pipeline_callable) != "transformers" or getattr(pipeline_callable, "draft_model", None) is not None:
+            return False
+        return getattr(pipeline_callable, "model", None) is not None and getattr(pipeline_callable, "tokenizer", None) is not None
+
+    def _take(self, session, model_key):
+        with self._lock:
+            entry = self._entries.pop((session, model_key), None)
+        return entry
+
+    def _put(self, session, model_key, ids, cache):
+        nbytes = cache_nbytes(cache)
+        if self.max_bytes and nbytes > self.max_bytes:
+            return
+        with self._lock:
+            self._entries[(session, model_key)] = {"ids": ids, "cache": cache, "nbytes": nbytes}
+            while self.max_bytes and sum(e["nbytes"] for e in self._entries.values()) > self.max_bytes:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def drop(self, session):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == session]:
+                del self._entries[key]
+
+    def generate(self, pipeline_callable, session, prompt, max_new_tokens=120, do_sample=True, temperature=0.8, top_k=0, top_p=0.92, repetition_penalty=1.15, input_ids=None, stop=None, seed=None, deadline=None, **extra):
+        """Generate a reply to ``prompt`` reusing the session's cached prefix.
+
+        ``input_ids`` may carry the already tokenized prompt (see
+        ``prompting.PromptBuilder``); ``prompt`` is then not tokenized again.
+        ``stop``, ``seed`` and ``deadline`` work as in ``generate.generate_text``.
+        Returns the same ``[{"generated_text": ...}]`` shape as the pipeline.
+        """
+        import torch
+
+        model = pipeline_callable.model
+        tokenizer = pipeline_callable.tokenizer
+        model_key = id(model)
+        device = getattr(model, "device", None)
+
+        if input_ids is not None:
+            ids = list(input_ids)
+        else:
+            with metrics.stage("tokenize"):
+                ids = tokenizer(prompt, return_tensors="pt").input_ids[0].tolist()
+        reused = 0
+        cache = None
+        entry = self._take(session, model_key)
+        if entry is not None:
+            # at least one prompt token must be fed to the model
+            reused = min(common_prefix(entry["ids"], ids), len(ids) - 1)
+            if reused > 0:
+                cache = crop_cache(entry["cache"], reused)
+
+        with self._lock:
+            self.prompt_tokens += len(ids)
+            if cache is not None:
+                self.hits += 1
+                self.tokens_saved += reused
+            else:
+                self.misses += 1
+                reused = 0
+
+        input_ids = torch.tensor([ids], device=device)
+        gen_kwargs = dict(
+            attention_mask=torch.ones_like(input_ids),
+            max_new_tokens=max_new_tokens,
+            do_sample=do_sample,
+            repetition_penalty=repetition_penalty,
+            pad_token_id=tokenizer.pad_token_id if tokenizer.pad_token_id is not None else tokenizer.eos_token_id,
+            return_dict_in_generate=True,
+        )
+        if do_sample:
+            gen_kwargs.update(temperature=temperature, top_k=top_k, top_p=top_p)
+        stop = tuple(s for s in (stop or ()) if s)
+        if stop:
+            gen_kwargs["stopping_criteria"] = generate.make_stopping_criteria(tokenizer, stop, prompt_length=len(ids))
+        at_deadline = None
+        if deadline is not None:
+            at_deadline = generate.make_deadline_criteria(deadline)
+            generate.add_stopping_criteria(gen_kwargs, at_deadline)
+        gen_kwargs.update(extra)
+        if do_sample and seed is not None:
+            generate.seeded_sampling(gen_kwargs, seed, temperature, top_k, top_p)
+        if cache is not None:
+            gen_kwargs["past_key_values"] = cache
+
+        timer = metrics.DecodeTimer()
+        generate.add_logits_processor(gen_kwargs, timer)
+        with torch.no_grad():
+            out = model.generate(input_ids, **gen_kwargs)
+        timer.finish()
+
+        sequence = out.sequences[0].tolist()
+        new_cache = out.past_key_values
+        if new_cache is not None:
+            cached_len = new_cache.get_seq_length() if hasattr(new_cache, "get_seq_length") else new_cache[0][0].shape[-2]
+            self._put(session, model_key, sequence[:cached_len], new_cache)
+        if at_deadline is not None and at_deadline.fired:
+            raise generate.DeadlineExceeded("generation stopped at the request deadline")
+
+        text = tokenizer.decode(sequence[len(ids):], skip_special_tokens=True)
+        return [{"generated_text": generate.trim_at_stop(text, stop)}]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+                "prompt_tokens": self.prompt_tokens,
+                "tokens_saved": self.tokens_saved,
+                "entries": len(self._entries),
+                "bytes": sum(e["nbytes"] for e in self._entries.values()),
+            }
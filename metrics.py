@@ -0,0 +1,290 @@
+"""Per-stage timing histograms and counters, rendered in Prometheus text format.
+
+Hot paths wrap their work in ``stage(name)``; each stage is observed into the
+``stage_seconds`` histogram and, when ``collect()`` or ``begin()`` started a
+``Timings`` in the current context, into that as well. The app uses the latter for
+the ``Server-Timing`` header and ``generate.py --profile`` for its report.
+
+Stages recorded: ``model_load``, ``tokenize``, ``generate`` (as seen by the
+caller, including any batching wait), ``prefill`` and ``decode`` (split by
+``DecodeTimer`` inside ``model.generate``), ``persist``, ``preprocess`` (audio
+normalization, see audio.py) and ``recognize``, plus ``first_speech`` (a
+reply's wait for its first spoken sentence, with ``--tts``). Assisted
+decoding (speculative.py) also counts draft tokens proposed and accepted and
+target-model passes.
+"""
+import contextvars
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# seconds; wide enough for a token step on a GPU up to a cold model load on a Pi
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+RTF_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 5.0)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + list(extra or ())
+    if not pairs:
+        return ""
+    body = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _format_value(v):
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = OrderedDict()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=STAGE_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._lock = threading.Lock()
+        self._values = OrderedDict()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry["counts"][i] += 1
+                    break
+            entry["sum"] += value
+            entry["count"] += 1
+
+    def snapshot(self, **labels):
+        """``{"count", "sum"}`` for one label set."""
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            entry = self._values.get(key)
+            return {"count": entry["count"], "sum": entry["sum"]} if entry else {"count": 0, "sum": 0.0}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, entry in self._values.items():
+                cumulative = 0
+                for bound, n in zip(self.buckets, entry["counts"]):
+                    cumulative += n
+                    labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(entry['sum'])}")
+                lines.append(f"{self.name}_count{labels} {entry['count']}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = OrderedDict()
+
+    def counter(self, name, help, labelnames=()):
+        return self._metrics.setdefault(name, Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=STAGE_BUCKETS):
+        return self._metrics.setdefault(name, Histogram(name, help, labelnames, buckets))
+
+    def render(self):
+        """All metrics in Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+STAGE_SECONDS = registry.histogram("stage_seconds", "Time spent in each request stage", ("stage",))
+REQUEST_SECONDS = registry.histogram("http_request_seconds", "HTTP request handling time", ("endpoint", "status"))
+TOKENS_GENERATED = registry.counter("tokens_generated_total", "Tokens produced by model.generate")
+AUDIO_SECONDS = registry.counter("transcribe_audio_seconds_total", "Seconds of audio transcribed")
+TRIMMED_SECONDS = registry.counter("transcribe_trimmed_seconds_total", "Seconds of leading and trailing silence trimmed before recognition")
+TRANSCRIBE_RTF = registry.histogram("transcribe_rtf", "Transcription real-time factor (processing time / audio duration)", buckets=RTF_BUCKETS)
+DRAFT_TOKENS = registry.counter("speculative_draft_tokens_total", "Tokens proposed by draft models")
+ACCEPTED_TOKENS = registry.counter("speculative_accepted_tokens_total", "Draft tokens accepted by the target model")
+TARGET_PASSES = registry.counter("speculative_target_passes_total", "Target model forward passes during assisted decoding")
+
+
+class Timings:
+    """Per-request (or per-run) accumulation of stage times and counts."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = OrderedDict()
+        self.counts = OrderedDict()
+
+    def add(self, name, seconds):
+        with self._lock:
+            total, n = self.stages.get(name, (0.0, 0))
+            self.stages[name] = (total + seconds, n + 1)
+
+    def count(self, name, amount):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + amount
+
+    def merge(self, other):
+        """Add every stage and count recorded in ``other`` to this collector."""
+        with other._lock:
+            stages, counts = list(other.stages.items()), list(other.counts.items())
+        with self._lock:
+            for name, (seconds, n) in stages:
+                total, seen = self.stages.get(name, (0.0, 0))
+                self.stages[name] = (total + seconds, seen + n)
+            for name, value in counts:
+                self.counts[name] = self.counts.get(name, 0) + value
+
+    def server_timing(self):
+        """``Server-Timing`` header value, e.g. ``prefill;dur=12.3, decode;dur=80.1``."""
+        with self._lock:
+            return ", ".join(f"{name};dur={total * 1000:.1f}" for name, (total, _) in self.stages.items())
+
+    def report(self):
+        """Human-readable breakdown, one stage per line."""
+        with self._lock:
+            lines = [f"{name:<12} {total * 1000:10.1f} ms  x{n}" for name, (total, n) in self.stages.items()]
+            decode = self.stages.get("decode", (0.0, 0))[0]
+            for name, value in self.counts.items():
+                lines.append(f"{name:<12} {value:10}")
+                if name == "tokens" and decode:
+                    lines.append(f"{'tokens/s':<12} {value / decode:10.1f}")
+            if self.counts.get("draft_tokens"):
+                lines.append(f"{'accept rate':<12} {self.counts.get('accepted', 0) / self.counts['draft_tokens']:10.2f}")
+            if self.counts.get("target_passes"):
+                lines.append(f"{'tokens/pass':<12} {self.counts.get('spec_tokens', 0) / self.counts['target_passes']:10.2f}")
+        return "\n".join(lines)
+
+
+_current = contextvars.ContextVar("metrics_timings", default=None)
+
+
+def current():
+    """The ``Timings`` collecting in this context, or None."""
+    return _current.get()
+
+
+def begin():
+    """Start a fresh ``Timings`` for the rest of the current context and return it."""
+    timings = Timings()
+    _current.set(timings)
+    return timings
+
+
+@contextmanager
+def collect():
+    """Collect the stages observed inside the block into a fresh ``Timings``."""
+    timings = Timings()
+    token = _current.set(timings)
+    try:
+        yield timings
+    finally:
+        _current.reset(token)
+
+
+def observe_stage(name, seconds):
+    STAGE_SECONDS.observe(seconds, stage=name)
+    timings = _current.get()
+    if timings is not None:
+        timings.add(name, seconds)
+
+
+@contextmanager
+def stage(name):
+    """Time the block as stage ``name``."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - t0)
+
+
+def count_tokens(n):
+    TOKENS_GENERATED.inc(n)
+    timings = _current.get()
+    if timings is not None:
+        timings.count("tokens", n)
+
+
+def observe_speculation(generated, draft_tokens, accepted, target_passes):
+    """Record one assisted-decoding run: tokens kept, drafted, accepted, and target passes taken."""
+    DRAFT_TOKENS.inc(draft_tokens)
+    ACCEPTED_TOKENS.inc(accepted)
+    TARGET_PASSES.inc(target_passes)
+    timings = _current.get()
+    if timings is not None:
+        timings.count("draft_tokens", draft_tokens)
+        timings.count("accepted", accepted)
+        timings.count("target_passes", target_passes)
+        timings.count("spec_tokens", generated)
+
+
+def observe_transcription(audio_seconds, processing_seconds, trimmed_seconds=0.0):
+    """Record transcribed audio length, silence trimmed from it, and the resulting real-time factor."""
+    AUDIO_SECONDS.inc(audio_seconds)
+    TRIMMED_SECONDS.inc(trimmed_seconds)
+    if audio_seconds > 0:
+        TRANSCRIBE_RTF.observe(processing_seconds / audio_seconds)
+        timings = _current.get()
+        if timings is not None:
+            timings.count("audio_s", round(audio_seconds, 3))
+            if trimmed_seconds:
+                timings.count("trimmed_s", round(trimmed_seconds, 3))
+
+
+class DecodeTimer:
+    """Logits-processor hook splitting one ``model.generate`` call into prefill and decode.
+
+    The processors run once per generated token, right after that step's
+    forward pass, so the first call marks the end of the prompt prefill.
+    Pass it inside a ``LogitsProcessorList`` and call ``finish`` afterwards.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first = None
+        self.tokens = 0
+
+    def __call__(self, input_ids, scores):
+        if self.first is None:
+            self.first = time.perf_counter()
+        self.tokens += scores.shape[0]
+        return scores
+
+    def finish(self):
+        if self.first is None:
+            return
+        observe_stage("prefill", self.first - self.start)
+        observe_stage("decode", time.perf_counter() - self.first)
+        count_tokens(self.tokens)
@@ -0,0 +1,319 @@
+"""ONNX Runtime inference backend (``--backend onnx``).
+
+The model is exported once to a single ONNX decoder graph that takes the
+past keys/values as inputs and returns the updated ones, so the same graph
+serves the prompt prefill (with an empty past) and every decode step.
+Exports are cached on disk, keyed on the model and the torch/transformers
+versions; ``int8`` additionally runs ONNX Runtime's dynamic quantization on
+the export and caches that too.
+
+Decoding runs the usual logits processors, stopping criteria and streamers
+from transformers over ONNX Runtime outputs, and ``OnnxPipeline`` returns the
+text-generation pipeline's result format, so callers cannot tell the
+backends apart. Between steps the keys/values never leave ONNX Runtime: each
+step's ``present`` outputs are bound as the next step's ``past`` inputs with
+IO binding instead of round-tripping through numpy.
+"""
+import hashlib
+import inspect
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+OPSET = 17
+
+
+def cache_path(cache_dir, model_name, precision="fp32"):
+    import torch
+    import transformers
+
+    key = "|".join([str(model_name), torch.__version__, transformers.__version__, str(OPSET)])
+    slug = "".join(c if c.isalnum() or c in "-_." else "_" for c in os.path.basename(str(model_name).rstrip("/")))
+    return os.path.join(cache_dir, f"{slug}-{hashlib.sha256(key.encode()).hexdigest()[:16]}.{precision}.onnx")
+
+
+def _layer_shape(config):
+    """``(layers, kv_heads, head_dim)`` of a decoder config."""
+    layers = config.num_hidden_layers
+    heads = config.num_attention_heads
+    kv_heads = getattr(config, "num_key_value_heads", None) or heads
+    head_dim = getattr(config, "head_dim", None) or config.hidden_size // heads
+    return layers, kv_heads, head_dim
+
+
+def past_names(n_layers):
+    return [f"past.{i}.{kv}" for i in range(n_layers) for kv in ("key", "value")]
+
+
+def present_names(n_layers):
+    return [f"present.{i}.{kv}" for i in range(n_layers) for kv in ("key", "value")]
+
+
+def export(model_name, path, log=None):
+    """Export ``model_name``'s decoder with explicit past/present keys and values to ``path``."""
+    import torch
+    from transformers import AutoModelForCausalLM, DynamicCache
+
+    log = log or logger
+    # exporting leaves the module unusable for eager inference, so use a throwaway copy;
+    # eager attention traces to plain ops that honour the attention mask
+    model = AutoModelForCausalLM.from_pretrained(model_name, attn_implementation="eager", torch_dtype=torch.float32).eval()
+    n_layers, kv_heads, head_dim = _layer_shape(model.config)
+
+    class Decoder(torch.nn.Module):
+        def __init__(self, lm):
+            super().__init__()
+            self.lm = lm
+
+        def forward(self, input_ids, attention_mask, position_ids, *past):
+            cache = DynamicCache()
+            for i in range(n_layers):
+                cache.update(past[2 * i], past[2 * i + 1], i)
+            out = self.lm(input_ids=input_ids, attention_mask=attention_mask, position_ids=position_ids, past_key_values=cache, use_cache=True)
+            presents = []
+            for i in range(n_layers):
+                layer = out.past_key_values.layers[i] if hasattr(out.past_key_values, "layers") else None
+                if layer is not None:
+                    presents += [layer.keys, layer.values]
+                else:  # transformers 4.x
+                    presents += [out.past_key_values.key_cache[i], out.past_key_values.value_cache[i]]
+            return (out.logits, *presents)
+
+    batch, past_len, seq_len = 2, 3, 4
+    args = (
+        torch.ones(batch, seq_len, dtype=torch.long),
+        torch.ones(batch, past_len + seq_len, dtype=torch.long),
+        torch.arange(past_len, past_len + seq_len).expand(batch, seq_len),
+        *[torch.zeros(batch, kv_heads, past_len, head_dim) for _ in range(2 * n_layers)],
+    )
+    inputs = ["input_ids", "attention_mask", "position_ids"] + past_names(n_layers)
+    outputs = ["logits"] + present_names(n_layers)
+    dynamic_axes = {
+        "input_ids": {0: "batch", 1: "sequence"},
+        "attention_mask": {0: "batch", 1: "total"},
+        "position_ids": {0: "batch", 1: "sequence"},
+        "logits": {0: "batch", 1: "sequence"},
+    }
+    dynamic_axes.update({name: {0: "batch", 2: "past"} for name in past_names(n_layers)})
+    dynamic_axes.update({name: {0: "batch", 2: "total"} for name in present_names(n_layers)})
+
+    kwargs = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        # the TorchScript exporter handles the dynamic cache without extra dependencies
+        kwargs["dynamo"] = False
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with torch.no_grad():
+            torch.onnx.export(Decoder(model), args, tmp, input_names=inputs, output_names=outputs, dynamic_axes=dynamic_axes, opset_version=OPSET, **kwargs)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    log.info("Exported %s to %s", model_name, path)
+    return path
+
+
+def quantize(source, path, log=None):
+    """Write an int8 (dynamically quantized MatMul weights) copy of the ONNX model ``source`` to ``path``."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        quantize_dynamic(source, tmp, weight_type=QuantType.QInt8)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    (log or logger).info("Quantized %s to %s", source, path)
+    return path
+
+
+class OnnxCausalLM:
+    """A causal LM running on an ONNX Runtime session, with a ``generate`` like transformers'."""
+
+    backend = "onnx"
+
+    def __init__(self, path, config, name_or_path, precision="fp32", threads=0):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = int(threads)
+        # one step's ops depend on each other; parallelism comes from inside them
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.path = path
+        self.config = config
+        self.name_or_path = name_or_path
+        self.dtype = precision
+        self.device = "cpu"
+        self.n_layers, self.kv_heads, self.head_dim = _layer_shape(config)
+
+    def get_memory_footprint(self):
+        return os.path.getsize(self.path)
+
+    def _processors(self, prompt_length, do_sample, temperature, top_k, top_p, repetition_penalty, min_new_tokens, eos_token_id, extra):
+        from transformers import (
+            LogitsProcessorList,
+            MinNewTokensLengthLogitsProcessor,
+            RepetitionPenaltyLogitsProcessor,
+            TemperatureLogitsWarper,
+            TopKLogitsWarper,
+            TopPLogitsWarper,
+        )
+
+        # the same processors, in the same order, as transformers' generate
+        processors = LogitsProcessorList()
+        if repetition_penalty is not None and repetition_penalty != 1.0:
+            processors.append(RepetitionPenaltyLogitsProcessor(penalty=repetition_penalty))
+        if min_new_tokens and eos_token_id is not None:
+            processors.append(MinNewTokensLengthLogitsProcessor(prompt_length, min_new_tokens, eos_token_id))
+        processors.extend(extra or [])
+        if do_sample:
+            if temperature is not None and temperature != 1.0:
+                processors.append(TemperatureLogitsWarper(temperature))
+            if top_k:
+                processors.append(TopKLogitsWarper(top_k=top_k))
+            if top_p is not None and top_p < 1.0:
+                processors.append(TopPLogitsWarper(top_p=top_p))
+        return processors
+
+    def generate(self, input_ids, attention_mask=None, max_new_tokens=20, min_new_tokens=0, do_sample=False, temperature=1.0, top_k=0, top_p=1.0,
+                 repetition_penalty=1.0, num_return_sequences=1, pad_token_id=None, eos_token_id=None, logits_processor=None, stopping_criteria=None,
+                 streamer=None, **unused):
+        """Decode up to ``max_new_tokens`` after ``input_ids``; returns prompt plus new tokens, one row per sequence."""
+        import numpy as np
+        import onnxruntime as ort
+        import torch
+
+        if attention_mask is None:
+            attention_mask = torch.ones_like(input_ids)
+        if num_return_sequences > 1:
+            input_ids = input_ids.repeat_interleave(num_return_sequences, dim=0)
+            attention_mask = attention_mask.repeat_interleave(num_return_sequences, dim=0)
+        if eos_token_id is None:
+            eos_token_id = getattr(self.config, "eos_token_id", None)
+        if pad_token_id is None or not 0 <= pad_token_id < self.config.vocab_size:
+            pad_token_id = eos_token_id if eos_token_id is not None else 0
+
+        batch, prompt_length = input_ids.shape
+        processors = self._processors(prompt_length, do_sample, temperature, top_k, top_p, repetition_penalty, min_new_tokens, eos_token_id, logits_processor)
+        ids, mask = input_ids, attention_mask
+        positions = (mask.cumsum(-1) - 1).clamp(min=0)
+        step_ids = ids
+        empty = np.zeros((batch, self.kv_heads, 0, self.head_dim), dtype=np.float32)
+        past = [ort.OrtValue.ortvalue_from_numpy(empty) for _ in range(2 * self.n_layers)]
+        names_in = past_names(self.n_layers)
+        names_out = present_names(self.n_layers)
+        binding = self.session.io_binding()
+        unfinished = torch.ones(batch, dtype=torch.bool)
+        if streamer is not None:
+            streamer.put(ids.cpu())
+
+        for _ in range(max_new_tokens):
+            binding.clear_binding_inputs()
+            binding.clear_binding_outputs()
+            binding.bind_cpu_input("input_ids", step_ids.numpy().astype(np.int64))
+            binding.bind_cpu_input("attention_mask", mask.numpy().astype(np.int64))
+            binding.bind_cpu_input("position_ids", positions.numpy().astype(np.int64))
+            for name, value in zip(names_in, past):
+                binding.bind_ortvalue_input(name, value)
+            binding.bind_output("logits", "cpu")
+            for name in names_out:
+                binding.bind_output(name, "cpu")
+            self.session.run_with_iobinding(binding)
+            outputs = binding.get_outputs()
+            past = outputs[1:]
+
+            logits = torch.from_numpy(outputs[0].numpy()[:, -1, :])
+            scores = processors(ids, logits)
+            if do_sample:
+                next_tokens = torch.multinomial(torch.softmax(scores, dim=-1), num_samples=1).squeeze(1)
+            else:
+                next_tokens = scores.argmax(dim=-1)
+            next_tokens = torch.where(unfinished, next_tokens, torch.full_like(next_tokens, pad_token_id))
+
+            ids = torch.cat([ids, next_tokens[:, None]], dim=-1)
+            mask = torch.cat([mask, torch.ones((batch, 1), dtype=mask.dtype)], dim=-1)
+            if streamer is not None:
+                streamer.put(next_tokens.cpu())
+            if eos_token_id is not None:
+                unfinished &= next_tokens != eos_token_id
+            if stopping_criteria is not None:
+                unfinished &= ~stopping_criteria(ids, scores)
+            if not unfinished.any():
+                break
+            step_ids = next_tokens[:, None]
+            positions = positions[:, -1:] + 1
+
+        if streamer is not None:
+            streamer.end()
+        return ids
+
+
+class OnnxPipeline:
+    """Callable with the transformers text-generation pipeline's arguments and result format."""
+
+    backend = "onnx"
+
+    def __init__(self, model, tokenizer):
+        self.model = model
+        self.tokenizer = tokenizer
+
+    def __call__(self, prompt, max_new_tokens=20, return_full_text=True, num_return_sequences=1, truncation=False, pad_token_id=None, batch_size=None, **gen_kwargs):
+        import torch
+
+        prompts = [prompt] if isinstance(prompt, str) else list(prompt)
+        enc = self.tokenizer(prompts, return_tensors="pt", padding=True, truncation=bool(truncation))
+        with torch.inference_mode():
+            sequences = self.model.generate(
+                enc.input_ids,
+                attention_mask=enc.attention_mask,
+                max_new_tokens=max_new_tokens,
+                num_return_sequences=num_return_sequences,
+                pad_token_id=pad_token_id,
+                eos_token_id=self.tokenizer.eos_token_id,
+                **gen_kwargs,
+            )
+
+        results = []
+        prompt_length = enc.input_ids.shape[1]
+        for i, text in enumerate(prompts):
+            rows = []
+            for seq in sequences[i * num_return_sequences:(i + 1) * num_return_sequences]:
+                # decoded the way the pipeline does: new tokens only, special tokens dropped
+                generated = self.tokenizer.decode(seq[prompt_length:], skip_special_tokens=True, clean_up_tokenization_spaces=True)
+                rows.append({"generated_text": text + generated if return_full_text else generated})
+            results.append(rows)
+        return results[0] if isinstance(prompt, str) else results
+
+
+def load_onnx_pipeline(model_name, device=-1, precision=None, cache_dir="models/onnx", threads=0, log=None):
+    """An ONNX Runtime text-generation pipeline for ``model_name``, exporting it to ``cache_dir`` on first use.
+
+    ``precision`` is ``"fp32"`` (the default) or ``"int8"``; ``threads`` sets
+    ONNX Runtime's intra-op thread count (0 leaves its default).
+    """
+    from transformers import AutoConfig, AutoTokenizer
+
+    log = log or logger
+    if device not in (-1, "cpu"):
+        raise ValueError("the onnx backend runs on the CPU only")
+    name = {None: "fp32", "fp32": "fp32", "float32": "fp32", "int8": "int8"}.get(precision)
+    if name is None:
+        raise ValueError(f"the onnx backend supports fp32 and int8, not {precision}")
+    precision = name
+
+    path = cache_path(cache_dir, model_name)
+    if not os.path.exists(path):
+        export(model_name, path, log)
+    if precision == "int8":
+        source, path = path, cache_path(cache_dir, model_name, "int8")
+        if not os.path.exists(path):
+            quantize(source, path, log)
+    model = OnnxCausalLM(path, AutoConfig.from_pretrained(model_name), model_name, precision=precision, threads=threads)
+    log.info("Loaded ONNX model from %s", path)
+    return OnnxPipeline(model, AutoTokenizer.from_pretrained(model_name))
@@ -0,0 +1,214 @@
+"""Reduced-precision model loading for CPU inference.
+
+``--precision`` (and the API's ``precision`` field) picks how weights are
+held in memory:
+
+- ``fp32``: full precision, the default
+- ``bf16``: bfloat16 weights, half the memory traffic per decoded token
+- ``int8``: dynamic int8 quantization of the Linear layers; activations stay
+  in float and are quantized on the fly per matmul
+
+GPT-2 style models implement their projections as transformers' ``Conv1D``
+(a transposed Linear), which torch's dynamic quantization does not know, so
+those are converted to ``nn.Linear`` first. The output head stays in float:
+it shares its weights with the token embedding, and quantizing it would cost
+a second copy and most of the accuracy loss.
+
+Quantizing takes a while on a Pi, so with a cache directory the quantized
+state dict is saved there; later loads build an empty int8 model from the
+config and fill it in, skipping both the fp32 load and the conversion. Cache
+files are keyed on the model and the torch/transformers versions, since the
+packed weight format is not stable across upgrades.
+"""
+import hashlib
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# --precision name -> dtype name understood by generate.init_pipeline
+PRECISIONS = {"fp32": "float32", "bf16": "bfloat16", "int8": "int8"}
+
+
+def resolve(precision):
+    """Map a precision name to the dtype name ``init_pipeline`` takes; other names pass through."""
+    if not precision:
+        return None
+    name = str(precision).lower()
+    return PRECISIONS.get(name, name)
+
+
+def conv1d_to_linear(model):
+    """Replace every transformers ``Conv1D`` in ``model`` with an equivalent ``nn.Linear``."""
+    import torch.nn as nn
+
+    for module in list(model.modules()):
+        for name, child in list(module.named_children()):
+            if type(child).__name__ != "Conv1D":
+                continue
+            # Conv1D stores its weight as (in_features, out_features)
+            in_features, out_features = child.weight.shape
+            linear = nn.Linear(in_features, out_features, bias=child.bias is not None)
+            linear.weight.data = child.weight.data.t().contiguous()
+            if child.bias is not None:
+                linear.bias.data = child.bias.data
+            setattr(module, name, linear)
+    return model
+
+
+def quantize_int8(model):
+    """Dynamically quantize ``model``'s Linear layers (except the output head) to int8, in place."""
+    import torch
+    from torch.ao.quantization import quantize_dynamic
+
+    conv1d_to_linear(model)
+    head = model.get_output_embeddings() if hasattr(model, "get_output_embeddings") else None
+    names = {name for name, m in model.named_modules() if isinstance(m, torch.nn.Linear) and m is not head}
+    model = quantize_dynamic(model, qconfig_spec=names, dtype=torch.qint8, inplace=True)
+    # model.dtype still reports float32; this tells cache keys the weights differ
+    model.quantized_precision = "int8"
+    return model
+
+
+def model_nbytes(model):
+    """Bytes held by ``model``'s weights, counting quantized packed weights and shared tensors once."""
+    import torch
+
+    seen = set()
+    total = 0
+
+    def add(value):
+        nonlocal total
+        if isinstance(value, torch.Tensor):
+            try:
+                key = (value.untyped_storage().data_ptr(), value.storage_offset()) if not value.is_quantized else id(value)
+            except Exception:
+                key = id(value)
+            if key in seen:
+                return
+            seen.add(key)
+            total += value.numel() * value.element_size()
+        elif isinstance(value, (tuple, list)):
+            for item in value:
+                add(item)
+
+    for value in model.state_dict().values():
+        add(value)
+    return total
+
+
+def cache_path(cache_dir, model_name):
+    import torch
+    import transformers
+
+    key = "|".join([str(model_name), torch.__version__, transformers.__version__])
+    slug = "".join(c if c.isalnum() or c in "-_." else "_" for c in os.path.basename(str(model_name).rstrip("/")))
+    return os.path.join(cache_dir, f"{slug}-{hashlib.sha256(key.encode()).hexdigest()[:16]}.int8.pt")
+
+
+def _quantized_linears(model):
+    from torch.ao.nn.quantized.dynamic import Linear as QuantizedLinear
+
+    return [(name, m) for name, m in model.named_modules() if isinstance(m, QuantizedLinear)]
+
+
+def _save_cached(model, path):
+    """Save ``model``'s weights as plain tensors, the int8 ones as int8 values plus scale and zero point.
+
+    Quantized tensors and dtypes pickle by looking their names up across every
+    loaded module, which trips transformers' lazy imports, so none are stored.
+    """
+    import torch
+
+    state = {}
+    quantized = _quantized_linears(model)
+    prefixes = tuple(f"{name}." for name, _ in quantized)
+    for key, value in model.state_dict().items():
+        if not key.startswith(prefixes):
+            state[key] = value
+    for name, m in quantized:
+        weight, bias = m._weight_bias()
+        state[f"{name}.weight_int8"] = weight.int_repr()
+        state[f"{name}.weight_scale"] = torch.tensor(weight.q_scale(), dtype=torch.float64)
+        state[f"{name}.weight_zero_point"] = torch.tensor(weight.q_zero_point())
+        if bias is not None:
+            state[f"{name}.bias"] = bias
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    try:
+        torch.save(state, tmp)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _load_cached(model_name, path):
+    """Rebuild the int8 model saved by ``_save_cached`` on an uninitialised copy of ``model_name``."""
+    import torch
+    from torch.ao.nn.quantized.dynamic import Linear as QuantizedLinear
+    from transformers import AutoConfig, AutoModelForCausalLM
+
+    try:
+        from transformers.initialization import no_init_weights
+    except ImportError:  # older transformers
+        from transformers.modeling_utils import no_init_weights
+
+    state = torch.load(path, map_location="cpu", weights_only=True)
+    int8 = {}
+    for key in [k for k in state if k.endswith(".weight_int8")]:
+        name = key[: -len(".weight_int8")]
+        weight = torch._make_per_tensor_quantized_tensor(
+            state.pop(key), float(state.pop(f"{name}.weight_scale")), int(state.pop(f"{name}.weight_zero_point"))
+        )
+        int8[name] = (weight, state.pop(f"{name}.bias", None))
+
+    with no_init_weights():
+        model = AutoModelForCausalLM.from_config(AutoConfig.from_pretrained(model_name))
+    conv1d_to_linear(model)
+    missing, unexpected = model.load_state_dict(state, strict=False)
+    if unexpected or {k.rsplit(".", 1)[0] for k in missing} - set(int8):
+        raise ValueError(f"int8 cache does not match {model_name}")
+    for name, (weight, bias) in int8.items():
+        parent, _, attr = name.rpartition(".")
+        quantized = QuantizedLinear(weight.shape[1], weight.shape[0], bias_=bias is not None, dtype=torch.qint8)
+        quantized.set_weight_bias(weight, bias)
+        setattr(model.get_submodule(parent), attr, quantized)
+    model.tie_weights()
+    model.quantized_precision = "int8"
+    return model.eval()
+
+
+def load_int8_pipeline(model_name, device=-1, cache_dir=None, log=None):
+    """A text-generation pipeline for ``model_name`` with int8 Linear layers.
+
+    Loads the converted weights from ``cache_dir`` when present, otherwise
+    quantizes the fp32 model and, with a ``cache_dir``, saves them there.
+    """
+    import torch
+    from transformers import AutoTokenizer, pipeline
+
+    log = log or logger
+    if device not in (-1, "cpu"):
+        raise ValueError("int8 dynamic quantization runs on the CPU only")
+
+    path = cache_path(cache_dir, model_name) if cache_dir else None
+    if path and os.path.exists(path):
+        try:
+            model = _load_cached(model_name, path)
+            log.info("Loaded int8 model from %s", path)
+            return pipeline("text-generation", model=model, tokenizer=AutoTokenizer.from_pretrained(model_name), device=-1)
+        except Exception:
+            log.warning("Could not load cached int8 model %s; converting again", path, exc_info=True)
+
+    p = pipeline("text-generation", model=model_name, device=-1, torch_dtype=torch.float32)
+    quantize_int8(p.model)
+    log.info("Quantized %s to int8 (%.1f MB)", model_name, model_nbytes(p.model) / 1e6)
+    if path:
+        try:
+            _save_cached(p.model, path)
+            log.info("Saved int8 model to %s", path)
+        except OSError:
+            log.warning("Could not save int8 model to %s", path, exc_info=True)
+    return p
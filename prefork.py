@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""Pre-fork serving: load the models once, then fork HTTP workers that share them.
+
+Running several copies of ``app.py`` gives each its own copy of every model,
+which a 4 GB Pi cannot afford for anything gpt2-sized. Here the master
+process loads the ``--preload`` models (default: ``PIPELINE_WARMUP``) and
+then forks ``--workers`` processes. The workers accept connections from one
+shared listening socket and serve the app. Forked memory is copy-on-write,
+and inference never writes to the weights, so every worker reads the
+master's copy. To keep those pages shared:
+
+- Weights are remapped onto the model's safetensors files with ``mmap``
+  where the file's dtype and shapes match. They then live in the page cache
+  rather than in each process's private memory.
+- ``gc.freeze()`` runs before forking, so the garbage collector does not
+  write to (and so copy) every inherited object.
+- The master never imports ``app``. Each worker imports it after the fork,
+  so SQLite connections, pools and background threads are its own.
+
+Conversation history is in SQLite (``CHAT_DB``), which every worker opens, so
+a session's turns stay consistent whichever worker serves them. The response
+cache's disk tier is shared too, and streaming transcription sessions are
+spooled to ``TRANSCRIBE_SPOOL_DIR``, so any worker can take the next chunk.
+The in-memory caches (responses, per-session KV), each worker's recognizers
+and ``/metrics`` counters are per worker.
+
+``/api/pipelines`` reports the serving worker's RSS and PSS. With
+``--report-interval`` the master also logs them for every worker. PSS
+splits shared pages between the processes that map them, so the PSS of all
+workers added together is what they really cost.
+
+    PIPELINE_WARMUP=distilgpt2@cpu python prefork.py --workers 3 --port 5000
+"""
+import argparse
+import gc
+import json
+import logging
+import mmap
+import os
+import signal
+import socket
+import struct
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# safetensors dtype names -> torch dtype attribute names
+SAFETENSORS_DTYPES = {
+    "F64": "float64", "F32": "float32", "F16": "float16", "BF16": "bfloat16",
+    "I64": "int64", "I32": "int32", "I16": "int16", "I8": "int8", "U8": "uint8", "BOOL": "bool",
+}
+
+
+def memory_usage(pid="self"):
+    """RSS, PSS and shared memory of process ``pid`` in MB (Linux), or None."""
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", encoding="ascii") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("Rss", "Pss", "Shared_Clean", "Shared_Dirty"):
+                    fields[key] = int(value.split()[0])
+    except (OSError, ValueError):
+        return None
+    return {
+        "pid": os.getpid() if pid == "self" else int(pid),
+        "rss_mb": round(fields.get("Rss", 0) / 1024, 1),
+        "pss_mb": round(fields.get("Pss", 0) / 1024, 1),
+        "shared_mb": round((fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0)) / 1024, 1),
+    }
+
+
+def safetensors_files(model_name):
+    """The safetensors files holding ``model_name``'s weights (local or in the hub cache), or []."""
+    if os.path.isdir(model_name):
+        directory = model_name
+    else:
+        try:
+            from transformers.utils import cached_file
+
+            found = None
+            for name in ("model.safetensors", "model.safetensors.index.json"):
+                found = cached_file(model_name, name, _raise_exceptions_for_missing_entries=False, local_files_only=True)
+                if found:
+                    break
+        except Exception:
+            found = None
+        if not found:
+            return []
+        directory = os.path.dirname(found)
+    index = os.path.join(directory, "model.safetensors.index.json")
+    if os.path.exists(index):
+        with open(index, encoding="utf-8") as f:
+            shards = sorted(set(json.load(f)["weight_map"].values()))
+        return [os.path.join(directory, name) for name in shards]
+    single = os.path.join(directory, "model.safetensors")
+    return [single] if os.path.exists(single) else []
+
+
+def mmap_safetensors(path):
+    """Map the tensors of one safetensors file without reading it; returns ``{name: tensor}``."""
+    import torch
+
+    with open(path, "rb") as f:
+        (header_len,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_len))
+        # a private mapping: pages are shared with the page cache until written
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    tensors = {}
+    for name, info in header.items():
+        if name == "__metadata__" or info["dtype"] not in SAFETENSORS_DTYPES:
+            continue
+        dtype = getattr(torch, SAFETENSORS_DTYPES[info["dtype"]])
+        start, end = info["data_offsets"]
+        count = (end - start) // dtype.itemsize
+        tensor = torch.frombuffer(mapped, dtype=dtype, count=count, offset=8 + header_len + start) if count else torch.empty(0, dtype=dtype)
+        tensors[name] = tensor.view(info["shape"])
+    return tensors
+
+
+def mmap_weights(model, files):
+    """Point ``model``'s weights at ``files`` mapped into memory; returns the bytes now file-backed.
+
+    Only tensors whose dtype and shape match the loaded model are swapped, so
+    models loaded at another precision (or quantized) keep their own copy.
+    """
+    current = model.state_dict()
+    prefix = getattr(model, "base_model_prefix", "")
+    state = {}
+    for path in files:
+        for name, tensor in mmap_safetensors(path).items():
+            # older checkpoints omit the base model prefix (e.g. "h.0..." for "transformer.h.0...")
+            key = name if name in current else f"{prefix}.{name}"
+            target = current.get(key)
+            if target is not None and not target.is_quantized and target.dtype == tensor.dtype and target.shape == tensor.shape:
+                state[key] = tensor
+    if not state:
+        return 0
+    model.load_state_dict(state, strict=False, assign=True)
+    if hasattr(model, "tie_weights"):
+        model.tie_weights()
+    return sum(t.numel() * t.element_size() for t in state.values())
+
+
+def preload(specs, log=None):
+    """Load each warm-up spec into ``generate.registry`` and map its weights; returns the count loaded."""
+    import generate
+
+    log = log or logger
+    loaded = 0
+    for spec in specs:
+        model = spec[0]
+        backend = spec[3] if len(spec) > 3 else None
+        if backend == "onnx":
+            # ONNX Runtime's thread pools do not survive a fork
+            log.warning("Not preloading %s: ONNX Runtime sessions are created in each worker", model)
+            continue
+        try:
+            p, _ = generate.registry.get(model=model, device_opt=spec[1], dtype=spec[2] if len(spec) > 2 else None, logger=log, backend=backend)
+        except Exception:
+            log.warning("Preloading %s failed; workers will load it themselves", model, exc_info=True)
+            continue
+        loaded += 1
+        for name, lm in ((model, getattr(p, "model", None)), (getattr(p, "draft_name", None), getattr(p, "draft_model", None))):
+            if lm is None or generate.backend_of(p) != "transformers":
+                continue
+            try:
+                nbytes = mmap_weights(lm, safetensors_files(name))
+            except Exception:
+                log.warning("Could not map %s weights from safetensors", name, exc_info=True)
+                continue
+            if nbytes:
+                log.info("Mapped %.1f MB of %s weights from safetensors", nbytes / 1e6, name)
+    return loaded
+
+
+def _serve_worker(sock, index):
+    """Worker process body: import the app and serve requests from the shared socket."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the master stops workers with SIGTERM
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    from werkzeug.serving import make_server
+
+    import app
+
+    host, port = sock.getsockname()[:2]
+    server = make_server(host, port, app.app, threaded=True, fd=sock.fileno())
+    logger.info("Worker %d (pid %d) serving", index, os.getpid())
+    server.serve_forever()
+
+
+class Master:
+    """Forks ``workers`` serving processes on ``sock`` and restarts any that exit."""
+
+    def __init__(self, sock, workers, report_interval=0):
+        self.sock = sock
+        self.workers = workers
+        self.report_interval = report_interval
+        self.children = {}
+        self.stopping = False
+
+    def spawn(self, index):
+        pid = os.fork()
+        if pid == 0:
+            status = 0
+            try:
+                _serve_worker(self.sock, index)
+            except BaseException:
+                logger.exception("Worker %d failed", index)
+                status = 1
+            finally:
+                os._exit(status)
+        self.children[pid] = (index, time.monotonic())
+
+    def stop(self, signum=None, frame=None):
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def report(self):
+        for pid, (index, _) in sorted(self.children.items(), key=lambda item: item[1][0]):
+            usage = memory_usage(pid)
+            if usage:
+                logger.info("Worker %d (pid %d): RSS %.1f MB, PSS %.1f MB, shared %.1f MB", index, pid, usage["rss_mb"], usage["pss_mb"], usage["shared_mb"])
+
+    def _report_loop(self):
+        while not self.stopping:
+            time.sleep(self.report_interval)
+            self.report()
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for index in range(self.workers):
+            self.spawn(index)
+        if self.report_interval:
+            threading.Thread(target=self._report_loop, name="memory-report", daemon=True).start()
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            index, started = self.children.pop(pid, (None, 0))
+            if index is None or self.stopping:
+                continue
+            logger.warning("Worker %d (pid %d) exited with status %d; restarting", index, pid, os.waitstatus_to_exitcode(status))
+            if time.monotonic() - started < 1.0:
+                time.sleep(1.0)  # do not spin on a worker that fails at startup
+            self.spawn(index)
+        return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--workers", "-w", type=int, default=2, help="Worker processes (default: 2)")
+    parser.add_argument("--preload", default=os.environ.get("PIPELINE_WARMUP", ""), help="Models to load before forking, as PIPELINE_WARMUP specs (default: $PIPELINE_WARMUP)")
+    parser.add_argument("--report-interval", type=float, default=0, help="Log every worker's RSS/PSS this often, in seconds (default: 0, never)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s: %(message)s")
+
+    from workers import torch_threads_for
+
+    import generate
+    from store import ConversationStore
+
+    # workers split the cores, as GENERATE_WORKERS threads do within one process
+    generate_workers = int(os.environ.get("GENERATE_WORKERS", "1"))
+    threads = torch_threads_for(args.workers * generate_workers, reserved=args.workers * int(os.environ.get("TRANSCRIBE_WORKERS", "1")))
+    os.environ.setdefault("TORCH_THREADS", str(threads))
+    generate.ONNX_THREADS = generate.ONNX_THREADS or threads
+
+    # import the legacy history once, before the workers race to
+    store = ConversationStore(os.environ.get("CHAT_DB", "chat_state.db"))
+    store.migrate_json("chat_state.json", session="default")
+    store.close()
+
+    specs = generate.parse_warmup_spec(args.preload)
+    if not specs:
+        logger.warning("Nothing to preload; each worker will load its own copy of every model")
+    elif preload(specs):
+        usage = memory_usage()
+        if usage:
+            logger.info("Master holds %.1f MB RSS after preloading", usage["rss_mb"])
+    gc.collect()
+    gc.freeze()
+
+    sock = socket.create_server((args.host, args.port), backlog=128)
+    # non-blocking, so a worker that loses the race for a connection goes back to waiting
+    sock.setblocking(False)
+    logger.info("Serving on http://%s:%d with %d workers", args.host, args.port, args.workers)
+    return Master(sock, args.workers, args.report_interval).run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
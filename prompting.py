@@ -0,0 +1,155 @@
+"""Token-budgeted chat prompt assembly with cached per-message tokenization.
+
+``PromptBuilder`` tokenizes each ``User:``/``AI:`` line once and remembers the
+ids, then fills the context from the newest message backwards until the
+budget (model context length minus ``max_new_tokens``) is used. The result
+carries both the token ids, ready to feed to the model, and the equivalent
+text for pipelines that only accept strings.
+
+Given a session, the builder also keeps the window start (its "anchor") fixed
+until the window no longer fits, then moves it forward far enough to leave
+half the budget free. Consecutive prompts therefore share a prefix, which is
+what lets ``kvcache.SessionKVCache`` skip re-prefilling it.
+"""
+import threading
+from collections import OrderedDict, namedtuple
+
+BuiltPrompt = namedtuple("BuiltPrompt", ["ids", "text", "n_messages"])
+
+SUFFIX = "AI:"
+
+
+def format_message(msg):
+    prefix = "User: " if msg["role"] == "user" else "AI: "
+    return prefix + msg["text"] + "\n"
+
+
+def context_length(p, default=1024):
+    """Maximum sequence length of the pipeline's model."""
+    config = getattr(getattr(p, "model", None), "config", None)
+    for attr in ("max_position_embeddings", "n_positions"):
+        value = getattr(config, attr, None)
+        if value:
+            return int(value)
+    value = getattr(getattr(p, "tokenizer", None), "model_max_length", None)
+    if value and value < 1_000_000:
+        return int(value)
+    return default
+
+
+class PromptBuilder:
+    """Build chat prompts within a token budget, tokenizing each message once."""
+
+    def __init__(self, tokenizer, max_length=1024, cache_size=4096, max_sessions=1024):
+        self.tokenizer = tokenizer
+        self.max_length = max_length
+        self.cache_size = cache_size
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._ids = OrderedDict()
+        self._anchors = OrderedDict()
+        self.suffix_ids = self._tokenize(SUFFIX)
+        self.hits = 0
+        self.misses = 0
+
+    def _tokenize(self, text):
+        return list(self.tokenizer(text, add_special_tokens=False)["input_ids"])
+
+    def encode_message(self, msg):
+        """Token ids for one formatted message, from the cache when possible."""
+        key = (msg["role"], msg["text"])
+        with self._lock:
+            ids = self._ids.get(key)
+            if ids is not None:
+                self._ids.move_to_end(key)
+                self.hits += 1
+                return ids
+        ids = self._tokenize(format_message(msg))
+        with self._lock:
+            self.misses += 1
+            self._ids[key] = ids
+            while len(self._ids) > self.cache_size:
+                self._ids.popitem(last=False)
+        return ids
+
+    def _anchor(self, session, turns):
+        with self._lock:
+            anchor = self._anchors.get(session)
+        if anchor is None:
+            return None
+        for i, msg in enumerate(turns):
+            if msg.get("id") == anchor:
+                return i
+        return None
+
+    def _set_anchor(self, session, msg):
+        with self._lock:
+            self._anchors[session] = msg.get("id")
+            self._anchors.move_to_end(session)
+            while len(self._anchors) > self.max_sessions:
+                self._anchors.popitem(last=False)
+
+    def build(self, turns, max_new_tokens=120, session=None):
+        """Assemble ``turns`` (oldest first) into a prompt ending in ``AI:``.
+
+        Messages are taken newest first while they fit in
+        ``max_length - max_new_tokens``; the newest message is always kept,
+        trimmed from the left if it alone exceeds the budget, in which case
+        the text is decoded from the trimmed ids.
+        """
+        budget = max(1, self.max_length - max_new_tokens - len(self.suffix_ids))
+        encoded = [self.encode_message(m) for m in turns]
+        if not encoded:
+            return BuiltPrompt(list(self.suffix_ids), SUFFIX, 0)
+
+        # oldest index whose suffix of messages still fits
+        used = 0
+        start = len(encoded)
+        for i in range(len(encoded) - 1, -1, -1):
+            if used + len(encoded[i]) > budget and start < len(encoded):
+                break
+            used += len(encoded[i])
+            start = i
+
+        if session is not None:
+            with self._lock:
+                known = session in self._anchors
+            anchor = self._anchor(session, turns)
+            if anchor is not None and anchor >= start:
+                start = anchor
+            elif known:
+                # the old window no longer fits: move the anchor forward,
+                # leaving half the budget to grow into
+                total = sum(len(e) for e in encoded[start:])
+                while start < len(encoded) - 1 and total > budget // 2:
+                    total -= len(encoded[start])
+                    start += 1
+            self._set_anchor(session, turns[start])
+
+        ids = [t for e in encoded[start:] for t in e]
+        if len(ids) > budget:
+            # the text must say what the ids say, or string-only pipelines see the untrimmed message
+            ids = ids[-budget:]
+            text = self.tokenizer.decode(ids) + SUFFIX
+        else:
+            text = "".join(format_message(m) for m in turns[start:]) + SUFFIX
+        return BuiltPrompt(ids + list(self.suffix_ids), text, len(encoded) - start)
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "cached_messages": len(self._ids), "sessions": len(self._anchors)}
+
+
+def prompt_builder_for(p):
+    """Return the ``PromptBuilder`` attached to pipeline ``p``, or None for pipelines without a tokenizer."""
+    builder = getattr(p, "_prompt_builder", None)
+    if builder is None:
+        tokenizer = getattr(p, "tokenizer", None)
+        if tokenizer is None:
+            return None
+        builder = PromptBuilder(tokenizer, max_length=context_length(p))
+        try:
+            p._prompt_builder = builder
+        except Exception:
+            pass
+    return builder
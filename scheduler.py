@@ -0,0 +1,174 @@
+"""Dynamic micro-batching in front of ``generate.generate_text``.
+
+Concurrent callers submit prompts; a background thread collects them for up
+to ``max_wait`` seconds (or until ``max_batch_size`` is reached), groups
+prompts that share a pipeline and sampling parameters, runs each group as a
+single padded batch and hands every caller its own result. Given a ``pool``
+(a ``workers.InferencePool``), batches execute on its threads, so they count
+against the same worker limit, and use the same torch thread settings, as
+generation that is not batched.
+"""
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import generate
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class _Request:
+    __slots__ = ("pipeline", "prompt", "input_ids", "kwargs", "deadline", "key", "future", "timings")
+
+    def __init__(self, pipeline, prompt, kwargs):
+        self.pipeline = pipeline
+        self.prompt = prompt
+        # a deadline and the tokenized prompt are per caller, not generation parameters
+        self.deadline = kwargs.pop("deadline", None)
+        self.input_ids = kwargs.pop("input_ids", None)
+        self.kwargs = kwargs
+        # requests can share a batch only if every generation parameter matches
+        self.key = (id(pipeline), tuple(sorted(kwargs.items())))
+        self.future = Future()
+        # the caller's collector; a batch's stages are added to each of its requests
+        self.timings = metrics.current()
+
+
+class BatchScheduler:
+    """Queue prompts and run compatible ones together as padded batches.
+
+    ``runner`` is called as ``runner(pipeline, prompt_or_prompts, **kwargs)``
+    and defaults to ``generate.generate_text``; with a list of prompts it must
+    return one result list per prompt, as the transformers pipeline and the
+    dry-run mock do. A ``deadline`` keyword is not a batching parameter: a
+    batch runs until the latest deadline among its requests. ``input_ids``
+    (the tokenized prompt) is not one either; when every request in a batch
+    has them, the runner gets ``input_ids`` too, one list per prompt. With a
+    ``pool``, each batch is run by ``pool.submit`` rather than on the
+    scheduler's own thread, up to ``pool.workers`` batches at a time; the
+    next batch is collected while those run.
+    """
+
+    def __init__(self, max_batch_size=8, max_wait=0.01, runner=None, pool=None):
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait))
+        self._runner = runner or generate.generate_text
+        self._pool = pool
+        # a slot per pool worker, taken before a batch is collected and freed when it finishes
+        self._slots = threading.Semaphore(pool.workers) if pool is not None else None
+        self._queue = queue.Queue()
+        self._pending = deque()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.batches = 0
+        self.requests = 0
+        self.largest_batch = 0
+
+    def submit(self, pipeline, prompt, **kwargs):
+        """Queue ``prompt`` for generation and return a ``Future`` for its result."""
+        req = _Request(pipeline, prompt, kwargs)
+        self._ensure_worker()
+        self._queue.put(req)
+        return req.future
+
+    def generate(self, pipeline, prompt, timeout=None, **kwargs):
+        """Blocking helper: submit and wait for the result."""
+        return self.submit(pipeline, prompt, **kwargs).result(timeout=timeout)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "batches": self.batches,
+                "requests": self.requests,
+                "largest_batch": self.largest_batch,
+                "mean_batch": (self.requests / self.batches) if self.batches else 0.0,
+            }
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="batch-scheduler", daemon=True)
+                self._thread.start()
+
+    def _next(self, timeout=None):
+        if self._pending:
+            return self._pending.popleft()
+        if timeout is not None and timeout <= 0:
+            return self._queue.get_nowait()
+        return self._queue.get(timeout=timeout)
+
+    def _collect(self):
+        """Block for one request, then gather compatible ones within the wait window."""
+        first = self._next()
+        batch = [first]
+        # requests already waiting that match go straight in
+        skipped = deque()
+        while self._pending and len(batch) < self.max_batch_size:
+            req = self._pending.popleft()
+            (batch if req.key == first.key else skipped).append(req)
+        self._pending.extendleft(reversed(skipped))
+
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            try:
+                req = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if req.key == first.key:
+                batch.append(req)
+            else:
+                self._pending.append(req)
+        return batch
+
+    def _run(self, batch):
+        # callers that gave up (cancelled their future) are dropped from the batch
+        batch = [req for req in batch if req.future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        head = batch[0]
+        kwargs = dict(head.kwargs)
+        if all(req.deadline is not None for req in batch):
+            # run until the most patient caller gives up; the others stop waiting on their own
+            kwargs["deadline"] = max(req.deadline for req in batch)
+        try:
+            with metrics.collect() as timings:
+                if len(batch) == 1:
+                    if head.input_ids is not None:
+                        kwargs["input_ids"] = head.input_ids
+                    results = [self._runner(head.pipeline, head.prompt, **kwargs)]
+                else:
+                    prompts = [req.prompt for req in batch]
+                    if all(req.input_ids is not None for req in batch):
+                        kwargs["input_ids"] = [req.input_ids for req in batch]
+                    results = self._runner(head.pipeline, prompts, batch_size=len(prompts), **kwargs)
+        except Exception as e:
+            for req in batch:
+                req.future.set_exception(e)
+            return
+        for req in batch:
+            if req.timings is not None:
+                req.timings.merge(timings)
+
+        for req, res in zip(batch, results):
+            req.future.set_result(res)
+
+    def _loop(self):
+        while True:
+            if self._slots is not None:
+                # while every worker is busy, arrivals queue up to form the next batch
+                self._slots.acquire()
+            batch = self._collect()
+            with self._lock:
+                self.batches += 1
+                self.requests += len(batch)
+                self.largest_batch = max(self.largest_batch, len(batch))
+            logger.debug("Running batch of %d", len(batch))
+            if self._pool is None:
+                self._run(batch)
+            else:
+                # _run reports errors through the futures, so nothing waits on this one
+                self._pool.submit(self._run, batch).add_done_callback(lambda _: self._slots.release())
@@ -1,62 +1,49 @@
 #!/usr/bin/env python3
 """
-Download and extract a VOSK model (small English by default) into `models/`.
+Download and install a VOSK model (small English by default) into `models/`.
 
 Usage:
   python scripts/download_vosk_model.py
+  python scripts/download_vosk_model.py --url <zip url> --name <model-name> --sha256 <digest>
 
-This script downloads the model zip and extracts it to models/<model-name>.
+The zip is fetched with resume and checksum verification and extracted
+atomically to models/<model-name>, which is recorded in models/manifest.json
+(see artifacts.py). Running it again after an interrupted download picks up
+where it stopped; running it when the model is installed does nothing.
 """
+import argparse
+import logging
 import os
 import sys
-import argparse
-import shutil
-from urllib.request import urlopen
-from urllib.error import URLError
-import zipfile
 
-MODEL_URL = "https://alphacephei.com/vosk/models/vosk-model-small-en-us-0.15.zip"
-MODEL_DIRNAME = "vosk-model-small-en-us-0.15"
-
-
-def download(url, out_path):
-    print(f"Downloading {url} -> {out_path}")
-    try:
-        with urlopen(url) as resp, open(out_path, "wb") as out:
-            shutil.copyfileobj(resp, out)
-    except URLError as e:
-        print("Download failed:", e)
-        sys.exit(1)
+# allow running as `python scripts/download_vosk_model.py` from the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from artifacts import MODELS_DIR, ArtifactError, install  # noqa: E402
 
-def extract(zip_path, target_dir):
-    print(f"Extracting {zip_path} -> {target_dir}")
-    with zipfile.ZipFile(zip_path, "r") as z:
-        z.extractall(target_dir)
+MODEL_URL = "https://alphacephei.com/vosk/models/vosk-model-small-en-us-0.15.zip"
+MODEL_DIRNAME = "vosk-model-small-en-us-0.15"
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument("--url", default=MODEL_URL)
-    parser.add_argument("--out-dir", default="models")
+    parser.add_argument("--name", help="Model directory name (default: the zip's name without .zip)")
+    parser.add_argument("--sha256", help="Expected SHA-256 of the zip")
+    parser.add_argument("--out-dir", default=MODELS_DIR)
+    parser.add_argument("--force", action="store_true", help="Install again even if already installed")
     args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
 
-    os.makedirs(args.out_dir, exist_ok=True)
-    zip_name = os.path.join(args.out_dir, os.path.basename(args.url))
-    if not os.path.exists(zip_name):
-        download(args.url, zip_name)
-    else:
-        print("Zip already downloaded:", zip_name)
-
-    # extract
-    extract(zip_name, args.out_dir)
-
-    final_path = os.path.join(args.out_dir, MODEL_DIRNAME)
-    if os.path.exists(final_path):
-        print("Model available at:", final_path)
-    else:
-        print("Extraction finished but model folder not found. Check the zip contents.")
+    name = args.name or os.path.basename(args.url).rsplit(".zip", 1)[0] or MODEL_DIRNAME
+    try:
+        path = install(name, args.url, args.out_dir, args.sha256, args.force)
+    except ArtifactError as e:
+        print("Download failed:", e)
+        return 1
+    print("Model available at:", path)
+    return 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -2,9 +2,13 @@
 """
 Record audio from the default microphone (short clip) and POST to /api/transcribe,
 then send the transcription to /api/chat. Requires `sounddevice` and `soundfile`.
+
+With --stream, audio is sent in small PCM chunks to /api/transcribe/stream while
+recording, so the transcript is ready as soon as recording stops.
 """
 import sys
 import argparse
+import queue
 import sounddevice as sd
 import soundfile as sf
 import requests
@@ -12,6 +16,8 @@ import requests
 parser = argparse.ArgumentParser()
 parser.add_argument("--duration", type=float, default=5.0)
 parser.add_argument("--url", default="http://localhost:5000")
+parser.add_argument("--stream", action="store_true", help="Stream audio chunks while recording")
+parser.add_argument("--chunk-ms", type=int, default=250, help="Chunk length in --stream mode (default: 250)")
 args = parser.parse_args()
 
 def record_to_wav(duration, filename, samplerate=16000):
@@ -21,7 +27,48 @@ def record_to_wav(duration, filename, samplerate=16000):
     sf.write(filename, data, samplerate)
 
 
+def stream_transcribe(duration, url, samplerate=16000, chunk_ms=250):
+    """Record for ``duration`` seconds, posting int16 PCM chunks as they are captured."""
+    chunks = queue.Queue()
+
+    def callback(indata, frames, time_info, status):
+        chunks.put(bytes(indata))
+
+    http = requests.Session()
+    r = http.post(url + '/api/transcribe/stream', json={'sample_rate': samplerate})
+    if r.status_code != 200:
+        print('Transcription failed:', r.text)
+        sys.exit(1)
+    sid = r.json()['session']
+
+    blocksize = int(samplerate * chunk_ms / 1000)
+    total = int(duration * samplerate)
+    sent = 0
+    print(f"Recording {duration}s (streaming)...")
+    with sd.RawInputStream(samplerate=samplerate, channels=1, dtype='int16', blocksize=blocksize, callback=callback):
+        while sent < total:
+            chunk = chunks.get()
+            sent += len(chunk) // 2
+            res = http.post(f"{url}/api/transcribe/stream/{sid}", data=chunk).json()
+            if res.get('partial'):
+                print('...', res['partial'], end='\r', flush=True)
+            elif res.get('text'):
+                print('>>>', res['text'])
+    r = http.post(f"{url}/api/transcribe/stream/{sid}/end")
+    if r.status_code != 200:
+        print('Transcription failed:', r.text)
+        sys.exit(1)
+    return r.json().get('text', '')
+
+
 def main():
+    if args.stream:
+        text = stream_transcribe(args.duration, args.url, chunk_ms=args.chunk_ms)
+        print('Transcribed:', text)
+        r2 = requests.post(args.url + '/api/chat', json={'message': text, 'dry_run': True})
+        print('AI reply:', r2.json())
+        return
+
     import tempfile
     tf = tempfile.NamedTemporaryFile(suffix='.wav', delete=False)
     fname = tf.name
@@ -0,0 +1,125 @@
+"""Assisted (speculative) decoding with a small draft model.
+
+With ``--draft-model`` (or ``draft_model`` in ``/api/chat``) the draft model
+proposes a few tokens at a time and the target model checks them all in one
+forward pass, keeping the longest prefix it agrees with plus one token of
+its own. transformers' ``generate(assistant_model=...)`` does the work;
+greedy output is identical to decoding with the target alone, and sampled
+output follows the target's distribution. transformers adjusts how many
+tokens are drafted per step and cuts a draft short when the draft model is
+unsure of its next token.
+
+Draft and target are loaded together and cached as one registry entry
+(``AssistedPipeline``). Assisted generation decodes one sequence at a time,
+so batched prompts and ``num_return_sequences > 1`` fall back to the plain
+pipeline.
+
+Per request, forward-pass hooks count the draft's proposals and the
+target's verification passes:
+
+- accepted tokens = generated tokens - target passes (each pass yields the
+  accepted draft tokens plus one from the target)
+- accept rate = accepted / proposed
+- tokens per target pass: the decode speedup over one token per pass,
+  before the draft's own cost
+"""
+import contextvars
+import logging
+
+import generate
+import metrics
+
+logger = logging.getLogger(__name__)
+
+_counts = contextvars.ContextVar("speculative_counts", default=None)
+
+
+def _count(kind):
+    def hook(module, args, output):
+        counts = _counts.get()
+        if counts is not None:
+            counts[kind] += 1
+
+    return hook
+
+
+def load_draft(model_name, target, dtype=None, log=None):
+    """Load ``model_name`` as a draft for ``target``: same device and precision, same vocabulary."""
+    import torch
+    from transformers import AutoModelForCausalLM
+
+    from precision import quantize_int8
+
+    log = log or logger
+    if dtype == "int8":
+        draft = quantize_int8(AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=torch.float32))
+    else:
+        draft = AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=getattr(torch, dtype) if dtype else None).to(target.device)
+    if draft.config.vocab_size != target.config.vocab_size:
+        raise ValueError(f"draft model {model_name} has a different vocabulary from the target ({draft.config.vocab_size} vs {target.config.vocab_size} tokens)")
+    log.info("Loaded draft model %s", model_name)
+    return draft.eval()
+
+
+class AssistedPipeline:
+    """A text-generation pipeline whose single-sequence calls are drafted by ``draft_model``."""
+
+    def __init__(self, pipeline, draft_model, draft_name):
+        self.pipeline = pipeline
+        self.model = pipeline.model
+        self.tokenizer = pipeline.tokenizer
+        self.draft_model = draft_model
+        self.draft_name = draft_name
+        self.model.register_forward_hook(_count("target_passes"))
+        self.draft_model.register_forward_hook(_count("draft_tokens"))
+
+    def __call__(self, prompt, max_new_tokens=20, return_full_text=True, num_return_sequences=1, truncation=False, pad_token_id=None, batch_size=None, **gen_kwargs):
+        if not isinstance(prompt, str) or num_return_sequences != 1:
+            return self.pipeline(
+                prompt, max_new_tokens=max_new_tokens, return_full_text=return_full_text, num_return_sequences=num_return_sequences,
+                truncation=truncation, pad_token_id=pad_token_id, batch_size=batch_size, **gen_kwargs,
+            )
+        enc = self.tokenizer(prompt, return_tensors="pt", truncation=bool(truncation))
+        text = self._assisted(enc.input_ids, max_new_tokens, pad_token_id, gen_kwargs)
+        return [{"generated_text": prompt + text if return_full_text else text}]
+
+    def from_ids(self, input_ids, max_new_tokens=20, num_return_sequences=1, pad_token_id=None, batch_size=None, **gen_kwargs):
+        """``generate.generate_from_ids`` for this pipeline, drafted when it is one sequence."""
+        if not isinstance(input_ids[0], int) or num_return_sequences != 1:
+            return generate.generate_from_ids(
+                self.pipeline, input_ids, max_new_tokens=max_new_tokens, num_return_sequences=num_return_sequences, pad_token_id=pad_token_id, **gen_kwargs
+            )
+        import torch
+
+        return [{"generated_text": self._assisted(torch.tensor([list(input_ids)]), max_new_tokens, pad_token_id, gen_kwargs)}]
+
+    def _assisted(self, input_ids, max_new_tokens, pad_token_id, gen_kwargs):
+        import torch
+
+        input_ids = input_ids.to(self.model.device)
+        prompt_length = input_ids.shape[1]
+        for criterion in gen_kwargs.get("stopping_criteria") or ():
+            # several tokens can be accepted per step, so the prompt length cannot be inferred
+            if getattr(criterion, "prompt_length", 0) is None:
+                criterion.prompt_length = prompt_length
+
+        counts = {"target_passes": 0, "draft_tokens": 0}
+        token = _counts.set(counts)
+        try:
+            with torch.no_grad():
+                sequences = self.model.generate(
+                    input_ids=input_ids, attention_mask=torch.ones_like(input_ids), assistant_model=self.draft_model,
+                    max_new_tokens=max_new_tokens, pad_token_id=pad_token_id, **gen_kwargs
+                )
+        finally:
+            _counts.reset(token)
+
+        generated = sequences[0, prompt_length:]
+        for processor in gen_kwargs.get("logits_processor") or ():
+            if isinstance(processor, metrics.DecodeTimer):
+                # processors run on every drafted position, not just the kept ones
+                processor.tokens = len(generated)
+        metrics.observe_speculation(len(generated), counts["draft_tokens"], max(0, len(generated) - counts["target_passes"]), counts["target_passes"])
+
+        # decoded the way the pipeline does: new tokens only, special tokens dropped
+        return self.tokenizer.decode(generated, skip_special_tokens=True, clean_up_tokenization_spaces=True)
@@ -0,0 +1,153 @@
+"""Append-only, per-session conversation store backed by SQLite in WAL mode.
+
+Each turn is one row, so appending costs the same regardless of history size,
+and ``last(session, n)`` is an indexed range scan. Nothing is kept in memory
+beyond SQLite's page cache; old turns are trimmed by ``compact`` (optionally
+on a background thread). Legacy JSON history files can be imported with
+``migrate_json``.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS turns (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session TEXT NOT NULL,
+    role TEXT NOT NULL,
+    text TEXT NOT NULL,
+    ts REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS turns_session_id ON turns (session, id);
+"""
+
+
+class ConversationStore:
+    """Session-keyed conversation history.
+
+    Connections are per thread, so one store can be shared by Flask request
+    threads and the background compactor.
+    """
+
+    def __init__(self, path, max_turns=1000):
+        self.path = path
+        self.max_turns = max_turns
+        self._local = threading.local()
+        self._compactor = None
+        self._stop = threading.Event()
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def append(self, session, role, text):
+        """Append one turn and return its row id."""
+        with self._conn() as conn:
+            cur = conn.execute(
+                "INSERT INTO turns (session, role, text, ts) VALUES (?, ?, ?, ?)",
+                (session, role, text, time.time()),
+            )
+            return cur.lastrowid
+
+    def last(self, session, n):
+        """Return the last ``n`` turns of ``session``, oldest first."""
+        rows = self._conn().execute(
+            "SELECT id, role, text FROM turns WHERE session = ? ORDER BY id DESC LIMIT ?",
+            (session, int(n)),
+        ).fetchall()
+        return [{"id": r[0], "role": r[1], "text": r[2]} for r in reversed(rows)]
+
+    def count(self, session):
+        return self._conn().execute("SELECT COUNT(*) FROM turns WHERE session = ?", (session,)).fetchone()[0]
+
+    def sessions(self):
+        return [r[0] for r in self._conn().execute("SELECT DISTINCT session FROM turns ORDER BY session")]
+
+    def clear(self, session):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM turns WHERE session = ?", (session,))
+
+    def compact(self, max_turns=None):
+        """Keep only the newest ``max_turns`` turns per session; return rows removed."""
+        max_turns = self.max_turns if max_turns is None else max_turns
+        if not max_turns:
+            return 0
+        with self._conn() as conn:
+            cur = conn.execute(
+                """
+                DELETE FROM turns WHERE id IN (
+                    SELECT id FROM (
+                        SELECT id, ROW_NUMBER() OVER (PARTITION BY session ORDER BY id DESC) AS rn
+                        FROM turns
+                    ) WHERE rn > ?
+                )
+                """,
+                (int(max_turns),),
+            )
+            removed = cur.rowcount
+        if removed:
+            self._conn().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return removed
+
+    def start_compactor(self, interval=300.0):
+        """Run ``compact`` every ``interval`` seconds on a daemon thread."""
+        if self._compactor is not None:
+            return
+
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    removed = self.compact()
+                    if removed:
+                        logger.debug("Compacted %d old turns", removed)
+                except Exception:
+                    logger.warning("Conversation store compaction failed", exc_info=True)
+
+        self._compactor = threading.Thread(target=loop, name="store-compactor", daemon=True)
+        self._compactor.start()
+
+    def close(self):
+        self._stop.set()
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    def migrate_json(self, json_path, session):
+        """Import a legacy JSON history file into ``session``.
+
+        Accepts both the app's ``{"history": [...]}`` layout and the REPL's
+        plain list. The file is renamed to ``<name>.migrated`` afterwards so it
+        is imported only once. Returns the number of turns imported.
+        """
+        if not json_path or not os.path.exists(json_path):
+            return 0
+        try:
+            with open(json_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception:
+            logger.warning("Could not read %s for migration", json_path)
+            return 0
+        turns = data.get("history", []) if isinstance(data, dict) else data
+        rows = [
+            (session, t.get("role", "user"), t.get("text", ""), time.time())
+            for t in turns
+            if isinstance(t, dict)
+        ]
+        with self._conn() as conn:
+            conn.executemany("INSERT INTO turns (session, role, text, ts) VALUES (?, ?, ?, ?)", rows)
+        os.replace(json_path, json_path + ".migrated")
+        logger.info("Migrated %d turns from %s", len(rows), json_path)
+        return len(rows)
@@ -0,0 +1,30 @@
+"""Fixtures shared by the API tests: an empty conversation store and a Flask test client."""
+import os
+import tempfile
+import unittest
+from contextlib import contextmanager
+
+import app
+from store import ConversationStore
+
+
+@contextmanager
+def temp_store():
+    """Swap ``app.store`` for an empty ``ConversationStore`` in a temporary directory."""
+    with tempfile.TemporaryDirectory() as tmp:
+        saved, app.store = app.store, ConversationStore(os.path.join(tmp, "chat.db"))
+        try:
+            yield app.store
+        finally:
+            app.store.close()
+            app.store = saved
+
+
+class AppTestCase(unittest.TestCase):
+    """Gives each test a Flask test client (``self.client``) and an empty conversation store."""
+
+    def setUp(self):
+        store = temp_store()
+        store.__enter__()
+        self.addCleanup(store.__exit__, None, None, None)
+        self.client = app.app.test_client()
@@ -0,0 +1,10 @@
+"""Point the app's conversation database and transcription spool at a scratch directory before any test imports it."""
+import atexit
+import os
+import shutil
+import tempfile
+
+_scratch = tempfile.mkdtemp(prefix="chat-db-")
+os.environ["CHAT_DB"] = os.path.join(_scratch, "chat_state.db")
+os.environ["TRANSCRIBE_SPOOL_DIR"] = os.path.join(_scratch, "transcribe-sessions")
+atexit.register(shutil.rmtree, _scratch, ignore_errors=True)
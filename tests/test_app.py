@@ -0,0 +1,235 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+
+import app
+from apphelpers import AppTestCase
+from tiny_model import HAVE_TORCH
+from workers import InferencePool
+
+try:
+    import vosk
+except ImportError:
+    vosk = None
+
+
+class ChatApiTests(AppTestCase):
+    def test_chat_dry_run(self):
+        res = self.client.post("/api/chat", json={"message": "Hello"})
+        self.assertEqual(res.status_code, 200)
+        self.assertIn("[DRY RUN]", res.get_json()["reply"])
+
+    def test_chat_stream_sends_tokens_then_done(self):
+        res = self.client.post("/api/chat/stream", json={"message": "Hello"})
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.mimetype.startswith("text/event-stream"))
+        events = [e for e in res.get_data(as_text=True).split("\n\n") if e]
+        tokens = [json.loads(e[len("data: "):])["token"] for e in events if e.startswith("data: ")]
+        self.assertGreater(len(tokens), 1)
+        self.assertTrue(events[-1].startswith("event: done"))
+        done = json.loads(events[-1].split("data: ", 1)[1])
+        self.assertEqual(done["reply"], "".join(tokens).strip())
+        self.assertEqual(app.store.last("default", 1)[0]["text"], done["reply"])
+
+    def test_disconnect_stops_stream_and_frees_slot(self):
+        stopped = threading.Event()
+
+        def endless(p, prompt, cancel=None, **kwargs):
+            while not cancel.is_set():
+                yield "word "
+                time.sleep(0.01)
+            stopped.set()
+
+        saved, app.generate.stream_text = app.generate.stream_text, endless
+        try:
+            res = self.client.post("/api/chat/stream", json={"message": "Hello"}, buffered=False)
+            self.assertIn("token", next(res.response).decode())
+            res.close()
+            self.assertTrue(stopped.wait(5))
+        finally:
+            app.generate.stream_text = saved
+        self.assertEqual(app.generation_pool.in_flight, 0)
+
+    def test_sessions_are_kept_apart(self):
+        self.client.post("/api/chat", json={"message": "from alice", "session": "alice"})
+        self.client.post("/api/chat", json={"message": "from bob", "session": "bob"})
+        res = self.client.get("/api/history?session=bob")
+        texts = [t["text"] for t in res.get_json()["history"]]
+        self.assertEqual(texts[0], "from bob")
+        self.assertFalse(any("alice" in t for t in texts))
+
+    def test_chat_stream_requires_message(self):
+        res = self.client.post("/api/chat/stream", json={})
+        self.assertEqual(res.status_code, 400)
+
+
+class KvRoutingTests(unittest.TestCase):
+    def setUp(self):
+        self.saved = app.kv_cache, app.batcher
+        app.kv_cache, app.batcher = object(), object()
+        self.pipeline = SimpleNamespace(model=object(), tokenizer=object())
+
+    def tearDown(self):
+        app.kv_cache, app.batcher = self.saved
+
+    def test_kv_cache_only_when_alone(self):
+        with app.generation_pool.admission():
+            self.assertTrue(app.use_kv_cache(self.pipeline, {}))
+            self.assertFalse(app.use_kv_cache(self.pipeline, {"num_return_sequences": 2}))
+            with app.generation_pool.admission():
+                # concurrent requests go to the batcher
+                self.assertFalse(app.use_kv_cache(self.pipeline, {}))
+                app.batcher = None
+                self.assertTrue(app.use_kv_cache(self.pipeline, {}))
+
+
+@unittest.skipUnless(HAVE_TORCH, "torch/transformers not installed")
+class PromptIdsTests(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        from transformers import PreTrainedTokenizerBase
+
+        from tiny_model import save_model
+
+        tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmpdir.cleanup)
+        self.model_dir = save_model(os.path.join(tmpdir.name, "tiny"))
+        self.saved = app.kv_cache, app.batcher, PreTrainedTokenizerBase.__call__
+        self.addCleanup(self.restore)
+        self.calls = []
+        tokenize = PreTrainedTokenizerBase.__call__
+
+        def counting(tokenizer, *args, **kwargs):
+            self.calls.append(args[0] if args else kwargs.get("text"))
+            return tokenize(tokenizer, *args, **kwargs)
+
+        PreTrainedTokenizerBase.__call__ = counting
+
+    def restore(self):
+        from transformers import PreTrainedTokenizerBase
+
+        app.kv_cache, app.batcher, PreTrainedTokenizerBase.__call__ = self.saved
+        app.generate.registry.clear()
+
+    def tokenizer_calls(self, path, message):
+        body = {"message": "hello", "model": self.model_dir, "dry_run": False, "max_new_tokens": 4, "no_sample": True}
+        # the first request loads the model and its prompt builder
+        self.client.post(path, json=dict(body, session="warm"))
+        del self.calls[:]
+        self.assertEqual(self.client.post(path, json=dict(body, message=message, session="fresh")).status_code, 200)
+        return list(self.calls)
+
+    def test_pool_path_tokenizes_only_the_new_message(self):
+        app.kv_cache, app.batcher = None, None
+        self.assertEqual(self.tokenizer_calls("/api/chat", "the cat"), ["User: the cat\n"])
+
+    def test_batcher_and_stream_do_not_tokenize_the_prompt_again(self):
+        app.kv_cache = None
+        self.assertEqual(len(self.tokenizer_calls("/api/chat", "the cat")), 1)
+        self.assertEqual(len(self.tokenizer_calls("/api/chat/stream", "the dog")), 1)
+
+
+class TranscribeStreamTests(unittest.TestCase):
+    def setUp(self):
+        self.client = app.app.test_client()
+
+    def test_unknown_session(self):
+        self.assertEqual(self.client.post("/api/transcribe/stream/nope", data=b"\0\0").status_code, 404)
+        self.assertEqual(self.client.post("/api/transcribe/stream/nope/end").status_code, 404)
+
+    def test_missing_model(self):
+        old = os.environ.get("VOSK_MODEL_PATH")
+        os.environ["VOSK_MODEL_PATH"] = os.path.join(tempfile.gettempdir(), "no-such-vosk-model")
+        try:
+            res = self.client.post("/api/transcribe/stream", json={})
+        finally:
+            if old is None:
+                os.environ.pop("VOSK_MODEL_PATH", None)
+            else:
+                os.environ["VOSK_MODEL_PATH"] = old
+        self.assertEqual(res.status_code, 400)
+        self.assertIn("model_path", res.get_json())
+
+
+class StreamRecognizer:
+    def __init__(self, model, rate):
+        self.received = b""
+
+    def AcceptWaveform(self, data):
+        self.received += data
+        return False
+
+    def PartialResult(self):
+        return json.dumps({"partial": f"{len(self.received)} bytes"})
+
+    def FinalResult(self):
+        return json.dumps({"text": f"{len(self.received)} bytes"})
+
+
+@unittest.skipIf(vosk is None, "vosk not installed")
+class TranscribeSessionTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.saved = vosk.KaldiRecognizer, app.get_vosk_model, app.STREAM_SESSION_TTL, app.transcribe_pool, os.environ.get("VOSK_MODEL_PATH")
+        vosk.KaldiRecognizer = StreamRecognizer
+        app.get_vosk_model = lambda path: object()
+        os.environ["VOSK_MODEL_PATH"] = self.tmpdir.name
+        self.client = app.app.test_client()
+
+    def tearDown(self):
+        vosk.KaldiRecognizer, app.get_vosk_model, app.STREAM_SESSION_TTL, app.transcribe_pool, path = self.saved
+        if path is None:
+            os.environ.pop("VOSK_MODEL_PATH", None)
+        else:
+            os.environ["VOSK_MODEL_PATH"] = path
+        self.tmpdir.cleanup()
+
+    def start(self):
+        return self.client.post("/api/transcribe/stream", json={}).get_json()["session"]
+
+    def test_chunks_then_end(self):
+        sid = self.start()
+        self.assertEqual(self.client.post(f"/api/transcribe/stream/{sid}", data=b"\0" * 64).get_json(), {"partial": "64 bytes"})
+        self.assertEqual(self.client.post(f"/api/transcribe/stream/{sid}/end").get_json(), {"text": "64 bytes"})
+        self.assertEqual(self.client.post(f"/api/transcribe/stream/{sid}/end").status_code, 404)
+
+    def test_any_worker_can_take_any_chunk(self):
+        sid = self.start()
+        first_worker = dict(app._stream_sessions)
+        self.client.post(f"/api/transcribe/stream/{sid}", data=b"\0" * 64)
+        # a second worker has no recognizer yet, so it builds one from the spool
+        app._stream_sessions.clear()
+        self.assertEqual(self.client.post(f"/api/transcribe/stream/{sid}", data=b"\0" * 32).get_json(), {"partial": "96 bytes"})
+        # and the first catches up on what the second was sent
+        app._stream_sessions.clear()
+        app._stream_sessions.update(first_worker)
+        self.assertEqual(self.client.post(f"/api/transcribe/stream/{sid}", data=b"\0" * 16).get_json(), {"partial": "112 bytes"})
+        app._stream_sessions.clear()
+        self.assertEqual(self.client.post(f"/api/transcribe/stream/{sid}/end").get_json(), {"text": "112 bytes"})
+        self.assertEqual(self.client.post(f"/api/transcribe/stream/{sid}", data=b"\0\0").status_code, 404)
+
+    def test_abandoned_sessions_expire_without_new_sessions(self):
+        stale = self.start()
+        time.sleep(0.2)
+        live = self.start()
+        app.STREAM_SESSION_TTL = 0.1
+        self.assertEqual(self.client.post(f"/api/transcribe/stream/{live}", data=b"\0\0").status_code, 200)
+        self.assertNotIn(stale, app._stream_sessions)
+        self.assertFalse(os.path.exists(app._spool_path(stale, ".pcm")))
+
+    def test_end_goes_through_admission(self):
+        sid = self.start()
+        app.transcribe_pool = InferencePool("transcribe", workers=1, max_queue=0)
+        app.transcribe_pool.admit()
+        try:
+            self.assertEqual(self.client.post(f"/api/transcribe/stream/{sid}/end").status_code, 503)
+        finally:
+            app.transcribe_pool.release()
+
+
+if __name__ == "__main__":
+    unittest.main()
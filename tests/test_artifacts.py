@@ -0,0 +1,158 @@
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import unittest
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import app
+import artifacts
+
+
+def model_zip(name="vosk-test", size=200_000):
+    """A zip laid out like a VOSK model: one top-level directory."""
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as z:
+        z.writestr(f"{name}/conf/mfcc.conf", "--sample-frequency=16000\n")
+        # incompressible, so the archive is big enough to cut mid-way
+        z.writestr(f"{name}/am/final.mdl", os.urandom(size), compress_type=zipfile.ZIP_STORED)
+    return buf.getvalue()
+
+
+class ArchiveHandler(BaseHTTPRequestHandler):
+    """Serves ``server.data`` with Range support; can drop the connection after ``server.cut_after`` bytes."""
+
+    def do_GET(self):
+        srv = self.server
+        data = srv.data
+        rng = self.headers.get("Range")
+        srv.ranges.append(rng)
+        start = int(rng.split("=")[1].split("-")[0]) if rng and srv.honor_range else 0
+        if start >= len(data) and rng and srv.honor_range:
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{len(data)}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = data[start:]
+        self.send_response(206 if start else 200)
+        if start:
+            self.send_header("Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if srv.cut_after is not None:
+            body, srv.cut_after = body[:srv.cut_after], None
+            self.close_connection = True
+        self.wfile.write(body)
+        srv.sent += len(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class ArtifactTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), ArchiveHandler)
+        cls.url = f"http://127.0.0.1:{cls.server.server_address[1]}/vosk-test.zip"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = self.tmpdir.name
+        self.server.data = model_zip()
+        self.server.sha256 = hashlib.sha256(self.server.data).hexdigest()
+        self.server.ranges, self.server.sent, self.server.cut_after, self.server.honor_range = [], 0, None, True
+        self._backoff, artifacts.RETRY_BACKOFF = artifacts.RETRY_BACKOFF, 0
+
+    def tearDown(self):
+        artifacts.RETRY_BACKOFF = self._backoff
+        self.tmpdir.cleanup()
+
+    def test_install_verifies_extracts_and_records(self):
+        path = artifacts.install("vosk-test", self.url, self.root, sha256=self.server.sha256)
+        self.assertEqual(path, os.path.join(self.root, "vosk-test"))
+        self.assertTrue(os.path.isfile(os.path.join(path, "conf", "mfcc.conf")))
+        entry = artifacts.load_manifest(self.root)["vosk-test"]
+        self.assertEqual((entry["sha256"], entry["size"], entry["url"]), (self.server.sha256, len(self.server.data), self.url))
+        # the archive is gone and nothing half-done is left behind
+        self.assertEqual(sorted(os.listdir(self.root)), [".downloads", "manifest.json", "vosk-test"])
+        self.assertEqual(os.listdir(os.path.join(self.root, ".downloads")), [])
+
+    def test_installed_model_is_not_fetched_again(self):
+        artifacts.install("vosk-test", self.url, self.root)
+        artifacts.install("vosk-test", self.url, self.root, sha256=self.server.sha256)
+        self.assertEqual(len(self.server.ranges), 1)
+
+    def test_dropped_connection_resumes_with_range(self):
+        self.server.cut_after = 50_000
+        artifacts.install("vosk-test", self.url, self.root, sha256=self.server.sha256)
+        self.assertEqual(self.server.ranges, [None, "bytes=50000-"])
+        self.assertEqual(self.server.sent, len(self.server.data))
+
+    def test_leftover_part_from_an_earlier_run_is_resumed(self):
+        os.makedirs(os.path.join(self.root, ".downloads"))
+        with open(os.path.join(self.root, ".downloads", "vosk-test.zip.part"), "wb") as f:
+            f.write(self.server.data[:120_000])
+        artifacts.install("vosk-test", self.url, self.root, sha256=self.server.sha256)
+        self.assertEqual(self.server.ranges, ["bytes=120000-"])
+        self.assertEqual(self.server.sent, len(self.server.data) - 120_000)
+
+        # a part that already holds everything just needs renaming
+        with open(os.path.join(self.root, ".downloads", "vosk-test.zip.part"), "wb") as f:
+            f.write(self.server.data)
+        artifacts.install("vosk-test", self.url, self.root, force=True)
+        self.assertEqual(self.server.sent, len(self.server.data) - 120_000)
+
+    def test_server_without_range_support_starts_over(self):
+        self.server.cut_after, self.server.honor_range = 50_000, False
+        artifacts.install("vosk-test", self.url, self.root, sha256=self.server.sha256)
+        self.assertEqual(self.server.sent, 50_000 + len(self.server.data))
+
+    def test_checksum_mismatch_installs_nothing(self):
+        with self.assertRaises(artifacts.ArtifactError):
+            artifacts.install("vosk-test", self.url, self.root, sha256="0" * 64)
+        self.assertFalse(os.path.exists(os.path.join(self.root, "vosk-test")))
+        self.assertEqual(artifacts.load_manifest(self.root), {})
+        self.assertEqual(os.listdir(os.path.join(self.root, ".downloads")), [])
+
+    def test_corrupt_archive_is_not_extracted_or_kept(self):
+        self.server.data = b"not a zip" * 1000
+        with self.assertRaises(artifacts.ArtifactError):
+            artifacts.install("vosk-test", self.url, self.root)
+        self.assertEqual(sorted(os.listdir(self.root)), [".downloads"])
+        self.assertEqual(os.listdir(os.path.join(self.root, ".downloads")), [])
+
+    def test_reinstall_replaces_the_model(self):
+        artifacts.install("vosk-test", self.url, self.root)
+        self.server.data = model_zip(size=1000)
+        artifacts.install("vosk-test", self.url, self.root, force=True)
+        self.assertEqual(os.path.getsize(os.path.join(self.root, "vosk-test", "am", "final.mdl")), 1000)
+        self.assertEqual(sorted(os.listdir(self.root)), [".downloads", "manifest.json", "vosk-test"])
+
+    def test_vosk_model_path_resolves_installed_names(self):
+        artifacts.install("vosk-test", self.url, self.root)
+        saved, artifacts.MODELS_DIR = artifacts.MODELS_DIR, self.root
+        old = os.environ.get("VOSK_MODEL_PATH")
+        try:
+            os.environ["VOSK_MODEL_PATH"] = "vosk-test"
+            self.assertEqual(app.vosk_model_path(), os.path.join(self.root, "vosk-test"))
+            os.environ["VOSK_MODEL_PATH"] = "elsewhere/vosk-missing"
+            self.assertEqual(app.vosk_model_path(), "elsewhere/vosk-missing")
+        finally:
+            artifacts.MODELS_DIR = saved
+            if old is None:
+                os.environ.pop("VOSK_MODEL_PATH", None)
+            else:
+                os.environ["VOSK_MODEL_PATH"] = old
+
+
+if __name__ == "__main__":
+    unittest.main()
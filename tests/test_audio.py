@@ -0,0 +1,164 @@
+import io
+import os
+import tempfile
+import unittest
+import wave
+
+import numpy as np
+
+import app
+import audio
+import metrics
+
+try:
+    import vosk
+except ImportError:
+    vosk = None
+
+
+def tone(freq, seconds, rate, amplitude=0.5):
+    t = np.arange(int(seconds * rate)) / rate
+    return (amplitude * np.sin(2 * np.pi * freq * t)).astype(np.float32)
+
+
+def make_wav(samples, rate, width=2):
+    """``samples`` is float, shaped (frames,) or (frames, channels)."""
+    samples = np.asarray(samples, dtype=np.float64)
+    if samples.ndim == 1:
+        samples = samples[:, None]
+    scale = 2 ** (8 * width - 1) - 1
+    ints = np.round(samples * scale).astype(np.int64).ravel()
+    if width == 1:
+        data = (ints + 128).astype(np.uint8).tobytes()
+    elif width == 3:
+        data = ints.astype("<i4").view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
+    else:
+        data = ints.astype(f"<i{width}").tobytes()
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wf:
+        wf.setnchannels(samples.shape[1])
+        wf.setsampwidth(width)
+        wf.setframerate(rate)
+        wf.writeframes(data)
+    return buf.getvalue()
+
+
+def level(x):
+    return float(np.sqrt(np.mean(np.square(x))))
+
+
+class AudioTests(unittest.TestCase):
+    def test_every_sample_width_decodes_to_the_same_signal(self):
+        x = tone(440, 0.05, 8000)
+        for width in (1, 2, 3, 4):
+            samples, rate, got_width = audio.read_wav(make_wav(x, 8000, width))
+            self.assertEqual((rate, got_width, samples.shape), (8000, width, (len(x), 1)))
+            np.testing.assert_allclose(samples[:, 0], x, atol=2.0 / 2 ** (8 * width - 1))
+
+    def test_stereo_is_averaged(self):
+        left, right = tone(440, 0.1, 16000), np.zeros(1600, dtype=np.float32)
+        samples, _, _ = audio.read_wav(make_wav(np.stack([left, right], axis=1), 16000))
+        np.testing.assert_allclose(audio.downmix(samples), left / 2, atol=1e-4)
+
+    def test_downsampling_keeps_speech_band_and_removes_what_would_alias(self):
+        speech = audio.resample(tone(1000, 1.0, 48000), 48000, 16000)
+        self.assertEqual(len(speech), 16000)
+        self.assertAlmostEqual(level(speech[1000:-1000]), level(tone(1000, 1.0, 16000)), delta=0.01)
+        # 12 kHz is above the new 8 kHz Nyquist; decimated unfiltered it would fold to 4 kHz
+        self.assertLess(level(audio.resample(tone(12000, 1.0, 48000), 48000, 16000)[1000:-1000]), 0.01)
+
+    def test_upsampling(self):
+        x = audio.resample(tone(440, 1.0, 8000), 8000, 16000)
+        self.assertEqual(len(x), 16000)
+        np.testing.assert_allclose(x[:8000:2], tone(440, 1.0, 8000)[:4000], atol=1e-5)
+
+    def test_silence_is_trimmed_around_the_voiced_part(self):
+        rate = 16000
+        noise = np.random.default_rng(0).normal(0, 1e-3, rate).astype(np.float32)
+        x = np.concatenate([noise, tone(300, 0.5, rate), noise])
+        start, end = audio.voiced_span(x, rate, pad_ms=100)
+        self.assertLessEqual(abs(start - (rate - rate // 10)), 480)
+        self.assertLessEqual(abs(end - (rate + rate // 2 + rate // 10)), 480)
+
+    def test_quiet_clip_is_kept_whole(self):
+        x = tone(300, 1.0, 16000, amplitude=1e-4)
+        self.assertEqual(audio.voiced_span(x, 16000), (0, len(x)))
+
+    def test_prepare_reports_what_was_removed(self):
+        x = np.concatenate([np.zeros(48000), tone(300, 1.0, 48000), np.zeros(48000)])
+        pcm, info = audio.prepare(make_wav(np.stack([x, x], axis=1), 48000), 16000)
+        self.assertEqual(info["input_rate"], 48000)
+        self.assertEqual(info["channels"], 2)
+        self.assertEqual(info["input_samples"], 3 * 48000)
+        self.assertEqual(info["input_seconds"], 3.0)
+        self.assertEqual(info["output_samples"] + info["trimmed_samples"], 3 * 16000)
+        self.assertEqual(len(pcm), 2 * info["output_samples"])
+        self.assertAlmostEqual(info["trimmed_seconds"], 1.6, delta=0.1)
+        _, untrimmed = audio.prepare(make_wav(x, 48000), 16000, trim=False)
+        self.assertEqual(untrimmed["trimmed_samples"], 0)
+
+    def test_model_sample_rate_comes_from_its_config(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            os.makedirs(os.path.join(tmp, "conf"))
+            with open(os.path.join(tmp, "conf", "mfcc.conf"), "w") as f:
+                f.write("--use-energy=false\n--sample-frequency=8000\n")
+            self.assertEqual(audio.model_sample_rate(tmp), 8000)
+            self.assertEqual(audio.model_sample_rate(os.path.join(tmp, "none")), 16000)
+
+
+class FakeRecognizer:
+    instances = []
+
+    def __init__(self, model, rate):
+        self.rate = rate
+        self.received = b""
+        FakeRecognizer.instances.append(self)
+
+    def AcceptWaveform(self, data):
+        self.received += data
+        return False
+
+    def FinalResult(self):
+        return '{"text": "hello"}'
+
+
+@unittest.skipIf(vosk is None, "vosk not installed")
+class TranscribeTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self._recognizer, self._get_model = vosk.KaldiRecognizer, app.get_vosk_model
+        self._path = os.environ.get("VOSK_MODEL_PATH")
+        vosk.KaldiRecognizer = FakeRecognizer
+        app.get_vosk_model = lambda path: object()
+        os.environ["VOSK_MODEL_PATH"] = self.tmpdir.name
+        FakeRecognizer.instances = []
+
+    def tearDown(self):
+        vosk.KaldiRecognizer, app.get_vosk_model = self._recognizer, self._get_model
+        if self._path is None:
+            os.environ.pop("VOSK_MODEL_PATH", None)
+        else:
+            os.environ["VOSK_MODEL_PATH"] = self._path
+        self.tmpdir.cleanup()
+
+    def test_recognizer_gets_trimmed_mono_audio_at_its_rate(self):
+        x = np.concatenate([np.zeros(44100), tone(300, 1.0, 44100), np.zeros(44100)])
+        wav = make_wav(np.stack([x, x], axis=1), 44100)
+        trimmed = metrics.TRIMMED_SECONDS.value()
+        res = app.app.test_client().post("/api/transcribe", data=wav, content_type="audio/wav")
+        self.assertEqual(res.status_code, 200)
+        body = res.get_json()
+        self.assertEqual(body["text"], "hello")
+        rec = FakeRecognizer.instances[-1]
+        self.assertEqual(rec.rate, 16000)
+        self.assertEqual(len(rec.received), 2 * body["audio"]["output_samples"])
+        self.assertGreater(body["audio"]["trimmed_samples"], 16000)
+        self.assertAlmostEqual(metrics.TRIMMED_SECONDS.value() - trimmed, body["audio"]["trimmed_seconds"])
+
+    def test_unreadable_audio_is_an_error(self):
+        res = app.app.test_client().post("/api/transcribe", data=b"not a wav file", content_type="audio/wav")
+        self.assertEqual(res.status_code, 500)
+
+
+if __name__ == "__main__":
+    unittest.main()
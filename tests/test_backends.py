@@ -0,0 +1,101 @@
+import os
+import tempfile
+import unittest
+
+import generate
+from apphelpers import AppTestCase
+from tiny_model import HAVE_TORCH
+
+try:
+    import onnxruntime  # noqa: F401
+
+    HAVE_ORT = HAVE_TORCH
+except Exception:
+    HAVE_ORT = False
+
+
+class BackendSelectionTests(unittest.TestCase):
+    def test_mock_backend_is_the_dry_run(self):
+        p, device = generate.init_pipeline(backend="mock")
+        self.assertEqual(device, "dry")
+        self.assertEqual(generate.backend_of(p), "mock")
+
+    def test_unknown_backend_is_an_error(self):
+        with self.assertRaises(ValueError):
+            generate.init_pipeline(backend="tflite")
+
+    def test_registry_keys_backends_apart(self):
+        key = generate.PipelineRegistry.make_key
+        self.assertNotEqual(key("m", "cpu", backend="onnx"), key("m", "cpu"))
+        self.assertEqual(key("m", "cpu", backend="transformers"), key("m", "cpu"))
+        self.assertEqual(key("m", "cpu", backend="mock"), key("m", "cpu", dry_run=True))
+
+    def test_warmup_spec_takes_a_backend(self):
+        self.assertEqual(generate.parse_warmup_spec("gpt2@cpu@@onnx"), [("gpt2", "cpu", None, "onnx")])
+
+
+@unittest.skipUnless(HAVE_ORT, "onnxruntime/torch not installed")
+class OnnxBackendTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        from tiny_model import save_model
+
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.model_dir = save_model(os.path.join(cls.tmpdir.name, "tiny"), n_embd=64)
+        cls._cache_dir = generate.ONNX_CACHE_DIR
+        generate.ONNX_CACHE_DIR = os.path.join(cls.tmpdir.name, "onnx")
+        cls.torch_p, _ = generate.init_pipeline(model=cls.model_dir)
+        cls.onnx_p, _ = generate.init_pipeline(model=cls.model_dir, backend="onnx")
+
+    @classmethod
+    def tearDownClass(cls):
+        generate.ONNX_CACHE_DIR = cls._cache_dir
+        cls.tmpdir.cleanup()
+
+    def test_greedy_output_matches_transformers(self):
+        for prompt in ("hello world the cat", ["hello", "the cat sat on the mat and"]):
+            expected = generate.generate_text(self.torch_p, prompt, max_new_tokens=8, do_sample=False)
+            self.assertEqual(generate.generate_text(self.onnx_p, prompt, max_new_tokens=8, do_sample=False), expected)
+
+    def test_seeded_sampling_matches_transformers(self):
+        kwargs = dict(max_new_tokens=6, seed=3, num_return_sequences=2)
+        expected = generate.generate_text(self.torch_p, "hello world", **kwargs)
+        self.assertEqual(generate.generate_text(self.onnx_p, "hello world", **kwargs), expected)
+
+    def test_stream_and_stop_sequences(self):
+        text = generate.generate_text(self.onnx_p, "hello world", max_new_tokens=8, do_sample=False)[0]["generated_text"]
+        streamed = "".join(generate.stream_text(self.onnx_p, "hello world", max_new_tokens=8, do_sample=False))
+        self.assertEqual(streamed, text)
+        word = text.split()[1]
+        stopped = generate.generate_text(self.onnx_p, "hello world", max_new_tokens=8, do_sample=False, stop=[word])
+        self.assertEqual(stopped[0]["generated_text"], text[: text.index(word)])
+
+    def test_export_is_cached(self):
+        exports = os.listdir(generate.ONNX_CACHE_DIR)
+        with self.assertLogs("generate", "INFO") as logs:
+            p, _ = generate.init_pipeline(model=self.model_dir, backend="onnx")
+        self.assertFalse(any("Exported" in line for line in logs.output))
+        self.assertEqual(os.listdir(generate.ONNX_CACHE_DIR), exports)
+        self.assertTrue(generate.model_id(p).endswith(":onnx"))
+
+    def test_int8_runs(self):
+        p, _ = generate.init_pipeline(model=self.model_dir, backend="onnx", dtype="int8")
+        self.assertLess(p.model.get_memory_footprint(), self.onnx_p.model.get_memory_footprint())
+        out = generate.generate_text(p, "hello world", max_new_tokens=4, min_new_tokens=4, do_sample=False)
+        self.assertTrue(out[0]["generated_text"])
+
+
+class ApiBackendTests(AppTestCase):
+    def test_unknown_backend_is_rejected(self):
+        res = self.client.post("/api/chat", json={"message": "Hello", "backend": "tflite"})
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(res.get_json()["choices"], list(generate.BACKENDS))
+
+    def test_mock_backend_answers(self):
+        res = self.client.post("/api/chat", json={"message": "Hello", "backend": "mock", "dry_run": False})
+        self.assertEqual(res.status_code, 200)
+        self.assertIn("[DRY RUN]", res.get_json()["reply"])
+
+
+if __name__ == "__main__":
+    unittest.main()
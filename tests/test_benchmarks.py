@@ -0,0 +1,62 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from common import latency_summary, percentile, run_concurrent  # noqa: E402
+from compare import compare  # noqa: E402
+
+
+class StatsTests(unittest.TestCase):
+    def test_percentile_interpolates(self):
+        samples = [4, 1, 3, 2]
+        self.assertEqual(percentile(samples, 0), 1)
+        self.assertEqual(percentile(samples, 50), 2.5)
+        self.assertEqual(percentile(samples, 100), 4)
+        self.assertIsNone(percentile([], 50))
+
+    def test_latency_summary_in_ms(self):
+        summary = latency_summary([0.001, 0.003])
+        self.assertEqual(summary["count"], 2)
+        self.assertEqual(summary["p50_ms"], 2.0)
+        self.assertEqual(summary["max_ms"], 3.0)
+
+    def test_run_concurrent_counts_errors(self):
+        def fn(c, i):
+            if i % 4 == 0:
+                raise RuntimeError("boom")
+            return i % 4 != 1
+
+        latencies, errors, wall = run_concurrent(fn, clients=3, requests=20)
+        self.assertEqual(len(latencies), 10)
+        self.assertEqual(len(errors), 10)
+        self.assertGreater(wall, 0)
+
+
+class CompareTests(unittest.TestCase):
+    def test_regressions_follow_metric_direction(self):
+        baseline = {"gen": {"tokens_per_s": 100.0, "latency": {"p99_ms": 10.0, "count": 5}}, "startup": {"median_seconds": 1.0}}
+        current = {"gen": {"tokens_per_s": 80.0, "latency": {"p99_ms": 9.0, "count": 50}}, "startup": {"median_seconds": 1.05}}
+        rows = {r["metric"]: r for r in compare(baseline, current, threshold=10)}
+
+        self.assertNotIn("gen.latency.count", rows)
+        self.assertTrue(rows["gen.tokens_per_s"]["regression"])
+        self.assertEqual(rows["gen.tokens_per_s"]["change_pct"], -20.0)
+        self.assertFalse(rows["gen.latency.p99_ms"]["regression"])
+        self.assertEqual(rows["gen.latency.p99_ms"]["change_pct"], 10.0)
+        self.assertFalse(rows["startup.median_seconds"]["regression"])
+
+    def test_memory_and_quality_metrics_are_compared(self):
+        baseline = {"int8": {"model_mb": 80.0, "top1_agreement": 0.98, "exact_match_rate": 1.0}}
+        current = {"int8": {"model_mb": 100.0, "top1_agreement": 0.97, "exact_match_rate": 0.5}}
+        rows = {r["metric"]: r["regression"] for r in compare(baseline, current, threshold=10)}
+        self.assertEqual(rows, {"int8.model_mb": True, "int8.top1_agreement": False, "int8.exact_match_rate": True})
+
+    def test_metrics_missing_from_one_run_are_skipped(self):
+        rows = compare({"a": {"p50_ms": 1.0}}, {"b": {"p50_ms": 5.0}})
+        self.assertEqual(rows, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
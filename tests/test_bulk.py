@@ -0,0 +1,80 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+
+import bulk
+import generate
+
+
+class BulkModeTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.inp = os.path.join(self.tmpdir.name, "in.jsonl")
+        self.out = os.path.join(self.tmpdir.name, "out.jsonl")
+        with open(self.inp, "w", encoding="utf-8") as f:
+            for i in range(7):
+                f.write(json.dumps({"id": f"r{i}", "prompt": f"prompt {i}"}) + "\n")
+            f.write('"bare string"\n')
+            f.write(json.dumps({"prompt": "cool", "temperature": 0.1}) + "\n")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def run_bulk(self, *extra):
+        rc = generate.main(["--dry-run", "--input-jsonl", self.inp, "--output-jsonl", self.out, "--batch-size", "3", *extra])
+        self.assertEqual(rc, 0)
+        with open(self.out, encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+
+    def test_results_in_input_order_with_overrides(self):
+        rows = self.run_bulk()
+        self.assertEqual([r["index"] for r in rows], list(range(9)))
+        self.assertEqual(rows[0]["id"], "r0")
+        self.assertTrue(rows[7]["outputs"][0].startswith("bare string [DRY RUN]"))
+        self.assertIn("temp=0.1", rows[8]["outputs"][0])
+
+    def test_resume_skips_done_and_drops_partial_line(self):
+        self.run_bulk()
+        with open(self.out, "rb") as f:
+            data = f.read()
+        # keep two complete lines and half of the third
+        lines = data.split(b"\n")
+        with open(self.out, "wb") as f:
+            f.write(lines[0] + b"\n" + lines[1] + b"\n" + lines[2][:10])
+        rows = self.run_bulk("--resume")
+        self.assertEqual([r["index"] for r in rows], list(range(9)))
+
+    def test_worker_processes_keep_order(self):
+        rows = self.run_bulk("--workers", "2")
+        self.assertEqual([r["index"] for r in rows], list(range(9)))
+
+    def test_batches_of_dead_workers_fail_instead_of_hanging(self):
+        out = io.StringIO()
+        writer = bulk.OrderedWriter(out, set())
+        batch_list = [[(i, {"prompt": f"p{i}"}, {})] for i in range(2)]
+        # an unknown backend makes each worker exit while holding its batch
+        bulk._run_workers(2, dict(backend="tflite"), None, iter(batch_list), writer)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([r["index"] for r in rows], [0, 1])
+        self.assertTrue(all("exited" in r["error"] for r in rows))
+
+        more = [[(i, {"prompt": f"p{i}"}, {})] for i in range(8)]
+        with self.assertRaises(RuntimeError):
+            bulk._run_workers(2, dict(backend="tflite"), None, iter(more), bulk.OrderedWriter(io.StringIO(), set()))
+
+    def test_all_workers_exiting_is_exit_code_2(self):
+        def crash(*args):
+            raise RuntimeError("all bulk workers exited")
+
+        saved, bulk._run_workers = bulk._run_workers, crash
+        try:
+            rc = generate.main(["--dry-run", "--input-jsonl", self.inp, "--output-jsonl", self.out, "--workers", "2"])
+        finally:
+            bulk._run_workers = saved
+        self.assertEqual(rc, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
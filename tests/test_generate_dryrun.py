@@ -41,6 +41,21 @@ class DryRunTests(unittest.TestCase):
             except Exception:
                 pass
 
+    def test_dry_run_stream(self):
+        buf = io.StringIO()
+        args = ["--dry-run", "--stream", "--prompt", "Hello"]
+        with redirect_stdout(buf):
+            rc = generate.main(args)
+        self.assertEqual(rc, 0)
+        self.assertIn("Hello [DRY RUN]", buf.getvalue())
+
+    def test_mock_pipeline_streams_in_pieces(self):
+        p = generate.make_mock_pipeline()
+        chunks = list(generate.stream_text(p, "Hello there", do_sample=False))
+        self.assertGreater(len(chunks), 1)
+        full = generate.generate_text(p, "Hello there", do_sample=False)[0]["generated_text"]
+        self.assertEqual("".join(chunks), full)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+
+from kvcache import SessionKVCache, common_prefix
+from tiny_model import HAVE_TORCH
+
+
+class HelperTests(unittest.TestCase):
+    def test_common_prefix(self):
+        self.assertEqual(common_prefix([1, 2, 3], [1, 2, 4]), 2)
+        self.assertEqual(common_prefix([], [1]), 0)
+
+
+@unittest.skipUnless(HAVE_TORCH, "torch/transformers not installed")
+class SessionKVCacheTests(unittest.TestCase):
+    def setUp(self):
+        from tiny_model import build_pipeline
+
+        self.p = build_pipeline()
+
+    def reference(self, prompt):
+        import torch
+
+        tok = self.p.tokenizer
+        ids = tok(prompt, return_tensors="pt").input_ids
+        out = self.p.model.generate(ids, attention_mask=torch.ones_like(ids), max_new_tokens=5, do_sample=False, pad_token_id=0)
+        return tok.decode(out[0, ids.shape[1]:], skip_special_tokens=True)
+
+    def test_second_turn_reuses_prefix_and_matches_full_prefill(self):
+        cache = SessionKVCache()
+        first = "user : hello world\nai :"
+        reply = cache.generate(self.p, "s1", first, max_new_tokens=5, do_sample=False)[0]["generated_text"]
+        self.assertEqual(cache.stats()["misses"], 1)
+
+        second = first + " " + reply + "\nuser : the cat sat\nai :"
+        out = cache.generate(self.p, "s1", second, max_new_tokens=5, do_sample=False)[0]["generated_text"]
+        stats = cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertGreater(stats["tokens_saved"], 0)
+        self.assertEqual(out, self.reference(second))
+
+    def test_sessions_do_not_share_entries(self):
+        cache = SessionKVCache()
+        cache.generate(self.p, "a", "hello world", max_new_tokens=3, do_sample=False)
+        cache.generate(self.p, "b", "hello world the", max_new_tokens=3, do_sample=False)
+        self.assertEqual(cache.stats()["hits"], 0)
+
+    def test_entry_larger_than_cap_is_not_kept(self):
+        cache = SessionKVCache(max_bytes=1)
+        cache.generate(self.p, "a", "hello world", max_new_tokens=3, do_sample=False)
+        self.assertEqual(cache.stats()["entries"], 0)
+
+    def test_seeded_sampling_ignores_the_global_rng(self):
+        import torch
+
+        import generate
+
+        outputs = []
+        for global_seed in (1, 2):
+            torch.manual_seed(global_seed)
+            kv = SessionKVCache().generate(self.p, "s", "hello world", max_new_tokens=6, seed=5)
+            torch.manual_seed(global_seed + 10)
+            full = generate.generate_text(self.p, "hello world", max_new_tokens=6, seed=5)
+            outputs.append((kv, full))
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertNotEqual(generate.generate_text(self.p, "hello world", max_new_tokens=6, seed=6), outputs[0][1])
+
+
+if __name__ == "__main__":
+    unittest.main()
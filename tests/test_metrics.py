@@ -0,0 +1,105 @@
+import unittest
+
+import app
+import generate
+import metrics
+from apphelpers import AppTestCase
+from tiny_model import HAVE_TORCH
+
+
+class HistogramTests(unittest.TestCase):
+    def test_render_is_cumulative_prometheus_text(self):
+        h = metrics.Histogram("t_seconds", "test", ("stage",), buckets=(0.1, 1.0))
+        h.observe(0.05, stage="a")
+        h.observe(0.5, stage="a")
+        h.observe(5.0, stage="a")
+        text = "\n".join(h.render())
+        self.assertIn("# TYPE t_seconds histogram", text)
+        self.assertIn('t_seconds_bucket{stage="a",le="0.1"} 1', text)
+        self.assertIn('t_seconds_bucket{stage="a",le="1.0"} 2', text)
+        self.assertIn('t_seconds_bucket{stage="a",le="+Inf"} 3', text)
+        self.assertIn('t_seconds_count{stage="a"} 3', text)
+        self.assertEqual(h.snapshot(stage="a")["sum"], 5.55)
+
+    def test_label_values_are_escaped(self):
+        c = metrics.Counter("c_total", "test", ("path",))
+        c.inc(path='a"b')
+        self.assertIn('c_total{path="a\\"b"} 1', c.render())
+
+
+class TimingsTests(unittest.TestCase):
+    def test_stages_reach_histogram_and_active_collector(self):
+        before = metrics.STAGE_SECONDS.snapshot(stage="unit_test")["count"]
+        with metrics.collect() as timings:
+            with metrics.stage("unit_test"):
+                pass
+            with metrics.stage("unit_test"):
+                pass
+        with metrics.stage("unit_test"):
+            pass
+        self.assertEqual(metrics.STAGE_SECONDS.snapshot(stage="unit_test")["count"], before + 3)
+        self.assertEqual(timings.stages["unit_test"][1], 2)
+        self.assertRegex(timings.server_timing(), r"^unit_test;dur=\d+\.\d$")
+
+    @unittest.skipUnless(HAVE_TORCH, "torch/transformers not installed")
+    def test_decode_timer_splits_prefill_and_decode(self):
+        from tiny_model import build_pipeline
+
+        p = build_pipeline()
+        with metrics.collect() as timings:
+            generate.generate_text(p, "hello world", max_new_tokens=6, min_new_tokens=6, do_sample=False)
+        self.assertEqual(timings.stages["prefill"][1], 1)
+        self.assertEqual(timings.stages["decode"][1], 1)
+        self.assertEqual(timings.counts["tokens"], 6)
+
+
+class MetricsEndpointTests(AppTestCase):
+    def test_metrics_endpoint_reports_chat_stages(self):
+        self.client.post("/api/chat", json={"message": "Hello"})
+        res = self.client.get("/metrics")
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.mimetype.startswith("text/plain"))
+        body = res.get_data(as_text=True)
+        self.assertIn('stage_seconds_count{stage="persist"}', body)
+        self.assertIn('stage_seconds_count{stage="generate"}', body)
+        self.assertIn('http_request_seconds_count{endpoint="chat",status="200"}', body)
+
+    def test_server_timing_header_is_optional(self):
+        res = self.client.post("/api/chat", json={"message": "Hello"})
+        self.assertNotIn("Server-Timing", res.headers)
+        app.SERVER_TIMING = True
+        try:
+            res = self.client.post("/api/chat", json={"message": "Hello"})
+        finally:
+            app.SERVER_TIMING = False
+        header = res.headers["Server-Timing"]
+        self.assertIn("persist;dur=", header)
+        self.assertIn("generate;dur=", header)
+        self.assertIn("total;dur=", header)
+
+    @unittest.skipUnless(HAVE_TORCH, "torch/transformers not installed")
+    def test_server_timing_splits_pool_generation(self):
+        import tempfile
+
+        from tiny_model import save_model
+
+        with tempfile.TemporaryDirectory() as tmp:
+            model_dir = save_model(tmp + "/tiny")
+            body = {"message": "hello", "model": model_dir, "dry_run": False, "max_new_tokens": 4, "no_sample": True}
+            saved = app.SERVER_TIMING, app.kv_cache
+            app.SERVER_TIMING = True
+            try:
+                # the session KV-cache path, then the batcher
+                headers = [self.client.post("/api/chat", json=body).headers["Server-Timing"]]
+                app.kv_cache = None
+                headers.append(self.client.post("/api/chat", json=dict(body, message="the cat")).headers["Server-Timing"])
+            finally:
+                app.SERVER_TIMING, app.kv_cache = saved
+                generate.registry.clear()
+        for header in headers:
+            self.assertIn("prefill;dur=", header)
+            self.assertIn("decode;dur=", header)
+
+
+if __name__ == "__main__":
+    unittest.main()
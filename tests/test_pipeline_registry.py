@@ -0,0 +1,61 @@
+import threading
+import time
+import unittest
+
+import generate
+
+
+class PipelineRegistryTests(unittest.TestCase):
+    def make_loader(self, delay=0.0):
+        calls = []
+
+        def loader(model, device_opt, dry_run=False, logger=None, dtype=None, backend=None, draft_model=None):
+            calls.append((model, device_opt, dtype))
+            time.sleep(delay)
+            return generate.make_mock_pipeline(), device_opt
+
+        return loader, calls
+
+    def test_hit_after_first_load(self):
+        loader, calls = self.make_loader()
+        reg = generate.PipelineRegistry(loader=loader)
+        p1, _ = reg.get(model="a")
+        p2, _ = reg.get(model="a")
+        self.assertIs(p1, p2)
+        self.assertEqual(len(calls), 1)
+        stats = reg.stats()
+        self.assertEqual(stats["loads"], 1)
+        self.assertEqual(stats["hits"], 1)
+
+    def test_lru_eviction(self):
+        loader, calls = self.make_loader()
+        reg = generate.PipelineRegistry(max_entries=2, loader=loader)
+        reg.get(model="a")
+        reg.get(model="b")
+        reg.get(model="a")  # a becomes most recent
+        reg.get(model="c")  # evicts b
+        self.assertEqual(reg.stats()["evictions"], 1)
+        reg.get(model="a")
+        self.assertEqual(len(calls), 3)
+        reg.get(model="b")
+        self.assertEqual(len(calls), 4)
+
+    def test_concurrent_first_requests_load_once(self):
+        loader, calls = self.make_loader(delay=0.05)
+        reg = generate.PipelineRegistry(loader=loader)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(reg.get(model="a")[0])) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(r is results[0] for r in results))
+
+    def test_parse_warmup_spec(self):
+        specs = generate.parse_warmup_spec("distilgpt2, gpt2@cuda@float16")
+        self.assertEqual(specs, [("distilgpt2", "cpu", None), ("gpt2", "cuda", "float16")])
+
+
+if __name__ == "__main__":
+    unittest.main()
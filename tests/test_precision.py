@@ -0,0 +1,108 @@
+import os
+import tempfile
+import unittest
+
+import generate
+import precision
+from apphelpers import AppTestCase
+from tiny_model import HAVE_TORCH
+
+
+class ResolveTests(unittest.TestCase):
+    def test_precision_names_map_to_dtypes(self):
+        self.assertEqual(precision.resolve("fp32"), "float32")
+        self.assertEqual(precision.resolve("BF16"), "bfloat16")
+        self.assertEqual(precision.resolve("int8"), "int8")
+        self.assertEqual(precision.resolve("float16"), "float16")
+        self.assertIsNone(precision.resolve(None))
+
+    def test_registry_key_treats_aliases_alike(self):
+        key = generate.PipelineRegistry.make_key
+        self.assertEqual(key("m", "cpu", "bf16"), key("m", "cpu", "bfloat16"))
+        self.assertNotEqual(key("m", "cpu", "int8"), key("m", "cpu", None))
+
+
+@unittest.skipUnless(HAVE_TORCH, "torch/transformers not installed")
+class LoadTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        from tiny_model import save_model
+
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.model_dir = save_model(os.path.join(cls.tmpdir.name, "tiny"), n_embd=64)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmpdir.cleanup()
+
+    def setUp(self):
+        self._cache_dir = generate.QUANT_CACHE_DIR
+        generate.QUANT_CACHE_DIR = None
+
+    def tearDown(self):
+        generate.QUANT_CACHE_DIR = self._cache_dir
+
+    def logits(self, p):
+        import torch
+
+        with torch.inference_mode():
+            return p.model(torch.tensor([[1, 2, 3, 4, 5]])).logits
+
+    def test_int8_is_smaller_and_generates(self):
+        fp32, _ = generate.init_pipeline(model=self.model_dir, dtype="fp32")
+        int8, _ = generate.init_pipeline(model=self.model_dir, dtype="int8")
+        self.assertLess(precision.model_nbytes(int8.model), precision.model_nbytes(fp32.model))
+        self.assertTrue(generate.model_id(int8).endswith(":int8"))
+        out = generate.generate_text(int8, "hello world", max_new_tokens=4, min_new_tokens=4, do_sample=False)
+        self.assertTrue(out[0]["generated_text"])
+
+    def test_int8_cache_round_trips(self):
+        import torch
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            generate.QUANT_CACHE_DIR = cache_dir
+            converted, _ = generate.init_pipeline(model=self.model_dir, dtype="int8")
+            path = precision.cache_path(cache_dir, self.model_dir)
+            self.assertTrue(os.path.exists(path))
+            self.assertEqual(os.listdir(cache_dir), [os.path.basename(path)])
+
+            with self.assertLogs("generate", "INFO") as logs:
+                cached, _ = generate.init_pipeline(model=self.model_dir, dtype="int8")
+            self.assertTrue(any("Loaded int8 model from" in line for line in logs.output))
+            self.assertIsNot(cached.model, converted.model)
+            self.assertTrue(torch.equal(self.logits(cached), self.logits(converted)))
+            self.assertIs(cached.model.get_output_embeddings().weight, cached.model.get_input_embeddings().weight)
+
+    def test_unreadable_cache_is_converted_again(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            generate.QUANT_CACHE_DIR = cache_dir
+            path = precision.cache_path(cache_dir, self.model_dir)
+            with open(path, "wb") as f:
+                f.write(b"not a checkpoint")
+            p, _ = generate.init_pipeline(model=self.model_dir, dtype="int8")
+            self.assertEqual(p.model.quantized_precision, "int8")
+            self.assertGreater(os.path.getsize(path), 100)
+
+    def test_bf16_loads_in_bfloat16(self):
+        import torch
+
+        p, _ = generate.init_pipeline(model=self.model_dir, dtype="bf16")
+        self.assertEqual(p.model.dtype, torch.bfloat16)
+        out = generate.generate_text(p, "hello world", max_new_tokens=3, do_sample=False)
+        self.assertTrue(out[0]["generated_text"])
+
+
+class ApiPrecisionTests(AppTestCase):
+    def test_unknown_precision_is_rejected(self):
+        for path in ("/api/chat", "/api/chat/stream"):
+            res = self.client.post(path, json={"message": "Hello", "precision": "fp8"})
+            self.assertEqual(res.status_code, 400)
+            self.assertEqual(res.get_json()["choices"], ["bf16", "fp32", "int8"])
+
+    def test_known_precision_is_accepted(self):
+        res = self.client.post("/api/chat", json={"message": "Hello", "precision": "int8"})
+        self.assertEqual(res.status_code, 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+import urllib.request
+
+import generate
+import prefork
+from tiny_model import HAVE_TORCH
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HAVE_PROC = os.path.exists("/proc/self/smaps_rollup")
+
+
+class MemoryUsageTests(unittest.TestCase):
+    @unittest.skipUnless(HAVE_PROC, "needs /proc/<pid>/smaps_rollup (Linux)")
+    def test_reports_rss_and_pss(self):
+        usage = prefork.memory_usage()
+        self.assertEqual(usage["pid"], os.getpid())
+        self.assertGreater(usage["rss_mb"], 0)
+        self.assertLessEqual(usage["pss_mb"], usage["rss_mb"])
+
+    def test_unknown_process_is_none(self):
+        self.assertIsNone(prefork.memory_usage(2 ** 30))
+
+    def test_uncached_hub_model_has_no_files(self):
+        self.assertEqual(prefork.safetensors_files("no-such-org/no-such-model"), [])
+
+
+@unittest.skipUnless(HAVE_TORCH, "torch/transformers not installed")
+class MmapWeightsTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        from tiny_model import save_model
+
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.model_dir = save_model(os.path.join(cls.tmpdir.name, "tiny"), n_embd=64)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmpdir.cleanup()
+
+    def test_mapped_model_generates_the_same(self):
+        p, _ = generate.init_pipeline(model=self.model_dir)
+        expected = generate.generate_text(p, "hello world", max_new_tokens=6, do_sample=False)
+        files = prefork.safetensors_files(self.model_dir)
+        self.assertEqual(files, [os.path.join(self.model_dir, "model.safetensors")])
+        self.assertGreater(prefork.mmap_weights(p.model, files), 0)
+        self.assertIs(p.model.get_output_embeddings().weight, p.model.get_input_embeddings().weight)
+        self.assertEqual(generate.generate_text(p, "hello world", max_new_tokens=6, do_sample=False), expected)
+
+    def test_other_precisions_keep_their_weights(self):
+        p, _ = generate.init_pipeline(model=self.model_dir, dtype="bf16")
+        self.assertEqual(prefork.mmap_weights(p.model, prefork.safetensors_files(self.model_dir)), 0)
+
+
+@unittest.skipUnless(HAVE_TORCH and hasattr(os, "fork"), "needs torch/transformers and os.fork")
+class PreforkServerTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        from tiny_model import save_model
+
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.model_dir = save_model(os.path.join(cls.tmpdir.name, "tiny"), n_embd=64)
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            cls.port = s.getsockname()[1]
+        env = dict(os.environ, PIPELINE_WARMUP=f"{cls.model_dir}@cpu", CHAT_DB=os.path.join(cls.tmpdir.name, "chat.db"), PYTHONPATH=ROOT)
+        cls.proc = subprocess.Popen(
+            [sys.executable, os.path.join(ROOT, "prefork.py"), "--workers", "2", "--host", "127.0.0.1", "--port", str(cls.port)],
+            env=env, cwd=cls.tmpdir.name, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + 120
+        while True:
+            try:
+                cls.get("/api/pipelines")
+                break
+            except OSError:
+                if cls.proc.poll() is not None or time.monotonic() > deadline:
+                    raise
+                time.sleep(0.2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.proc.terminate()
+        cls.proc.wait(timeout=30)
+        cls.tmpdir.cleanup()
+
+    @classmethod
+    def get(cls, path):
+        with urllib.request.urlopen(f"http://127.0.0.1:{cls.port}{path}", timeout=60) as res:
+            return json.load(res)
+
+    def post(self, path, body):
+        req = urllib.request.Request(f"http://127.0.0.1:{self.port}{path}", data=json.dumps(body).encode(), headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(req, timeout=60) as res:
+            return json.load(res)
+
+    def test_workers_inherit_the_preloaded_model(self):
+        stats = self.get("/api/pipelines")
+        self.assertIn([self.model_dir, "cpu", "default", "transformers", None], stats["keys"])
+        self.assertNotEqual(stats["process"]["pid"], self.proc.pid)
+        reply = self.post("/api/chat", {"message": "hello", "model": self.model_dir, "dry_run": False, "max_new_tokens": 3, "do_sample": False})
+        self.assertIn("reply", reply)
+        self.assertEqual(self.get("/api/pipelines")["loads"], 1)
+
+    def test_history_is_shared_between_workers(self):
+        for i in range(6):
+            self.post("/api/chat", {"message": f"turn {i}", "session": "shared", "model": self.model_dir, "dry_run": False, "max_new_tokens": 2})
+        history = self.get("/api/history?session=shared")["history"]
+        self.assertEqual([t["text"] for t in history if t["role"] == "user"], [f"turn {i}" for i in range(6)])
+
+
+if __name__ == "__main__":
+    unittest.main()
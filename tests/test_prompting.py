@@ -0,0 +1,99 @@
+import unittest
+
+from prompting import PromptBuilder, format_message
+from tiny_model import HAVE_TORCH
+
+
+class WordTokenizer:
+    """One token per whitespace-separated word (newlines count as words)."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, text, add_special_tokens=False):
+        self.calls += 1
+        return {"input_ids": [len(w) for w in text.replace("\n", " \n ").split(" ") if w]}
+
+
+def turns(n):
+    return [{"id": i, "role": "user" if i % 2 == 0 else "assistant", "text": f"message number {i}"} for i in range(n)]
+
+
+class PromptBuilderTests(unittest.TestCase):
+    def test_fills_budget_newest_first(self):
+        builder = PromptBuilder(WordTokenizer(), max_length=30)
+        # each message is 5 tokens ("User:" "message" "number" "N" "\n"), suffix 1
+        built = builder.build(turns(10), max_new_tokens=10)
+        self.assertEqual(built.n_messages, 3)
+        self.assertTrue(built.text.startswith("AI: message number 7"))
+        self.assertTrue(built.text.endswith("User: message number 8\nAI: message number 9\nAI:"))
+        self.assertLessEqual(len(built.ids), 20)
+
+    def test_messages_are_tokenized_once(self):
+        tok = WordTokenizer()
+        builder = PromptBuilder(tok, max_length=1000)
+        history = turns(20)
+        builder.build(history)
+        calls = tok.calls
+        builder.build(history + [{"id": 20, "role": "user", "text": "new"}])
+        self.assertEqual(tok.calls, calls + 1)
+        self.assertEqual(builder.stats()["hits"], 20)
+
+    def test_session_anchor_keeps_prefix_stable(self):
+        builder = PromptBuilder(WordTokenizer(), max_length=41)
+        history = turns(6)
+        first = builder.build(history, max_new_tokens=0, session="s")
+        self.assertEqual(first.n_messages, 6)
+        # overflow moves the window start forward past the half budget mark
+        history = turns(9)
+        second = builder.build(history, max_new_tokens=0, session="s")
+        self.assertLessEqual(len(second.ids), 21)
+        # following turns keep the same start while they fit
+        third = builder.build(turns(11), max_new_tokens=0, session="s")
+        self.assertEqual(third.text[: len(second.text) - 3], second.text[:-3])
+
+    @unittest.skipUnless(HAVE_TORCH, "torch/transformers not installed")
+    def test_ids_match_tokenizing_the_text(self):
+        from tiny_model import build_tokenizer
+
+        tok = build_tokenizer()
+        builder = PromptBuilder(tok, max_length=256)
+        history = [{"id": 0, "role": "user", "text": "hello world"}, {"id": 1, "role": "assistant", "text": "the cat sat"}]
+        built = builder.build(history, max_new_tokens=8)
+        self.assertEqual(built.text, format_message(history[0]) + format_message(history[1]) + "AI:")
+        self.assertEqual(built.ids, tok(built.text, add_special_tokens=False)["input_ids"])
+
+    @unittest.skipUnless(HAVE_TORCH, "torch/transformers not installed")
+    def test_over_budget_message_is_trimmed_in_text_too(self):
+        from tiny_model import build_tokenizer
+
+        tok = build_tokenizer()
+        builder = PromptBuilder(tok, max_length=20)
+        words = " ".join(["cat"] * 30 + ["the", "dog", "sat"])
+        built = builder.build([{"id": 0, "role": "user", "text": words}], max_new_tokens=8)
+        self.assertLessEqual(len(built.ids), 12)
+        self.assertEqual(built.text, tok.decode(built.ids[: -len(builder.suffix_ids)]) + "AI:")
+        self.assertEqual(built.text.count("cat"), len(built.ids) - 4)
+
+    @unittest.skipUnless(HAVE_TORCH, "torch/transformers not installed")
+    def test_generating_from_ids_matches_the_text(self):
+        import generate
+        from tiny_model import build_pipeline
+
+        p = build_pipeline()
+        builder = PromptBuilder(p.tokenizer, max_length=256)
+        prompts = [builder.build([{"id": 0, "role": "user", "text": text}], max_new_tokens=6) for text in ("hello world", "the cat sat on the mat")]
+        for prompt in prompts:
+            self.assertEqual(
+                generate.generate_text(p, prompt.text, input_ids=prompt.ids, max_new_tokens=6, do_sample=False),
+                generate.generate_text(p, prompt.text, max_new_tokens=6, do_sample=False),
+            )
+        # a batch is left-padded to its longest prompt
+        self.assertEqual(
+            generate.generate_text(p, [b.text for b in prompts], input_ids=[b.ids for b in prompts], batch_size=2, max_new_tokens=6, do_sample=False),
+            generate.generate_text(p, [b.text for b in prompts], batch_size=2, max_new_tokens=6, do_sample=False),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import os
+import tempfile
+import unittest
+
+import generate
+
+
+class CountingPipeline:
+    def __init__(self):
+        self.calls = 0
+        self._mock = generate.make_mock_pipeline()
+
+    def __call__(self, prompt, **kwargs):
+        self.calls += 1
+        return self._mock(prompt, **kwargs)
+
+
+class ResponseCacheTests(unittest.TestCase):
+    def test_greedy_requests_hit_the_cache(self):
+        p = CountingPipeline()
+        cache = generate.ResponseCache()
+        a = generate.generate_text(p, "Hi", do_sample=False, cache=cache)
+        b = generate.generate_text(p, "Hi", do_sample=False, cache=cache)
+        self.assertEqual(a, b)
+        self.assertEqual(p.calls, 1)
+        self.assertEqual(cache.stats()["hits"], 1)
+        # any parameter change is a different key
+        generate.generate_text(p, "Hi", do_sample=False, max_new_tokens=5, cache=cache)
+        self.assertEqual(p.calls, 2)
+
+    def test_sampled_requests_skip_unless_seeded(self):
+        p = CountingPipeline()
+        cache = generate.ResponseCache()
+        generate.generate_text(p, "Hi", cache=cache)
+        generate.generate_text(p, "Hi", cache=cache)
+        self.assertEqual(p.calls, 2)
+        self.assertEqual(cache.stats()["skipped"], 2)
+        generate.generate_text(p, "Hi", seed=7, cache=cache)
+        generate.generate_text(p, "Hi", seed=7, cache=cache)
+        self.assertEqual(p.calls, 3)
+
+    def test_returned_results_are_copies(self):
+        p = CountingPipeline()
+        cache = generate.ResponseCache()
+        a = generate.generate_text(p, "Hi", do_sample=False, cache=cache)
+        a[0]["generated_text"] = "changed"
+        b = generate.generate_text(p, "Hi", do_sample=False, cache=cache)
+        self.assertNotEqual(b[0]["generated_text"], "changed")
+
+    def test_disk_tier_survives_restart_and_evicts_by_size(self):
+        with tempfile.TemporaryDirectory() as d:
+            p = CountingPipeline()
+            generate.generate_text(p, "Hi", do_sample=False, cache=generate.ResponseCache(directory=d))
+            fresh = generate.ResponseCache(directory=d)
+            generate.generate_text(p, "Hi", do_sample=False, cache=fresh)
+            self.assertEqual(p.calls, 1)
+            self.assertEqual(fresh.stats()["disk_hits"], 1)
+
+            small = generate.ResponseCache(directory=d, max_disk_bytes=300)
+            for i in range(10):
+                generate.generate_text(p, f"prompt {i}", do_sample=False, cache=small)
+            total = sum(os.path.getsize(os.path.join(r, f)) for r, _, fs in os.walk(d) for f in fs)
+            self.assertLessEqual(total, 300)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import threading
+import unittest
+
+import generate
+import workers
+from scheduler import BatchScheduler
+from workers import InferencePool
+
+
+class BatchSchedulerTests(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+        mock = generate.make_mock_pipeline()
+
+        def runner(p, prompts, **kwargs):
+            self.calls.append(prompts)
+            return generate.generate_text(p, prompts, **kwargs)
+
+        self.pipeline = mock
+        self.runner = runner
+
+    def submit_concurrently(self, sched, jobs):
+        results = {}
+
+        def work(i, prompt, kwargs):
+            results[i] = sched.generate(self.pipeline, prompt, timeout=5, **kwargs)
+
+        threads = [threading.Thread(target=work, args=(i, prompt, kw)) for i, (prompt, kw) in enumerate(jobs)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results
+
+    def test_compatible_requests_share_a_batch(self):
+        sched = BatchScheduler(max_batch_size=4, max_wait=0.2, runner=self.runner)
+        jobs = [(f"p{i}", {"do_sample": False}) for i in range(4)]
+        results = self.submit_concurrently(sched, jobs)
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(sorted(self.calls[0]), ["p0", "p1", "p2", "p3"])
+        for i in range(4):
+            self.assertTrue(results[i][0]["generated_text"].startswith(f"p{i} [DRY RUN]"))
+        self.assertEqual(sched.stats()["largest_batch"], 4)
+
+    def test_deadlines_do_not_split_batches(self):
+        seen = []
+
+        def runner(p, prompts, **kwargs):
+            seen.append(kwargs.get("deadline"))
+            return self.runner(p, prompts, **{k: v for k, v in kwargs.items() if k != "deadline"})
+
+        sched = BatchScheduler(max_batch_size=4, max_wait=0.2, runner=runner)
+        jobs = [(f"p{i}", {"do_sample": False, "deadline": 1000.0 + i}) for i in range(3)]
+        self.submit_concurrently(sched, jobs)
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(seen, [1002.0])
+
+    def test_incompatible_parameters_run_separately(self):
+        sched = BatchScheduler(max_batch_size=4, max_wait=0.2, runner=self.runner)
+        jobs = [("a", {"temperature": 0.5}), ("b", {"temperature": 0.9}), ("c", {"temperature": 0.5})]
+        results = self.submit_concurrently(sched, jobs)
+        self.assertEqual(len(self.calls), 2)
+        self.assertIn("temp=0.5", results[0][0]["generated_text"])
+        self.assertIn("temp=0.9", results[1][0]["generated_text"])
+        self.assertIn("temp=0.5", results[2][0]["generated_text"])
+
+    def test_errors_reach_every_caller(self):
+        def boom(p, prompts, **kwargs):
+            raise RuntimeError("boom")
+
+        sched = BatchScheduler(max_batch_size=2, max_wait=0.01, runner=boom)
+        with self.assertRaises(RuntimeError):
+            sched.generate(self.pipeline, "x", timeout=5)
+
+    def test_batches_run_on_the_pool_with_its_thread_settings(self):
+        pool = InferencePool("gen-test", workers=1, max_queue=4)
+        threads, applied = [], []
+
+        def runner(p, prompts, **kwargs):
+            threads.append(threading.current_thread().name)
+            return self.runner(p, prompts, **kwargs)
+
+        saved = workers.apply_torch_threads
+        workers.apply_torch_threads = lambda: applied.append(threading.current_thread().name)
+        try:
+            sched = BatchScheduler(max_batch_size=2, max_wait=0.01, runner=runner, pool=pool)
+            sched.generate(self.pipeline, "x", timeout=5, do_sample=False)
+        finally:
+            workers.apply_torch_threads = saved
+        self.assertTrue(threads[0].startswith("gen-test"))
+        self.assertEqual(applied, threads)
+
+    def test_batches_run_concurrently_up_to_the_pool_size(self):
+        pool = InferencePool("gen-test", workers=2, max_queue=4)
+        release = threading.Event()
+
+        def runner(p, prompts, **kwargs):
+            if kwargs.get("temperature") == 0.5:
+                release.wait(5)
+            return self.runner(p, prompts, **kwargs)
+
+        sched = BatchScheduler(max_batch_size=2, max_wait=0.01, runner=runner, pool=pool)
+        slow = sched.submit(self.pipeline, "slow", temperature=0.5)
+        try:
+            # a second batch finishes while the first still holds its worker
+            fast = sched.generate(self.pipeline, "fast", timeout=5, temperature=0.9)
+            self.assertIn("temp=0.9", fast[0]["generated_text"])
+            self.assertFalse(slow.done())
+        finally:
+            release.set()
+        self.assertIn("temp=0.5", slow.result(timeout=5)[0]["generated_text"])
+
+
+if __name__ == "__main__":
+    unittest.main()
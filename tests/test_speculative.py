@@ -0,0 +1,110 @@
+import os
+import tempfile
+import unittest
+
+import app
+import generate
+import metrics
+from apphelpers import temp_store
+from tiny_model import HAVE_TORCH
+
+PROMPTS = ("hello world the cat", "the dog sat on the mat and", "what is it")
+
+
+class DraftSelectionTests(unittest.TestCase):
+    def test_registry_keys_drafts_apart(self):
+        key = generate.PipelineRegistry.make_key
+        self.assertNotEqual(key("m", "cpu", draft_model="d"), key("m", "cpu"))
+        self.assertEqual(key("m", "cpu", draft_model=""), key("m", "cpu"))
+        self.assertEqual(key("m", "cpu", dry_run=True, draft_model="d"), key("m", "cpu", dry_run=True))
+
+    def test_onnx_backend_takes_no_draft(self):
+        with self.assertRaises(ValueError):
+            generate.init_pipeline(backend="onnx", draft_model="d")
+
+    def test_report_shows_accept_rate(self):
+        timings = metrics.Timings()
+        timings.count("draft_tokens", 20)
+        timings.count("accepted", 15)
+        timings.count("target_passes", 5)
+        timings.count("spec_tokens", 20)
+        report = timings.report()
+        self.assertIn("accept rate        0.75", report)
+        self.assertIn("tokens/pass        4.00", report)
+
+
+@unittest.skipUnless(HAVE_TORCH, "torch/transformers not installed")
+class AssistedDecodingTests(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        from tiny_model import save_model
+
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.target_dir = save_model(os.path.join(cls.tmpdir.name, "target"), n_layer=4, n_embd=64)
+        cls.draft_dir = save_model(os.path.join(cls.tmpdir.name, "draft"), seed=1, n_layer=1, n_embd=32)
+        cls.plain, _ = generate.init_pipeline(model=cls.target_dir)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmpdir.cleanup()
+
+    def greedy(self, p, prompt, **kwargs):
+        return generate.generate_text(p, prompt, max_new_tokens=16, min_new_tokens=16, do_sample=False, **kwargs)[0]["generated_text"]
+
+    def test_greedy_output_matches_target_alone(self):
+        for draft in (self.draft_dir, self.target_dir):
+            p, _ = generate.init_pipeline(model=self.target_dir, draft_model=draft)
+            for prompt in PROMPTS:
+                self.assertEqual(self.greedy(p, prompt), self.greedy(self.plain, prompt))
+
+    def test_self_draft_is_accepted(self):
+        p, _ = generate.init_pipeline(model=self.target_dir, draft_model=self.target_dir)
+        with metrics.collect() as timings:
+            self.greedy(p, "hello world")
+        counts = timings.counts
+        self.assertEqual(counts["tokens"], 16)
+        self.assertEqual(counts["spec_tokens"], 16)
+        # a model drafting for itself is always right, so every pass keeps more than one token
+        self.assertEqual(counts["accepted"], counts["draft_tokens"])
+        self.assertEqual(counts["accepted"] + counts["target_passes"], 16)
+        self.assertLess(counts["target_passes"], 16)
+
+    def test_stream_and_stop_sequences(self):
+        p, _ = generate.init_pipeline(model=self.target_dir, draft_model=self.draft_dir)
+        text = generate.generate_text(self.plain, "hello world", max_new_tokens=16, do_sample=False)[0]["generated_text"]
+        streamed = "".join(generate.stream_text(p, "hello world", max_new_tokens=16, do_sample=False))
+        self.assertEqual(streamed, text)
+        word = text.split()[2]
+        self.assertEqual(self.greedy(p, "hello world", stop=[word]), text[: text.index(word)])
+
+    def test_batches_fall_back_to_the_target(self):
+        p, _ = generate.init_pipeline(model=self.target_dir, draft_model=self.draft_dir)
+        out = generate.generate_text(p, list(PROMPTS), max_new_tokens=6, do_sample=False)
+        self.assertEqual(out, generate.generate_text(self.plain, list(PROMPTS), max_new_tokens=6, do_sample=False))
+
+    def test_model_id_and_size_include_the_draft(self):
+        p, _ = generate.init_pipeline(model=self.target_dir, draft_model=self.draft_dir)
+        self.assertTrue(generate.model_id(p).endswith(f"+{self.draft_dir}"))
+        self.assertGreater(generate._pipeline_nbytes(p), generate._pipeline_nbytes(self.plain))
+
+    def test_draft_with_another_vocabulary_is_rejected(self):
+        from tiny_model import build_model
+
+        other = os.path.join(self.tmpdir.name, "other-vocab")
+        build_model(100).save_pretrained(other)
+        with self.assertRaises(ValueError):
+            generate.init_pipeline(model=self.target_dir, draft_model=other)
+
+    def test_api_takes_a_draft_model(self):
+        with temp_store():
+            res = app.app.test_client().post(
+                "/api/chat",
+                json={"message": "hello", "model": self.target_dir, "draft_model": self.draft_dir, "dry_run": False, "max_new_tokens": 4, "do_sample": False},
+            )
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(self.draft_dir, [k[-1] for k in generate.registry.stats()["keys"]])
+        self.assertIn("speculative_target_passes_total", metrics.registry.render())
+
+
+if __name__ == "__main__":
+    unittest.main()
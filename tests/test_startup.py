@@ -0,0 +1,112 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+import app
+import generate
+
+try:
+    import vosk
+except ImportError:
+    vosk = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ("torch", "transformers", "numpy", "vosk", "onnxruntime")
+
+
+def imported_after(code):
+    """Heavy modules loaded by running ``code`` in a fresh interpreter."""
+    probe = f"{code}\nimport sys, json\nprint(json.dumps([m for m in {HEAVY!r} if m in sys.modules]))"
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, CHAT_DB=os.path.join(tmp, "chat.db"), PIPELINE_WARMUP="", VOSK_WARMUP="", PYTHONPATH=ROOT)
+        out = subprocess.run([sys.executable, "-c", probe], cwd=tmp, env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+class LazyImportTests(unittest.TestCase):
+    def test_importing_the_app_loads_no_model_libraries(self):
+        self.assertEqual(imported_after("import app"), [])
+
+    def test_importing_the_app_opens_no_database(self):
+        code = "import app, json, os, threading\nprint(json.dumps([os.listdir('.'), sorted(t.name for t in threading.enumerate())]))"
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, CHAT_DB=os.path.join(tmp, "chat.db"), PIPELINE_WARMUP="", VOSK_WARMUP="", PYTHONPATH=ROOT)
+            out = subprocess.run([sys.executable, "-c", code], cwd=tmp, env=env, capture_output=True, text=True, check=True)
+        files, threads = json.loads(out.stdout.strip().splitlines()[-1])
+        self.assertEqual(files, [])
+        self.assertEqual(threads, ["MainThread"])
+
+    def test_dry_run_loads_no_model_libraries(self):
+        code = "import contextlib, io, generate\nwith contextlib.redirect_stdout(io.StringIO()): generate.main(['--dry-run', '--no-cache', '-p', 'hi'])"
+        self.assertEqual(imported_after(code), [])
+
+
+class ReadinessTests(unittest.TestCase):
+    def setUp(self):
+        self.client = app.app.test_client()
+        self.release = threading.Event()
+        self.saved = app.WARMUP_SPECS, app.VOSK_WARMUP, app.get_vosk_model, generate.registry.warm_up
+
+    def tearDown(self):
+        self.release.set()
+        app.WARMUP_SPECS, app.VOSK_WARMUP, app.get_vosk_model, generate.registry.warm_up = self.saved
+        app.start_warmup()
+
+    def slow_warm_up(self, failed=()):
+        def warm_up(specs, logger=None):
+            self.release.wait(10)
+            return list(failed)
+
+        return warm_up
+
+    def test_ready_at_once_without_warm_up(self):
+        app.WARMUP_SPECS, app.VOSK_WARMUP = [], False
+        self.assertIsNone(app.start_warmup())
+        res = self.client.get("/readyz")
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.get_json()["components"], {})
+
+    def test_health_answers_while_models_load(self):
+        app.WARMUP_SPECS = [("distilgpt2", "cpu", None)]
+        app.VOSK_WARMUP = False
+        generate.registry.warm_up = self.slow_warm_up()
+        thread = app.start_warmup()
+        t0 = time.perf_counter()
+        self.assertEqual(self.client.get("/healthz").status_code, 200)
+        self.assertLess(time.perf_counter() - t0, 0.5)
+        res = self.client.get("/readyz")
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.get_json()["components"], {"pipelines": "pending"})
+        self.release.set()
+        thread.join(5)
+        res = self.client.get("/readyz")
+        self.assertEqual(res.status_code, 200)
+        self.assertIsNotNone(res.get_json()["warmup_seconds"])
+
+    def test_failed_warm_up_is_not_ready(self):
+        app.WARMUP_SPECS = [("no-such-model", "cpu", None)]
+        app.VOSK_WARMUP = False
+        generate.registry.warm_up = self.slow_warm_up(failed=app.WARMUP_SPECS)
+        self.release.set()
+        app.start_warmup().join(5)
+        res = self.client.get("/readyz")
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.get_json()["components"]["pipelines"], "failed: no-such-model")
+
+    @unittest.skipIf(vosk is None, "vosk not installed")
+    def test_vosk_model_is_warmed(self):
+        loaded = []
+        app.WARMUP_SPECS, app.VOSK_WARMUP = [], True
+        app.get_vosk_model = loaded.append
+        app.start_warmup().join(10)
+        self.assertEqual(len(loaded), 1)
+        self.assertEqual(self.client.get("/readyz").get_json()["components"], {"vosk": "ready"})
+
+
+if __name__ == "__main__":
+    unittest.main()
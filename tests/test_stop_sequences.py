@@ -0,0 +1,82 @@
+import io
+import unittest
+from contextlib import redirect_stdout
+
+import generate
+from tiny_model import HAVE_TORCH
+
+
+class DryRunStopTests(unittest.TestCase):
+    def test_generate_text_cuts_at_stop(self):
+        p = generate.make_mock_pipeline()
+        out = generate.generate_text(p, "Hi", stop=["(seq"], num_return_sequences=2)
+        self.assertEqual(len(out), 2)
+        for item in out:
+            self.assertTrue(item["generated_text"].startswith("Hi [DRY RUN]"))
+            self.assertNotIn("(seq", item["generated_text"])
+
+    def test_chat_defaults_drop_imagined_turn(self):
+        p = generate.make_mock_pipeline()
+        out = generate.generate_text(p, ["a", "b"], stop=generate.CHAT_STOP_SEQUENCES)
+        self.assertEqual(len(out), 2)
+        self.assertTrue(all("imagined" not in r[0]["generated_text"] for r in out))
+
+    def test_stream_holds_back_partial_stop(self):
+        p = generate.make_mock_pipeline()
+        full = generate.generate_text(p, "Hi", stop=["(seq"])[0]["generated_text"]
+        chunks = list(generate.stream_text(p, "Hi", stop=["(seq"]))
+        self.assertEqual("".join(chunks), full)
+
+    def test_cli_stop_flag(self):
+        buf = io.StringIO()
+        with redirect_stdout(buf):
+            rc = generate.main(["--dry-run", "--prompt", "Hello", "--stop", "sample="])
+        self.assertEqual(rc, 0)
+        self.assertIn("Hello [DRY RUN]", buf.getvalue())
+        self.assertNotIn("sample=", buf.getvalue())
+
+
+@unittest.skipUnless(HAVE_TORCH, "torch/transformers not installed")
+class StoppingCriteriaTests(unittest.TestCase):
+    def setUp(self):
+        from tiny_model import build_pipeline
+
+        self.p = build_pipeline()
+
+    def test_stops_inside_decode_loop_per_row(self):
+        import torch
+
+        tok = self.p.tokenizer
+        base = generate.generate_text(self.p, "hello world", max_new_tokens=12, do_sample=False)[0]["generated_text"]
+        words = base.split()
+        self.assertGreater(len(words), 3)
+        stop = " ".join(words[1:3])
+
+        ids = tok(["hello world", "hello world"], return_tensors="pt").input_ids
+        criteria = generate.make_stopping_criteria(tok, [stop], prompt_length=ids.shape[1])
+        out = self.p.model.generate(ids, attention_mask=torch.ones_like(ids), max_new_tokens=12, do_sample=False, stopping_criteria=criteria, pad_token_id=0)
+        # decoding halted well before max_new_tokens
+        self.assertLess(out.shape[1] - ids.shape[1], 12)
+
+        res = generate.generate_text(self.p, ["hello world", "hello world"], max_new_tokens=12, do_sample=False, stop=[stop], batch_size=2)
+        self.assertEqual(len(res), 2)
+        for item in res:
+            text = item[0]["generated_text"]
+            self.assertNotIn(stop, text)
+            self.assertTrue(base.startswith(text))
+
+    def test_cancel_stops_a_stream(self):
+        import threading
+
+        full = "".join(generate.stream_text(self.p, "hello world", max_new_tokens=40, do_sample=False))
+        cancel = threading.Event()
+        chunks = []
+        for chunk in generate.stream_text(self.p, "hello world", max_new_tokens=40, do_sample=False, cancel=cancel):
+            chunks.append(chunk)
+            cancel.set()
+        self.assertTrue(full.startswith("".join(chunks)))
+        self.assertLess(len("".join(chunks).split()), len(full.split()) - 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+import json
+import os
+import tempfile
+import unittest
+
+from store import ConversationStore
+
+
+class ConversationStoreTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.store = ConversationStore(os.path.join(self.tmpdir.name, "chat.db"))
+
+    def tearDown(self):
+        self.store.close()
+        self.tmpdir.cleanup()
+
+    def test_last_returns_newest_turns_oldest_first(self):
+        for i in range(10):
+            self.store.append("s", "user", f"m{i}")
+        self.store.append("other", "user", "x")
+        self.assertEqual([t["text"] for t in self.store.last("s", 3)], ["m7", "m8", "m9"])
+        self.assertEqual(self.store.count("s"), 10)
+        self.assertEqual(self.store.sessions(), ["other", "s"])
+
+    def test_compact_keeps_newest_per_session(self):
+        for i in range(5):
+            self.store.append("a", "user", f"a{i}")
+            self.store.append("b", "user", f"b{i}")
+        removed = self.store.compact(max_turns=2)
+        self.assertEqual(removed, 6)
+        self.assertEqual([t["text"] for t in self.store.last("a", 10)], ["a3", "a4"])
+        self.assertEqual([t["text"] for t in self.store.last("b", 10)], ["b3", "b4"])
+
+    def test_migrate_app_and_repl_json(self):
+        app_json = os.path.join(self.tmpdir.name, "chat_state.json")
+        with open(app_json, "w", encoding="utf-8") as f:
+            json.dump({"history": [{"role": "user", "text": "hi"}, {"role": "assistant", "text": "hello"}]}, f)
+        repl_json = os.path.join(self.tmpdir.name, "conversation.json")
+        with open(repl_json, "w", encoding="utf-8") as f:
+            json.dump([{"role": "user", "text": "yo"}], f)
+
+        self.assertEqual(self.store.migrate_json(app_json, "default"), 2)
+        self.assertEqual(self.store.migrate_json(repl_json, "repl"), 1)
+        self.assertFalse(os.path.exists(app_json))
+        self.assertTrue(os.path.exists(app_json + ".migrated"))
+        # already migrated: nothing to do
+        self.assertEqual(self.store.migrate_json(app_json, "default"), 0)
+        self.assertEqual([t["text"] for t in self.store.last("default", 5)], ["hi", "hello"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+import builtins
+import contextlib
+import io
+import os
+import tempfile
+import time
+import unittest
+
+import generate
+import metrics
+from tts import NullEngine, SentenceSplitter, Speaker, make_engine
+
+
+class SentenceSplitterTests(unittest.TestCase):
+    def test_sentences_complete_as_chunks_arrive(self):
+        s = SentenceSplitter()
+        self.assertEqual(s.feed("Hello there"), [])
+        self.assertEqual(s.feed(". How"), ["Hello there."])
+        self.assertEqual(s.feed(" are you? Fine"), ["How are you?"])
+        self.assertEqual(s.flush(), ["Fine"])
+        self.assertEqual(s.flush(), [])
+
+    def test_abbreviations_decimals_and_quotes(self):
+        s = SentenceSplitter()
+        self.assertEqual(s.feed('Dr. Smith paid 3.50 today. He said "fine!" Then\nnew line'), ["Dr. Smith paid 3.50 today.", 'He said "fine!"', "Then"])
+        self.assertEqual(s.flush(), ["new line"])
+
+    def test_unknown_engine_is_an_error(self):
+        with self.assertRaises(ValueError):
+            make_engine("festival")
+
+
+class SpeakerTests(unittest.TestCase):
+    def test_each_sentence_is_spoken_once_complete(self):
+        engine = NullEngine()
+        speaker = Speaker(engine)
+        try:
+            speaker.feed("First one. Second")
+            self.assertTrue(speaker.wait(timeout=5))
+            self.assertEqual(engine.spoken, ["First one."])
+            speaker.finish()
+            self.assertTrue(speaker.wait(timeout=5))
+            self.assertEqual(engine.spoken, ["First one.", "Second"])
+        finally:
+            speaker.close()
+
+    def test_speaking_does_not_block_and_can_be_interrupted(self):
+        engine = NullEngine(seconds_per_word=0.5)
+        speaker = Speaker(engine)
+        try:
+            t0 = time.perf_counter()
+            speaker.say("One two three four. Five six.")
+            self.assertLess(time.perf_counter() - t0, 0.25)
+            deadline = time.monotonic() + 5
+            while not engine.spoken and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertTrue(speaker.busy)
+            speaker.interrupt()
+            self.assertTrue(speaker.wait(timeout=1))
+            self.assertEqual(engine.spoken, ["One two three four."])
+            self.assertEqual(engine.cut, ["One two three four."])
+            self.assertEqual(speaker.interruptions, 1)
+        finally:
+            speaker.close()
+
+    def test_wait_for_first_sentence_is_recorded(self):
+        with metrics.collect() as timings:
+            speaker = Speaker(NullEngine())
+            speaker.begin()
+            speaker.say("Hi. There.")
+            speaker.wait(timeout=5)
+            speaker.close()
+        self.assertEqual(timings.stages["first_speech"][1], 1)
+
+
+class ReplSpeechTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.engine = NullEngine()
+        self._make_engine, self._input = generate.make_engine, builtins.input
+        generate.make_engine = lambda name: self.engine
+
+    def tearDown(self):
+        generate.make_engine, builtins.input = self._make_engine, self._input
+        self.tmpdir.cleanup()
+
+    def run_repl(self, lines, *flags):
+        lines = iter(lines)
+        replies = 0
+
+        def fake_input(prompt=""):
+            nonlocal replies
+            # let the last reply be spoken before the next turn barges in
+            deadline = time.monotonic() + 5
+            while len(self.engine.spoken) < replies and time.monotonic() < deadline:
+                time.sleep(0.01)
+            line = next(lines, None)
+            if line is None:
+                raise EOFError
+            replies += bool(line)
+            return line
+
+        builtins.input = fake_input
+        argv = ["-p", "x", "--repl", "--dry-run", "--tts", "--tts-engine", "null", "--history-db", os.path.join(self.tmpdir.name, "h.db"), *flags]
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(generate.main(argv), 0)
+
+    def test_streamed_replies_are_spoken(self):
+        self.run_repl(["hello", "", "again"], "--stream")
+        self.assertEqual(len(self.engine.spoken), 2)
+        self.assertIn("[DRY RUN]", self.engine.spoken[0])
+
+    def test_finished_replies_are_spoken(self):
+        self.run_repl(["hello"])
+        self.assertEqual(len(self.engine.spoken), 1)
+        self.assertIn("[DRY RUN]", self.engine.spoken[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
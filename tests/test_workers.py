@@ -0,0 +1,90 @@
+import threading
+import time
+import unittest
+
+import app
+import generate
+from apphelpers import AppTestCase
+from tiny_model import HAVE_TORCH
+from workers import DEADLINE_GRACE, InferencePool, Overloaded
+
+
+class InferencePoolTests(unittest.TestCase):
+    def test_rejects_when_queue_is_full(self):
+        pool = InferencePool("test", workers=1, max_queue=1)
+        pool.admit()
+        pool.admit()
+        with self.assertRaises(Overloaded) as ctx:
+            pool.admit()
+        self.assertGreaterEqual(ctx.exception.retry_after, 1)
+        pool.release()
+        pool.release()
+        self.assertEqual(pool.run(lambda: 42), 42)
+        stats = pool.stats()
+        self.assertEqual((stats["admitted"], stats["rejected"], stats["in_flight"]), (3, 1, 0))
+
+    def test_wait_gives_up_at_deadline(self):
+        pool = InferencePool("test", workers=1, max_queue=4)
+        gate = threading.Event()
+        ran = []
+        blocker = pool.submit(gate.wait, 5)
+        deadline = time.monotonic() + 0.05
+        queued = pool.submit(ran.append, 1, deadline=deadline)
+        with self.assertRaises(generate.DeadlineExceeded):
+            # skip the grace period so the test does not wait for it
+            pool.wait(queued, deadline - DEADLINE_GRACE)
+        gate.set()
+        blocker.result(timeout=5)
+        # the queued job was cancelled, or found its deadline passed, so it never ran
+        time.sleep(0.05)
+        self.assertEqual(ran, [])
+        self.assertEqual(pool.stats()["timed_out"], 1)
+
+    @unittest.skipUnless(HAVE_TORCH, "torch/transformers not installed")
+    def test_deadline_stops_generation(self):
+        from tiny_model import build_pipeline
+
+        p = build_pipeline()
+        t0 = time.monotonic()
+        with self.assertRaises(generate.DeadlineExceeded):
+            generate.generate_text(p, "hello world", max_new_tokens=5000, min_new_tokens=5000, do_sample=False, deadline=time.monotonic() + 0.2)
+        self.assertLess(time.monotonic() - t0, 5)
+        with self.assertRaises(generate.DeadlineExceeded):
+            generate.generate_text(p, "hello", max_new_tokens=4, deadline=time.monotonic() - 1)
+
+
+class AdmissionApiTests(AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self._pool = app.generation_pool
+        app.generation_pool = InferencePool("generate", workers=1, max_queue=0)
+
+    def tearDown(self):
+        app.generation_pool = self._pool
+
+    def test_full_queue_returns_503_with_retry_after(self):
+        app.generation_pool.admit()
+        try:
+            res = self.client.post("/api/chat", json={"message": "Hello"})
+            stream = self.client.post("/api/chat/stream", json={"message": "Hello"})
+        finally:
+            app.generation_pool.release()
+        self.assertEqual(res.status_code, 503)
+        self.assertGreaterEqual(int(res.headers["Retry-After"]), 1)
+        self.assertEqual(stream.status_code, 503)
+        # nothing was recorded for the rejected requests
+        self.assertEqual(app.store.count("default"), 0)
+        self.assertEqual(self.client.post("/api/chat", json={"message": "Hello"}).status_code, 200)
+
+    def test_stream_releases_its_slot(self):
+        res = self.client.post("/api/chat/stream", json={"message": "Hello"})
+        self.assertIn("event: done", res.get_data(as_text=True))
+        self.assertEqual(app.generation_pool.stats()["in_flight"], 0)
+
+    def test_expired_timeout_returns_504(self):
+        res = self.client.post("/api/chat", json={"message": "Hello", "timeout": 0})
+        self.assertEqual(res.status_code, 504)
+
+
+if __name__ == "__main__":
+    unittest.main()
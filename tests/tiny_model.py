@@ -0,0 +1,54 @@
+"""Tiny random-weight GPT-2 pipelines built locally, so tests never hit the network."""
+try:
+    import torch  # noqa: F401
+    import transformers  # noqa: F401
+    import tokenizers  # noqa: F401
+
+    HAVE_TORCH = True
+except Exception:
+    HAVE_TORCH = False
+
+WORDS = "hello world the a cat dog sat on mat user ai : . , is was and it to of in you i what how".split()
+
+
+def build_tokenizer():
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers
+    from transformers import PreTrainedTokenizerFast
+
+    vocab = {"<eos>": 0}
+    for w in WORDS:
+        vocab.setdefault(w, len(vocab))
+    tok = Tokenizer(models.WordLevel(vocab=vocab, unk_token="<eos>"))
+    tok.pre_tokenizer = pre_tokenizers.WhitespaceSplit()
+    tok.decoder = decoders.WordPiece(prefix="##")
+    return PreTrainedTokenizerFast(tokenizer_object=tok, eos_token="<eos>", pad_token="<eos>")
+
+
+def build_model(vocab_size, seed=0, n_layer=2, n_embd=32):
+    import torch
+    from transformers import GPT2Config, GPT2LMHeadModel
+
+    torch.manual_seed(seed)
+    config = GPT2Config(vocab_size=vocab_size, n_positions=256, n_embd=n_embd, n_layer=n_layer, n_head=2, bos_token_id=0, eos_token_id=0)
+    return GPT2LMHeadModel(config).eval()
+
+
+def build_pipeline(seed=0, n_layer=2, n_embd=32):
+    from transformers import pipeline
+
+    import generate
+
+    tokenizer = build_tokenizer()
+    model = build_model(len(tokenizer), seed=seed, n_layer=n_layer, n_embd=n_embd)
+    p = pipeline("text-generation", model=model, tokenizer=tokenizer, device=-1)
+    generate.prepare_tokenizer(p)
+    return p
+
+
+def save_model(directory, seed=0, n_layer=2, n_embd=32):
+    """Save a tiny model and its tokenizer to ``directory``, loadable by name like a hub model."""
+    tokenizer = build_tokenizer()
+    build_model(len(tokenizer), seed=seed, n_layer=n_layer, n_embd=n_embd).save_pretrained(directory)
+    tokenizer.save_pretrained(directory)
+    return directory
+
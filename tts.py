@@ -0,0 +1,202 @@
+"""Background text-to-speech for the REPL, spoken a sentence at a time.
+
+``Speaker`` owns a thread and a queue of sentences. Text goes in as it is
+produced (``feed`` for streamed chunks, ``say`` for a finished reply), and
+each sentence is queued as soon as its end is seen. Speech therefore starts
+after the first sentence rather than after the whole reply, and the REPL
+never waits for it. ``interrupt`` drops whatever is queued and cuts off the
+sentence being spoken (barge-in).
+
+Engines have ``speak(text)``, which blocks on the speaker thread, and
+``stop()``, callable from any thread:
+
+- ``pyttsx3``: the system voice, via pyttsx3
+- ``null``: speaks nothing and records what it was asked to say, for
+  headless runs and tests
+"""
+import contextvars
+import logging
+import queue
+import re
+import threading
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+TTS_ENGINES = ("pyttsx3", "null")
+
+# end punctuation (and any closing quotes/brackets) followed by whitespace, or a line break
+_BOUNDARY = re.compile(r"""[.!?]+["')\]]*(?=\s)|\n""")
+# words whose trailing period does not end a sentence
+ABBREVIATIONS = {"mr.", "mrs.", "ms.", "dr.", "prof.", "st.", "vs.", "etc.", "e.g.", "i.e."}
+
+
+class SentenceSplitter:
+    """Cut a stream of text chunks into sentences as soon as each one is complete."""
+
+    def __init__(self):
+        self._buf = ""
+
+    def feed(self, text):
+        """Add ``text``; return the sentences it completed."""
+        self._buf += text
+        sentences = []
+        start = 0
+        for m in _BOUNDARY.finditer(self._buf):
+            sentence = self._buf[start:m.end()].strip()
+            words = sentence.split()
+            if m.group() != "\n" and words and words[-1].lower() in ABBREVIATIONS:
+                continue
+            if sentence:
+                sentences.append(sentence)
+            start = m.end()
+        self._buf = self._buf[start:]
+        return sentences
+
+    def flush(self):
+        """Return whatever is left as a final sentence (a list of zero or one)."""
+        rest, self._buf = self._buf.strip(), ""
+        return [rest] if rest else []
+
+
+class NullEngine:
+    """Speaks nothing. Records each sentence in ``spoken`` and, with ``seconds_per_word``, takes that long per word."""
+
+    def __init__(self, seconds_per_word=0.0):
+        self.seconds_per_word = seconds_per_word
+        self.spoken = []
+        self.cut = []
+        self._stop = threading.Event()
+
+    def speak(self, text):
+        self._stop.clear()
+        self.spoken.append(text)
+        if self._stop.wait(self.seconds_per_word * len(text.split())):
+            self.cut.append(text)
+
+    def stop(self):
+        self._stop.set()
+
+
+class Pyttsx3Engine:
+    """The system voice through pyttsx3."""
+
+    def __init__(self):
+        import pyttsx3  # fail here, not on the speaker thread, when it is missing
+
+        self._pyttsx3 = pyttsx3
+        self._engine = None
+
+    def speak(self, text):
+        if self._engine is None:
+            # pyttsx3 engines belong to the thread that runs them
+            self._engine = self._pyttsx3.init()
+        self._engine.say(text)
+        self._engine.runAndWait()
+
+    def stop(self):
+        if self._engine is not None:
+            self._engine.stop()
+
+
+def make_engine(name="pyttsx3"):
+    if name == "pyttsx3":
+        return Pyttsx3Engine()
+    if name == "null":
+        return NullEngine()
+    raise ValueError(f"unknown TTS engine {name!r}; choose from {', '.join(TTS_ENGINES)}")
+
+
+class Speaker:
+    """Speaks queued sentences on a background thread.
+
+    The time from ``begin`` to the start of the reply's first sentence is
+    recorded as the ``first_speech`` stage: the wait a listener perceives.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.spoken = 0
+        self.interruptions = 0
+        self._queue = queue.Queue()
+        self._splitter = SentenceSplitter()
+        self._lock = threading.Lock()
+        # bumped by interrupt(); queued sentences from an older epoch are dropped
+        self._epoch = 0
+        self._started = None
+        # run in a copy of this context so first_speech reaches the caller's collector
+        self._thread = threading.Thread(target=contextvars.copy_context().run, args=(self._run,), name="tts", daemon=True)
+        self._thread.start()
+
+    @property
+    def busy(self):
+        """True while sentences are queued or being spoken."""
+        return self._queue.unfinished_tasks > 0
+
+    def begin(self):
+        """Mark the start of a reply (when the user's turn was submitted)."""
+        with self._lock:
+            self._started = time.perf_counter()
+
+    def feed(self, text):
+        """Queue the sentences ``text`` completes; the rest waits for more text or ``finish``."""
+        for sentence in self._splitter.feed(text):
+            self._put(sentence)
+
+    def finish(self):
+        """Queue what is left of the reply."""
+        for sentence in self._splitter.flush():
+            self._put(sentence)
+
+    def say(self, text):
+        """Queue a finished reply, a sentence at a time."""
+        self.feed(text)
+        self.finish()
+
+    def interrupt(self):
+        """Stop speaking and drop everything queued."""
+        with self._lock:
+            self._epoch += 1
+            self._started = None
+            self._splitter = SentenceSplitter()
+        if self.busy:
+            self.interruptions += 1
+        self.engine.stop()
+
+    def wait(self, timeout=None):
+        """Block until everything queued has been spoken; returns False on timeout."""
+        with self._queue.all_tasks_done:
+            return self._queue.all_tasks_done.wait_for(lambda: not self._queue.unfinished_tasks, timeout)
+
+    def close(self):
+        """Stop speaking and end the speaker thread."""
+        self.interrupt()
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+    def _put(self, sentence):
+        with self._lock:
+            self._queue.put((self._epoch, sentence))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                epoch, sentence = item
+                with self._lock:
+                    if epoch != self._epoch:
+                        continue
+                    started, self._started = self._started, None
+                if started is not None:
+                    metrics.observe_stage("first_speech", time.perf_counter() - started)
+                try:
+                    self.engine.speak(sentence)
+                    self.spoken += 1
+                except Exception:
+                    logger.warning("TTS engine failed to speak", exc_info=True)
+            finally:
+                self._queue.task_done()
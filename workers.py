@@ -0,0 +1,176 @@
+"""Bounded inference pools with admission control and per-request deadlines.
+
+Each ``InferencePool`` runs work on a fixed number of threads and admits at
+most ``workers + max_queue`` requests at a time; beyond that ``admit``
+raises ``Overloaded`` straight away, carrying a ``retry_after`` estimate,
+instead of letting every request slow down together. Admission is separate
+from execution so a request can hold its slot across steps that run
+elsewhere (prompt building, the batch scheduler, a streamed response).
+``wait`` gives up at the request's deadline with ``generate.DeadlineExceeded``;
+work that has not started by then is dropped, and generation that has is
+stopped by the deadline stopping criterion in ``generate.generate_text``.
+"""
+import contextvars
+import logging
+import math
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+
+from generate import DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+# how long past its deadline a caller waits for a running job to notice and stop
+DEADLINE_GRACE = 2.0
+
+
+class Overloaded(Exception):
+    """The pool's queue is full; retry after ``retry_after`` seconds."""
+
+    def __init__(self, pool, retry_after):
+        super().__init__(f"{pool} queue is full")
+        self.retry_after = retry_after
+
+
+class InferencePool:
+    """A fixed-size thread pool that rejects work once ``max_queue`` requests are waiting."""
+
+    def __init__(self, name, workers=1, max_queue=8):
+        self.name = name
+        self.workers = max(1, int(workers))
+        self.max_queue = max(0, int(max_queue))
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._service_time = None
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def admit(self):
+        """Take a queue slot for one request, or raise ``Overloaded`` when none is free.
+
+        Every successful ``admit`` must be paired with a ``release``; prefer
+        ``admission()``, which does both.
+        """
+        with self._lock:
+            if self._in_flight >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise Overloaded(self.name, self._retry_after_locked())
+            self._in_flight += 1
+            self.admitted += 1
+
+    def release(self, elapsed=None):
+        """Free a slot taken by ``admit``; ``elapsed`` feeds the ``Retry-After`` estimate."""
+        with self._lock:
+            self._in_flight -= 1
+            if elapsed is not None:
+                # exponentially weighted mean of how long one request holds its slot
+                self._service_time = elapsed if self._service_time is None else 0.8 * self._service_time + 0.2 * elapsed
+
+    @property
+    def in_flight(self):
+        """Requests currently holding a slot."""
+        with self._lock:
+            return self._in_flight
+
+    def _retry_after_locked(self):
+        per_job = self._service_time or 1.0
+        waves = self._in_flight / float(self.workers)
+        return int(min(60, max(1, math.ceil(per_job * waves))))
+
+    @contextmanager
+    def admission(self):
+        """Hold a queue slot for the duration of the block."""
+        self.admit()
+        t0 = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - t0)
+
+    def submit(self, fn, *args, deadline=None, **kwargs):
+        """Run ``fn(*args, **kwargs)`` on a pool thread and return its ``Future``.
+
+        This does not take a queue slot; callers are expected to hold one.
+        ``fn`` runs in a copy of the caller's context, so the stages it times
+        reach the caller's ``metrics`` collector.
+        """
+        ctx = contextvars.copy_context()
+
+        def job():
+            if deadline is not None and time.monotonic() >= deadline:
+                raise DeadlineExceeded("deadline passed while queued")
+            apply_torch_threads()
+            return ctx.run(fn, *args, **kwargs)
+
+        return self._executor.submit(job)
+
+    def wait(self, future, deadline=None):
+        """Return ``future``'s result, raising ``DeadlineExceeded`` once ``deadline`` has passed."""
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic()) + DEADLINE_GRACE
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeout:
+            future.cancel()
+            with self._lock:
+                self.timed_out += 1
+            raise DeadlineExceeded(f"{self.name} request exceeded its deadline")
+
+    def run(self, fn, *args, deadline=None, **kwargs):
+        """Admit, run ``fn`` on the pool and wait for it until ``deadline`` (a ``time.monotonic()`` value)."""
+        with self.admission():
+            return self.wait(self.submit(fn, *args, deadline=deadline, **kwargs), deadline)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "in_flight": self._in_flight,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "mean_service_seconds": round(self._service_time, 4) if self._service_time is not None else None,
+            }
+
+
+_torch_threads = None
+_torch_threads_applied = False
+
+
+def torch_threads_for(compute_workers, reserved=0):
+    """Intra-op threads per worker so ``compute_workers`` generations share the CPUs.
+
+    ``reserved`` cores are left for other work (e.g. one per transcription worker).
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    return max(1, (cpus - reserved) // max(1, compute_workers))
+
+
+def set_torch_threads(n):
+    """Use ``n`` intra-op threads in torch once it has been imported (0 leaves torch's default)."""
+    global _torch_threads, _torch_threads_applied
+    _torch_threads = int(n) if n else None
+    _torch_threads_applied = False
+    apply_torch_threads()
+
+
+def apply_torch_threads():
+    # torch is imported lazily with the first real model, so apply on first use
+    global _torch_threads_applied
+    if _torch_threads is None or _torch_threads_applied:
+        return
+    torch = sys.modules.get("torch")
+    if torch is None:
+        return
+    torch.set_num_threads(_torch_threads)
+    _torch_threads_applied = True
+    logger.info("Using %d torch intra-op threads", _torch_threads)